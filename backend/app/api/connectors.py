@@ -1,15 +1,17 @@
+from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException
-from datetime import datetime, timezone
+from uuid import uuid4
 from pydantic import BaseModel
-import requests
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.api.deps import get_current_user, require_roles
-from app.core.config import settings
-from app.models.models import Integration, IntegrationType, StripeMetric
+from app.models.models import Integration, IntegrationType, StripeMetric, SyncRun
 from app.models.models import utcnow
 from app.integrations.shopify import test_connection
-from app.worker import sync_shopify_data
+from app.services.stripe_jobs import queue_stripe_job
+from app.services.stripe_metrics import margin_by_day, metrics_query
+from app.services.sync_runs import finish_sync_run
+from app.worker import celery, stripe_sync_job, sync_shopify_data
 
 router = APIRouter(prefix="/connectors", tags=["connectors"])
 
@@ -107,51 +109,23 @@ def shopify_settings(
     return {"status": "saved"}
 
 
-@router.post("/stripe/sync-revenue")
+def _queue_stripe_job(db: Session, company_id: int, kind: str, params: dict | None = None) -> dict:
+    task_id = str(uuid4())
+    run = queue_stripe_job(db, company_id, kind, task_id)
+    try:
+        stripe_sync_job.apply_async((run.id, kind, params or {}), task_id=task_id)
+    except Exception as exc:
+        finish_sync_run(db, run.id, "failed", run.counts, f"Could not queue job: {exc}")
+        raise HTTPException(status_code=503, detail="Stripe sync could not be queued") from exc
+    return {"job_id": run.id, "status": run.status}
+
+
+@router.post("/stripe/sync-revenue", status_code=202)
 def stripe_sync_revenue(
     db: Session = Depends(get_db),
     user=Depends(require_roles(["Founder", "Finance"])),
 ):
-    integration = db.query(Integration).filter(
-        Integration.company_id == user.company_id,
-        Integration.type == IntegrationType.stripe,
-    ).first()
-    credentials = integration.credentials if integration else {}
-
-    try:
-        response = requests.post(
-            f"{settings.stripe_api_base.rstrip('/')}/sync/revenue",
-            json={
-                "stripe_account": credentials.get("stripe_account"),
-                "publishable_key": credentials.get("publishable_key"),
-                "secret_key": credentials.get("secret_key"),
-            },
-            timeout=60,
-        )
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        detail = getattr(exc.response, "text", "") if getattr(exc, "response", None) else str(exc)
-        raise HTTPException(status_code=502, detail=f"Stripe sync failed: {detail}") from exc
-
-    integration = db.query(Integration).filter(
-        Integration.company_id == user.company_id,
-        Integration.type == IntegrationType.stripe,
-    ).first()
-    if not integration:
-        integration = Integration(
-            company_id=user.company_id,
-            type=IntegrationType.stripe,
-            status="connected",
-            credentials={},
-            last_sync_at=utcnow(),
-        )
-        db.add(integration)
-    else:
-        integration.status = "connected"
-        integration.last_sync_at = utcnow()
-    db.commit()
-
-    return response.json()
+    return _queue_stripe_job(db, user.company_id, "revenue")
 
 
 @router.get("/stripe/settings")
@@ -211,127 +185,74 @@ def stripe_save_settings(
     }
 
 
-@router.post("/stripe/balance-payouts")
+@router.post("/stripe/balance-payouts", status_code=202)
 def stripe_balance_payouts(
     payload: StripeDateRangeRequest,
     db: Session = Depends(get_db),
     user=Depends(require_roles(["Founder", "Finance"])),
 ):
-    integration = db.query(Integration).filter(
-        Integration.company_id == user.company_id,
-        Integration.type == IntegrationType.stripe,
-    ).first()
-    credentials = integration.credentials if integration else {}
-
-    try:
-        response = requests.post(
-            f"{settings.stripe_api_base.rstrip('/')}/sync/balance-payouts",
-            json={
-                "stripe_account": credentials.get("stripe_account"),
-                "publishable_key": credentials.get("publishable_key"),
-                "secret_key": credentials.get("secret_key"),
-                "start_date": payload.start_date,
-                "end_date": payload.end_date,
-            },
-            timeout=60,
-        )
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        detail = getattr(exc.response, "text", "") if getattr(exc, "response", None) else str(exc)
-        raise HTTPException(status_code=502, detail=f"Stripe balance sync failed: {detail}") from exc
-
-    if integration:
-        integration.last_sync_at = utcnow()
-        db.commit()
+    return _queue_stripe_job(db, user.company_id, "balance_payouts", payload.model_dump())
 
-    return response.json()
 
-
-@router.post("/stripe/metrics/true-net-margin")
+@router.post("/stripe/metrics/true-net-margin", status_code=202)
 def stripe_true_net_margin(
     payload: StripeDateRangeRequest,
     db: Session = Depends(get_db),
     user=Depends(require_roles(["Founder", "Finance"])),
 ):
-    integration = db.query(Integration).filter(
-        Integration.company_id == user.company_id,
-        Integration.type == IntegrationType.stripe,
-    ).first()
-    credentials = integration.credentials if integration else {}
-
-    try:
-        response = requests.post(
-            f"{settings.stripe_api_base.rstrip('/')}/metrics/true-net-margin",
-            json={
-                "stripe_account": credentials.get("stripe_account"),
-                "publishable_key": credentials.get("publishable_key"),
-                "secret_key": credentials.get("secret_key"),
-                "start_date": payload.start_date,
-                "end_date": payload.end_date,
-                "limit": payload.limit,
-            },
-            timeout=60,
-        )
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        detail = getattr(exc.response, "text", "") if getattr(exc, "response", None) else str(exc)
-        raise HTTPException(status_code=502, detail=f"Stripe metrics sync failed: {detail}") from exc
-
-    if integration:
-        integration.last_sync_at = utcnow()
-        db.commit()
-
-    return response.json()
+    return _queue_stripe_job(db, user.company_id, "true_net_margin", payload.model_dump())
 
 
-@router.post("/stripe/metrics/true-net-margin/store")
+@router.post("/stripe/metrics/true-net-margin/store", status_code=202)
 def stripe_store_true_net_margin(
     payload: StripeDateRangeRequest,
     db: Session = Depends(get_db),
     user=Depends(require_roles(["Founder", "Finance"])),
 ):
-    integration = db.query(Integration).filter(
-        Integration.company_id == user.company_id,
-        Integration.type == IntegrationType.stripe,
-    ).first()
-    credentials = integration.credentials if integration else {}
+    return _queue_stripe_job(db, user.company_id, "store_true_net_margin", payload.model_dump())
+
+
+JOB_RESULT_GRACE_SECONDS = 60
 
-    try:
-        response = requests.post(
-            f"{settings.stripe_api_base.rstrip('/')}/metrics/true-net-margin",
-            json={
-                "stripe_account": credentials.get("stripe_account"),
-                "publishable_key": credentials.get("publishable_key"),
-                "secret_key": credentials.get("secret_key"),
-                "start_date": payload.start_date,
-                "end_date": payload.end_date,
-                "limit": payload.limit,
-            },
-            timeout=60,
-        )
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        detail = getattr(exc.response, "text", "") if getattr(exc, "response", None) else str(exc)
-        raise HTTPException(status_code=502, detail=f"Stripe metrics sync failed: {detail}") from exc
-
-    payload_json = response.json()
-    items = payload_json.get("items", [])
-    metric_rows = [
-        StripeMetric(
-            company_id=user.company_id,
-            metric_type="true_net_margin",
-            payload=item,
-            created_at=utcnow(),
-        )
-        for item in items
-    ]
-    if metric_rows:
-        db.bulk_save_objects(metric_rows)
-    if integration:
-        integration.last_sync_at = utcnow()
-    db.commit()
 
-    return {"stored": len(metric_rows), "count": len(items)}
+def _within_result_grace(ended_at: datetime | None) -> bool:
+    if ended_at is None:
+        return True
+    if ended_at.tzinfo is None:
+        ended_at = ended_at.replace(tzinfo=timezone.utc)
+    return utcnow() - ended_at < timedelta(seconds=JOB_RESULT_GRACE_SECONDS)
+
+
+@router.get("/jobs/{job_id}")
+def connector_job_status(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(require_roles(["Founder", "Finance"])),
+):
+    run = db.query(SyncRun).filter(SyncRun.id == job_id, SyncRun.company_id == user.company_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Job not found")
+    response = {
+        "job_id": run.id,
+        "provider": run.provider,
+        "environment": run.environment,
+        "status": run.status,
+        "started_at": run.started_at,
+        "ended_at": run.ended_at,
+        "counts": run.counts or {},
+        "error": run.error_summary,
+    }
+    if run.status == "success" and run.trace_id:
+        # The payload lives in the Celery result backend until it expires.
+        result = celery.AsyncResult(run.trace_id)
+        if result.successful():
+            response["result"] = result.result
+        elif _within_result_grace(run.ended_at):
+            # The task commits the run as finished just before Celery stores its return value.
+            response["status"] = "running"
+        else:
+            response["result"] = None
+    return response
 
 
 @router.get("/stripe/metrics/true-net-margin")
@@ -342,18 +263,26 @@ def list_true_net_margin(
     db: Session = Depends(get_db),
     user=Depends(require_roles(["Founder", "Finance"])),
 ):
-    query = db.query(StripeMetric).filter(
-        StripeMetric.company_id == user.company_id,
-        StripeMetric.metric_type == "true_net_margin",
+    rows = (
+        metrics_query(db, user.company_id, start_date, end_date)
+        .order_by(StripeMetric.txn_date.desc(), StripeMetric.id.desc())
+        .limit(limit)
+        .all()
     )
-    if start_date:
-        query = query.filter(StripeMetric.created_at >= datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc))
-    if end_date:
-        query = query.filter(StripeMetric.created_at <= datetime.fromisoformat(end_date).replace(tzinfo=timezone.utc))
-    rows = query.order_by(StripeMetric.created_at.desc()).limit(limit).all()
     return {"items": [row.payload for row in rows], "count": len(rows)}
 
 
+@router.get("/stripe/metrics/true-net-margin/daily")
+def daily_true_net_margin(
+    start_date: str | None = None,
+    end_date: str | None = None,
+    db: Session = Depends(get_db),
+    user=Depends(require_roles(["Founder", "Finance"])),
+):
+    items = margin_by_day(db, user.company_id, start_date, end_date)
+    return {"items": items, "count": len(items)}
+
+
 @router.delete("/stripe/metrics/true-net-margin")
 def clear_true_net_margin(
     start_date: str | None = None,
@@ -361,14 +290,6 @@ def clear_true_net_margin(
     db: Session = Depends(get_db),
     user=Depends(require_roles(["Founder", "Finance"])),
 ):
-    query = db.query(StripeMetric).filter(
-        StripeMetric.company_id == user.company_id,
-        StripeMetric.metric_type == "true_net_margin",
-    )
-    if start_date:
-        query = query.filter(StripeMetric.created_at >= datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc))
-    if end_date:
-        query = query.filter(StripeMetric.created_at <= datetime.fromisoformat(end_date).replace(tzinfo=timezone.utc))
-    deleted = query.delete(synchronize_session=False)
+    deleted = metrics_query(db, user.company_id, start_date, end_date).delete(synchronize_session=False)
     db.commit()
     return {"deleted": deleted}
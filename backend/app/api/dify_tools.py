@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Literal
 
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
@@ -55,10 +56,12 @@ def dify_payables(
 def dify_search_documents(
     query: str = Query(..., min_length=2),
     limit: int = Query(5, ge=1, le=20),
+    mode: Literal["vector", "hybrid"] | None = Query(None),
+    prefilter: bool = Query(False, description="Only rank chunks that share a term with the query"),
     db: Session = Depends(get_db),
     user=Depends(get_current_user),
 ):
-    results = search_document_chunks(db, user.company_id, query, limit=limit)
+    results = search_document_chunks(db, user.company_id, query, limit=limit, mode=mode, prefilter=prefilter)
     return {
         "query": query,
         "results": results,
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.api.deps import get_current_user
 from app.services.imports import import_bank_csv, import_payables_csv, import_po_csv
+from app.services.documents import bump_document_version, document_progress
 from app.core.config import settings
 from app.models.models import Document, DocumentChunk
 from app.worker import process_document, reindex_documents
@@ -71,6 +72,7 @@ async def upload_document(
     db.add(document)
     db.commit()
     db.refresh(document)
+    bump_document_version(user.company_id)
     process_document.delay(document.id)
     return {"status": "queued", "document_id": document.id}
 
@@ -78,13 +80,14 @@ async def upload_document(
 @router.get("/docs")
 def list_documents(db: Session = Depends(get_db), user=Depends(get_current_user)):
     documents = db.query(Document).filter(Document.company_id == user.company_id).order_by(Document.uploaded_at.desc()).all()
+    progress = document_progress([doc.id for doc in documents if doc.status in {"parsing", "embedding"}])
     return [
         {
             "id": doc.id,
             "filename": doc.filename,
             "file_type": doc.file_type,
             "status": doc.status,
-            "indexed_chunks": doc.indexed_chunks,
+            "indexed_chunks": progress.get(doc.id, doc.indexed_chunks),
             "indexed_at": doc.indexed_at.isoformat() if doc.indexed_at else None,
             "error_message": doc.error_message,
             "uploaded_at": doc.uploaded_at.isoformat(),
@@ -111,6 +114,7 @@ def delete_document(document_id: int, db: Session = Depends(get_db), user=Depend
     ).delete()
     db.delete(document)
     db.commit()
+    bump_document_version(user.company_id)
     if storage_path.exists():
         storage_path.unlink()
     return {"status": "deleted"}
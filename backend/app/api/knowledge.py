@@ -1,11 +1,11 @@
 import re
-from typing import Any
+from typing import Any, Literal
 from fastapi import APIRouter, Depends, Header, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.core.database import get_db
-from app.services.documents import search_document_chunks
+from app.services.documents import SearchFilters, metadata_filter, search_document_chunks
 
 
 router = APIRouter(tags=["knowledge"])
@@ -14,6 +14,8 @@ router = APIRouter(tags=["knowledge"])
 class RetrievalSetting(BaseModel):
     top_k: int = 3
     score_threshold: float | None = None
+    search_mode: Literal["vector", "hybrid"] | None = None
+    lexical_prefilter: bool = False
 
 
 class MetadataCondition(BaseModel):
@@ -44,27 +46,28 @@ def _score_from_distance(distance: float) -> float:
     return max(0.0, min(1.0, 1.0 - (distance / 2.0)))
 
 
-def _match_metadata(record: dict, conditions: list[dict[str, Any]] | None) -> bool:
-    if not conditions:
-        return True
-    for condition in conditions:
-        name = str(condition.get("name") or "").lower()
-        value = str(condition.get("value") or "")
-        comparison = str(condition.get("comparison_operator") or "").lower()
-        record_value = ""
-        if name in {"file_type", "filetype"}:
-            record_value = str(record.get("file_type") or "")
-        elif name in {"filename", "file_name"}:
-            record_value = str(record.get("filename") or "")
-        elif name in {"document_id", "doc_id"}:
-            record_value = str(record.get("document_id") or "")
-        if not record_value:
-            continue
-        if comparison in {"equals", "eq"} and record_value != value:
-            return False
-        if comparison in {"contains", "in"} and value not in record_value:
-            return False
-    return True
+def _score_from_match(match: dict) -> float:
+    # Hybrid results are ordered by rank fusion, but a chunk may come from only one side;
+    # report whichever similarity it has, both already on a 0..1 scale.
+    scores = []
+    if match.get("distance") is not None:
+        scores.append(_score_from_distance(float(match["distance"])))
+    if match.get("text_rank") is not None:
+        scores.append(float(match["text_rank"]))
+    return max(scores, default=0.0)
+
+
+def _search_filters(payload: RetrievalRequest, retrieval: RetrievalSetting) -> SearchFilters:
+    condition = payload.metadata_condition
+    try:
+        where = metadata_filter(condition.conditions, condition.logical_operator) if condition else None
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    threshold = retrieval.score_threshold
+    if threshold is None:
+        return SearchFilters(where=where)
+    # Inverse of the scores below, so top_k is filled from chunks that already clear the threshold.
+    return SearchFilters(where=where, max_distance=2.0 * (1.0 - threshold), min_text_rank=threshold)
 
 
 @router.post("/retrieval")
@@ -92,24 +95,21 @@ def external_kb_retrieval(
         payload.query,
         limit=retrieval.top_k,
         include_score=True,
+        mode=retrieval.search_mode,
+        prefilter=retrieval.lexical_prefilter,
+        filters=_search_filters(payload, retrieval),
     )
-    filtered = []
-    for match in matches:
-        if not _match_metadata(match, payload.metadata_condition.conditions if payload.metadata_condition else None):
-            continue
-        score = _score_from_distance(float(match.get("distance") or 0.0))
-        if retrieval.score_threshold is not None and score < retrieval.score_threshold:
-            continue
-        filtered.append(
-            {
-                "content": match.get("content") or "",
-                "score": score,
-                "title": match.get("filename") or "Document",
-                "metadata": {
-                    "document_id": match.get("document_id"),
-                    "chunk_id": match.get("chunk_id"),
-                    "file_type": match.get("file_type"),
-                },
-            }
-        )
-    return {"records": filtered}
+    records = [
+        {
+            "content": match.get("content") or "",
+            "score": _score_from_match(match),
+            "title": match.get("filename") or "Document",
+            "metadata": {
+                "document_id": match.get("document_id"),
+                "chunk_id": match.get("chunk_id"),
+                "file_type": match.get("file_type"),
+            },
+        }
+        for match in matches
+    ]
+    return {"records": records}
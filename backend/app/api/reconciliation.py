@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.core.database import get_db
+from app.api.deps import require_roles
+from app.models.models import ReconciliationMatch
+from app.services.audit_log import log_event
+from app.services.reconciliation import reconcile_payouts
+
+router = APIRouter(prefix="/reconciliation", tags=["reconciliation"])
+
+
+def _match_out(match: ReconciliationMatch) -> dict:
+    return {
+        "id": match.id,
+        "payout_source": match.payout_source,
+        "payout_ref": match.payout_ref,
+        "bank_transaction_id": match.bank_transaction_id,
+        "amount": match.amount,
+        "bank_amount": match.bank_amount,
+        "currency": match.currency,
+        "payout_date": match.payout_date.isoformat(),
+        "posted_at": match.posted_at.isoformat(),
+        "method": match.method,
+        "matched_at": match.matched_at.isoformat(),
+    }
+
+
+@router.post("/payouts/run")
+def run_payout_reconciliation(
+    db: Session = Depends(get_db),
+    user=Depends(require_roles(["Founder", "Finance"])),
+):
+    result = reconcile_payouts(db, user.company_id)
+    log_event(
+        db, user.company_id, "reconciliation.payouts.run", "reconciliation", None, user.id,
+        {"payouts": result["payouts"], "matched": result["matched"]},
+    )
+    return result
+
+
+@router.get("/payouts/matches")
+def list_payout_matches(
+    limit: int = 200,
+    db: Session = Depends(get_db),
+    user=Depends(require_roles(["Founder", "Finance"])),
+):
+    matches = db.query(ReconciliationMatch).filter(
+        ReconciliationMatch.company_id == user.company_id,
+    ).order_by(ReconciliationMatch.payout_date.desc(), ReconciliationMatch.id.desc()).limit(limit).all()
+    return {"items": [_match_out(match) for match in matches], "count": len(matches)}
+
+
+@router.delete("/payouts/matches/{match_id}")
+def delete_payout_match(
+    match_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(require_roles(["Founder", "Finance"])),
+):
+    match = db.query(ReconciliationMatch).filter(
+        ReconciliationMatch.id == match_id,
+        ReconciliationMatch.company_id == user.company_id,
+    ).first()
+    if not match:
+        raise HTTPException(status_code=404, detail="Match not found")
+    db.delete(match)
+    db.commit()
+    log_event(db, user.company_id, "reconciliation.payouts.unmatched", "reconciliation_match", str(match_id), user.id, {})
+    return {"status": "deleted"}
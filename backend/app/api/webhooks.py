@@ -1,14 +1,13 @@
 import hmac
 import json
+from datetime import datetime, timezone
 from hashlib import sha256
-from fastapi import APIRouter, Depends, Header, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from app.core.config import settings
-from app.core.database import get_db
-from app.models.models import WiseWebhookReceipt, WiseWebhookSubscription, WiseSettings
-from app.core.wise_encryption import wise_decrypt
-from app.services.audit_log import log_event
-from app.worker import wise_incremental_sync, wise_refresh_transfers
+from app.connectors.wise.receipts import buffer_receipt
+from app.connectors.wise.webhook_routing import WebhookRoute, resolve_webhook_route
+from app.worker import schedule_wise_sync
 
 
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
@@ -21,11 +20,24 @@ def verify_signature(raw_body: bytes, signature: str | None, secret: str) -> boo
     return hmac.compare_digest(digest, signature)
 
 
+def _accept(route: WebhookRoute, subscription_id: str, event_type: str, payload: dict, verified: bool) -> None:
+    buffer_receipt({
+        "company_id": route.company_id,
+        "wise_subscription_id": subscription_id or None,
+        "event_type": event_type,
+        "status": "received" if verified else "rejected",
+        "reason": None if verified else "signature_mismatch",
+        "raw": payload,
+        "received_at": datetime.now(timezone.utc).isoformat(),
+    })
+    if verified:
+        schedule_wise_sync(route.company_id, route.environment, event_type)
+
+
 @router.post("/wise")
 async def wise_webhook(
     request: Request,
     x_signature: str | None = Header(default=None, alias="X-Signature"),
-    db: Session = Depends(get_db),
 ):
     raw_body = await request.body()
     try:
@@ -34,50 +46,13 @@ async def wise_webhook(
         payload = {}
     subscription_id = str(payload.get("subscriptionId") or payload.get("subscription_id") or "")
     event_type = payload.get("eventType") or payload.get("event_type") or "unknown"
-    subscription = None
-    if subscription_id:
-        subscription = db.query(WiseWebhookSubscription).filter(
-            WiseWebhookSubscription.wise_subscription_id == subscription_id
-        ).first()
-    company_id = subscription.company_id if subscription else settings.primary_company_id
-    if not company_id:
+    # The cached route is keyed by a Redis version, so even a hit needs a (blocking) Redis read.
+    route = await run_in_threadpool(resolve_webhook_route, subscription_id)
+    if route is None:
         raise HTTPException(status_code=400, detail="Webhook not routed")
-    secret = subscription.secret_ref if subscription and subscription.secret_ref else None
-    if not secret:
-        env = subscription.wise_environment if subscription and subscription.wise_environment else "sandbox"
-        stored = db.query(WiseSettings).filter(
-            WiseSettings.company_id == company_id,
-            WiseSettings.wise_environment == env,
-        ).first()
-        if stored and stored.webhook_secret_encrypted:
-            secret = wise_decrypt(stored.webhook_secret_encrypted)
-    if not secret:
-        secret = settings.wise_webhook_secret
-    if not verify_signature(raw_body, x_signature, secret):
-        receipt = WiseWebhookReceipt(
-            company_id=company_id,
-            wise_subscription_id=subscription_id or None,
-            event_type=event_type,
-            status="rejected",
-            reason="signature_mismatch",
-            raw=payload,
-        )
-        db.add(receipt)
-        db.commit()
-        log_event(db, company_id, "wise.webhook.rejected", "webhook", subscription_id or "unknown", None, {"event_type": event_type})
+    verified = verify_signature(raw_body, x_signature, route.secret or settings.wise_webhook_secret)
+    # Receipts and audit rows are buffered in Redis and written in batches by the worker.
+    await run_in_threadpool(_accept, route, subscription_id, event_type, payload, verified)
+    if not verified:
         raise HTTPException(status_code=401, detail="Invalid signature")
-    receipt = WiseWebhookReceipt(
-        company_id=company_id,
-        wise_subscription_id=subscription_id or None,
-        event_type=event_type,
-        status="received",
-        raw=payload,
-    )
-    db.add(receipt)
-    db.commit()
-    if "transfer" in str(event_type).lower():
-        wise_refresh_transfers.delay(company_id, subscription.wise_subscription_id if subscription else None)
-    else:
-        wise_incremental_sync.delay(company_id, subscription.wise_subscription_id if subscription else None)
-    log_event(db, company_id, "wise.webhook.received", "webhook", subscription_id or "unknown", None, {"event_type": event_type})
     return {"status": "ok"}
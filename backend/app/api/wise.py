@@ -7,12 +7,15 @@ from app.core.database import get_db
 from app.api.deps import get_current_user, require_roles
 from app.connectors.wise.client import exchange_oauth_code, WiseApiError
 from app.connectors.wise.config import oauth_base_url
+from app.connectors.wise.credentials import invalidate_wise_credentials
+from app.connectors.wise.webhook_routing import invalidate_webhook_routes
 from app.connectors.wise.state import create_state, verify_state
 from app.core.wise_encryption import wise_encrypt, wise_decrypt
-from app.models.models import Integration, IntegrationType, IntegrationCredentialWise, WiseSettings
-from app.schemas.wise import WiseSettingsOut, WiseSettingsUpdate
+from app.models.models import Integration, IntegrationType, IntegrationCredentialWise, WiseSettings, WisePaymentRun, WisePaymentRunItem
+from app.schemas.wise import PaymentRunCreate, PaymentRunItemOut, PaymentRunOut, WiseSettingsOut, WiseSettingsUpdate
+from app.services.payment_runs import create_payment_run
 from app.services.audit_log import log_event
-from app.worker import wise_full_sync
+from app.worker import wise_execute_payment_run, wise_full_sync
 import uuid
 
 
@@ -142,6 +145,7 @@ def oauth_callback(code: str, state: str, db: Session = Depends(get_db)):
         creds.scopes = (token_payload.get("scope") or "").split()
         creds.updated_at = datetime.now(timezone.utc)
     db.commit()
+    invalidate_wise_credentials(company_id, environment)
     log_event(db, company_id, "wise.oauth.connected", "integration", str(integration.id), payload.get("user_id"), {"environment": environment})
     return {"status": "connected"}
 
@@ -165,6 +169,7 @@ def disconnect(environment: str = Query("sandbox", pattern="^(sandbox|production
         if remaining == 0:
             integration.status = "disconnected"
     db.commit()
+    invalidate_wise_credentials(user.company_id, environment)
     log_event(db, user.company_id, "wise.oauth.disconnected", "integration", str(integration.id) if integration else None, user.id, {"environment": environment})
     return {"status": "disconnected"}
 
@@ -252,6 +257,8 @@ def update_settings(payload: WiseSettingsUpdate, db: Session = Depends(get_db),
         stored.wise_environment = payload.wise_environment
     stored.updated_at = datetime.now(timezone.utc)
     db.commit()
+    invalidate_wise_credentials(user.company_id)
+    invalidate_webhook_routes()
     return WiseSettingsOut(
         wise_client_id=stored.wise_client_id,
         wise_environment=stored.wise_environment,
@@ -284,3 +291,72 @@ def test_connection(environment: str = Query("sandbox", pattern="^(sandbox|produ
         return {"ok": True, "message": "Connection successful."}
     except Exception as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _payment_run_out(db: Session, run: WisePaymentRun, include_items: bool = True) -> PaymentRunOut:
+    out = PaymentRunOut.model_validate(run)
+    if include_items:
+        items = db.query(WisePaymentRunItem).filter(
+            WisePaymentRunItem.payment_run_id == run.id
+        ).order_by(WisePaymentRunItem.id.asc()).all()
+        out.items = [PaymentRunItemOut.model_validate(item) for item in items]
+    return out
+
+
+@router.post("/payment-runs", response_model=PaymentRunOut)
+def create_payment_run_endpoint(
+    payload: PaymentRunCreate,
+    db: Session = Depends(get_db),
+    user=Depends(require_roles(["Founder", "Finance"])),
+):
+    if not settings.wise_write_enabled:
+        raise HTTPException(status_code=400, detail="Wise write mode disabled")
+    try:
+        run = create_payment_run(
+            db,
+            user.company_id,
+            payload.wise_environment,
+            [item.model_dump() for item in payload.items],
+            reference=payload.reference,
+            actor_user_id=user.id,
+            idempotency_key=payload.idempotency_key,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if run.status == "pending":
+        wise_execute_payment_run.delay(run.id)
+    return _payment_run_out(db, run, include_items=False)
+
+
+@router.get("/payment-runs", response_model=list[PaymentRunOut])
+def list_payment_runs(db: Session = Depends(get_db), user=Depends(require_roles(["Founder", "Finance"]))):
+    runs = db.query(WisePaymentRun).filter(
+        WisePaymentRun.company_id == user.company_id
+    ).order_by(WisePaymentRun.created_at.desc()).limit(50).all()
+    return [_payment_run_out(db, run, include_items=False) for run in runs]
+
+
+@router.get("/payment-runs/{run_id}", response_model=PaymentRunOut)
+def get_payment_run(run_id: int, db: Session = Depends(get_db), user=Depends(require_roles(["Founder", "Finance"]))):
+    run = db.query(WisePaymentRun).filter(
+        WisePaymentRun.id == run_id,
+        WisePaymentRun.company_id == user.company_id,
+    ).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Payment run not found")
+    return _payment_run_out(db, run)
+
+
+@router.post("/payment-runs/{run_id}/resume", response_model=PaymentRunOut)
+def resume_payment_run(run_id: int, db: Session = Depends(get_db), user=Depends(require_roles(["Founder", "Finance"]))):
+    run = db.query(WisePaymentRun).filter(
+        WisePaymentRun.id == run_id,
+        WisePaymentRun.company_id == user.company_id,
+    ).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Payment run not found")
+    if run.status in {"funded", "failed"}:
+        raise HTTPException(status_code=400, detail=f"Payment run already {run.status}")
+    wise_execute_payment_run.delay(run.id)
+    log_event(db, user.company_id, "wise.payment_run.resumed", "wise_payment_run", str(run.id), user.id, {})
+    return _payment_run_out(db, run, include_items=False)
@@ -0,0 +1,67 @@
+import random
+import time
+import redis
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+
+class WiseCircuitBreaker:
+    # Shared across workers through Redis so one outage trips the breaker for
+    # every tenant on that environment. Redis failures leave the breaker closed.
+    def __init__(self, environment: str, client: redis.Redis | None = None):
+        self.environment = environment
+        self._client = client
+        self._dirty = True
+
+    @property
+    def client(self) -> redis.Redis:
+        return self._client or get_redis()
+
+    def _key(self, suffix: str) -> str:
+        return f"wise:circuit:{self.environment}:{suffix}"
+
+    def open_for(self) -> float | None:
+        try:
+            open_until, tripped, failures = self.client.mget(
+                self._key("open_until"), self._key("tripped"), self._key("failures")
+            )
+            self._dirty = bool(tripped or failures)
+            if open_until and float(open_until) > time.time():
+                return float(open_until) - time.time()
+            # Once the cooldown has passed a single probe request is let through.
+            if tripped and not self.client.set(
+                self._key("probe"), 1, nx=True, ex=int(settings.wise_circuit_cooldown_seconds)
+            ):
+                return settings.wise_circuit_cooldown_seconds
+        except redis.RedisError:
+            return None
+        return None
+
+    def record_success(self) -> None:
+        if not self._dirty:
+            return
+        try:
+            self.client.delete(self._key("failures"), self._key("tripped"), self._key("probe"))
+            self._dirty = False
+        except redis.RedisError:
+            pass
+
+    def record_failure(self) -> None:
+        try:
+            failures = self.client.incr(self._key("failures"))
+            if failures == 1:
+                self.client.expire(self._key("failures"), int(settings.wise_circuit_window_seconds))
+            if failures < settings.wise_circuit_failure_threshold and not self.client.get(self._key("tripped")):
+                return
+            cooldown = settings.wise_circuit_cooldown_seconds
+            self.client.set(self._key("open_until"), time.time() + cooldown, ex=int(cooldown) + 1)
+            self.client.set(self._key("tripped"), 1, ex=int(cooldown) * 10)
+            self.client.delete(self._key("failures"), self._key("probe"))
+        except redis.RedisError:
+            pass
+
+
+def retry_countdown(retry_after: float | None, retries: int) -> float:
+    base = settings.wise_retry_base_seconds
+    backoff = min(base * (2 ** retries), settings.wise_retry_max_seconds)
+    return max(retry_after or 0.0, backoff) + random.uniform(0, base)
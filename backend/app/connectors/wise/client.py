@@ -1,16 +1,50 @@
-import time
+import hashlib
 import requests
 from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from typing import Any
 from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.core.wise_encryption import wise_decrypt, wise_encrypt
 from app.models.models import IntegrationCredentialWise, WiseSettings
+from app.connectors.wise.circuit import WiseCircuitBreaker
 from app.connectors.wise.config import base_url, oauth_base_url
+from app.connectors.wise.credentials import (
+    WiseCredentialEntry,
+    credential_cache,
+    credential_version,
+    invalidate_wise_credentials,
+)
+from app.services.rate_limit import rate_limiter
 
 
 class WiseApiError(RuntimeError):
-    pass
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class WiseRetryableError(WiseApiError):
+    def __init__(self, message: str, status_code: int | None = None, retry_after: float | None = None):
+        super().__init__(message, status_code)
+        self.retry_after = retry_after
+
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _retry_after(response: requests.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
 
 
 class WiseApiClient:
@@ -29,7 +63,13 @@ class WiseApiClient:
         return creds
 
     def _get_access_token(self, creds: IntegrationCredentialWise) -> str:
-        return wise_decrypt(creds.oauth_access_token_encrypted)
+        entry = self._cached_credentials()
+        if entry.access_token and entry.access_token_encrypted == creds.oauth_access_token_encrypted:
+            return entry.access_token
+        token = wise_decrypt(creds.oauth_access_token_encrypted)
+        entry.access_token = token
+        entry.access_token_encrypted = creds.oauth_access_token_encrypted
+        return token
 
     def _refresh(self, creds: IntegrationCredentialWise) -> None:
         payload = {
@@ -54,64 +94,100 @@ class WiseApiClient:
             creds.token_expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
         creds.updated_at = datetime.now(timezone.utc)
         self.db.commit()
+        invalidate_wise_credentials(self.company_id, self.environment)
 
-    def request(self, method: str, path: str, params: dict[str, Any] | None = None, json: Any | None = None) -> Any:
-        creds = None
+    def auth_token(self) -> str:
         api_token = self._api_token()
-        if not api_token:
-            creds = self._credentials()
-            if creds.token_expires_at and creds.token_expires_at <= datetime.now(timezone.utc) + timedelta(minutes=2):
-                self._refresh(creds)
+        if api_token:
+            return api_token
+        creds = self._credentials()
+        if creds.token_expires_at and creds.token_expires_at <= datetime.now(timezone.utc) + timedelta(minutes=2):
+            self._refresh(creds)
+        return self._get_access_token(creds)
+
+    def refresh_auth_token(self) -> str | None:
+        if self._api_token():
+            return None
+        creds = self._credentials()
+        self._refresh(creds)
+        return self._get_access_token(creds)
+
+    def send(self, method: str, path: str, token: str, params: dict[str, Any] | None = None, json: Any | None = None) -> Any:
+        # No database access here, so it is safe to call from fetch worker threads.
         url = f"{base_url(self.environment)}{path}"
-        token = api_token or self._get_access_token(creds)
-        refreshed = False
-        for attempt in range(3):
-            headers = {"Authorization": f"Bearer {token}"}
+        token_key = hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+        limiter = rate_limiter(("wise", self.environment, token_key), settings.wise_rate_limit_per_second)
+        circuit = WiseCircuitBreaker(self.environment)
+        open_for = circuit.open_for()
+        if open_for is not None:
+            raise WiseRetryableError(f"Wise {self.environment} circuit open", retry_after=open_for)
+        limiter.acquire()
+        headers = {"Authorization": f"Bearer {token}"}
+        try:
             response = requests.request(method, url, params=params, json=json, headers=headers, timeout=30)
-            if response.status_code == 401 and not refreshed:
-                if creds:
-                    self._refresh(creds)
-                    token = self._get_access_token(creds)
-                    refreshed = True
-                    continue
-            if response.status_code in {429, 500, 502, 503} and attempt < 2:
-                time.sleep(2 ** attempt)
-                continue
-            if response.status_code >= 400:
-                raise WiseApiError(f"Wise API error {response.status_code}: {response.text}")
-            if response.text:
-                return response.json()
-            return {}
-        raise WiseApiError("Wise API request failed after retries")
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            circuit.record_failure()
+            raise WiseRetryableError(f"Wise API unreachable: {exc}") from exc
+        # Retries are left to the caller (Celery countdown) so no worker sleeps here.
+        if response.status_code in RETRYABLE_STATUSES:
+            circuit.record_failure()
+            raise WiseRetryableError(
+                f"Wise API error {response.status_code}: {response.text}",
+                response.status_code,
+                _retry_after(response),
+            )
+        circuit.record_success()
+        if response.status_code >= 400:
+            raise WiseApiError(f"Wise API error {response.status_code}: {response.text}", response.status_code)
+        if response.text:
+            return response.json()
+        return {}
 
-    def _client_id(self) -> str:
+    def request(self, method: str, path: str, params: dict[str, Any] | None = None, json: Any | None = None) -> Any:
+        token = self.auth_token()
+        try:
+            return self.send(method, path, token, params=params, json=json)
+        except WiseApiError as exc:
+            if exc.status_code != 401:
+                raise
+            token = self.refresh_auth_token()
+            if not token:
+                raise
+            return self.send(method, path, token, params=params, json=json)
+
+    def _cached_credentials(self) -> WiseCredentialEntry:
+        version = credential_version(self.company_id)
+        if version is None:
+            # Without Redis another process's invalidation cannot be seen, so nothing is cached.
+            return self._load_credentials()
+        return credential_cache.get_or_load((self.company_id, self.environment, version), self._load_credentials)
+
+    def _load_credentials(self) -> WiseCredentialEntry:
         settings_row = self.db.query(WiseSettings).filter(
             WiseSettings.company_id == self.company_id,
             WiseSettings.wise_environment == self.environment,
         ).first()
+        api_token = None
+        if settings_row and settings_row.wise_api_token_encrypted:
+            api_token = wise_decrypt(settings_row.wise_api_token_encrypted)
+        elif settings.wise_api_token:
+            api_token = settings.wise_api_token
+        client_id = settings.wise_client_id
         if settings_row and settings_row.wise_client_id:
-            return settings_row.wise_client_id
-        return settings.wise_client_id
+            client_id = settings_row.wise_client_id
+        client_secret = settings.wise_client_secret
+        if settings_row and settings_row.wise_client_secret_encrypted:
+            client_secret = wise_decrypt(settings_row.wise_client_secret_encrypted)
+        return WiseCredentialEntry(api_token=api_token, client_id=client_id, client_secret=client_secret)
+
+    def _client_id(self) -> str:
+        return self._cached_credentials().client_id
 
     def _client_secret(self) -> str:
-        settings_row = self.db.query(WiseSettings).filter(
-            WiseSettings.company_id == self.company_id,
-            WiseSettings.wise_environment == self.environment,
-        ).first()
-        if settings_row and settings_row.wise_client_secret_encrypted:
-            return wise_decrypt(settings_row.wise_client_secret_encrypted)
-        return settings.wise_client_secret
+        return self._cached_credentials().client_secret
 
     def _api_token(self) -> str | None:
-        settings_row = self.db.query(WiseSettings).filter(
-            WiseSettings.company_id == self.company_id,
-            WiseSettings.wise_environment == self.environment,
-        ).first()
-        if settings_row and settings_row.wise_api_token_encrypted:
-            return wise_decrypt(settings_row.wise_api_token_encrypted)
-        if settings.wise_api_token:
-            return settings.wise_api_token
-        return None
+        return self._cached_credentials().api_token
 
 
 def exchange_oauth_code(environment: str, code: str, redirect_uri: str, client_id: str, client_secret: str) -> dict[str, Any]:
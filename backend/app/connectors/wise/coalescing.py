@@ -0,0 +1,72 @@
+import time
+import uuid
+import redis
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+
+SYNC_SCOPES = ("balances", "transactions", "transfers")
+
+
+def scopes_for_event(event_type: str | None) -> set[str]:
+    name = str(event_type or "").lower()
+    if "transfer" in name:
+        return {"transfers"}
+    if "transaction" in name:
+        return {"transactions"}
+    return {"balances", "transactions"}
+
+
+def _key(company_id: int, environment: str, suffix: str) -> str:
+    return f"wise:coalesce:{company_id}:{environment}:{suffix}"
+
+
+def _ttl() -> int:
+    return int(settings.wise_webhook_max_delay_seconds * 4) + 60
+
+
+def mark_dirty(company_id: int, environment: str, scopes: set[str], client: redis.Redis | None = None) -> bool:
+    client = client or get_redis()
+    now = time.time()
+    ttl = _ttl()
+    scopes_key = _key(company_id, environment, "scopes")
+    client.sadd(scopes_key, *sorted(scopes))
+    client.expire(scopes_key, ttl)
+    client.set(_key(company_id, environment, "first_seen"), now, nx=True, ex=ttl)
+    client.set(_key(company_id, environment, "last_seen"), now, ex=ttl)
+    # Only the caller that flips "scheduled" enqueues a sync; the rest just merge scopes.
+    return bool(client.set(_key(company_id, environment, "scheduled"), now, nx=True, ex=ttl))
+
+
+def seconds_until_sync(company_id: int, environment: str, client: redis.Redis | None = None) -> float:
+    client = client or get_redis()
+    now = time.time()
+    first_seen, last_seen = client.mget(
+        _key(company_id, environment, "first_seen"),
+        _key(company_id, environment, "last_seen"),
+    )
+    if first_seen is None or last_seen is None:
+        # Timestamps expired (or were already claimed): sync now, claim_scopes turns it into a noop if
+        # nothing is left. Defaulting to now would defer forever.
+        return 0.0
+    first_seen, last_seen = float(first_seen), float(last_seen)
+    quiet_remaining = last_seen + settings.wise_webhook_quiet_seconds - now
+    cap_remaining = first_seen + settings.wise_webhook_max_delay_seconds - now
+    return max(0.0, min(quiet_remaining, cap_remaining))
+
+
+def claim_scopes(company_id: int, environment: str, client: redis.Redis | None = None) -> set[str]:
+    client = client or get_redis()
+    client.delete(
+        _key(company_id, environment, "scheduled"),
+        _key(company_id, environment, "first_seen"),
+        _key(company_id, environment, "last_seen"),
+    )
+    processing_key = _key(company_id, environment, f"claimed:{uuid.uuid4().hex}")
+    try:
+        client.rename(_key(company_id, environment, "scopes"), processing_key)
+    except redis.ResponseError:
+        return set()
+    scopes = set(client.smembers(processing_key))
+    client.delete(processing_key)
+    return scopes
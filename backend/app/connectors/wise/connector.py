@@ -1,9 +1,13 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Callable
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.connectors.wise.client import WiseApiClient
+from app.connectors.wise.client import WiseApiClient, WiseApiError
 from app.connectors.wise.config import WiseEndpoints
+from app.connectors.wise.webhook_routing import invalidate_webhook_routes
 from app.models.models import (
     IntegrationCredentialWise,
     WiseProfile,
@@ -12,12 +16,13 @@ from app.models.models import (
     WiseTransactionRaw,
     WiseWebhookSubscription,
     BankAccount,
-    BankBalance,
     BankTransaction,
     WiseTransfer,
     WiseBatch,
 )
 from app.services.audit_log import log_event
+from app.services.bank_balances import record_bank_balances
+from app.services.upserts import upsert_rows
 from app.core.config import settings
 
 
@@ -133,127 +138,247 @@ class WiseConnector:
         balances = self.db.query(WiseBalanceAccount).filter(
             WiseBalanceAccount.company_id == self.company_id
         ).all()
+        if not balances:
+            return 0
+        bank_accounts = self._bank_accounts_by_provider_id()
+        payloads = self._with_auth_retry(lambda token: self._fetch_balances(balances, token))
         count = 0
+        captures = []
+        fetched_at = datetime.now(timezone.utc)
         for account in balances:
-            path = self.endpoints.balances.format(balance_account_id=account.wise_balance_account_id)
-            payload = self.client.request("GET", path)
+            payload = payloads[account.wise_balance_account_id]
             items = payload.get("balances") if isinstance(payload, dict) else payload
             items = items or []
             for item in items:
                 currency = item.get("currency") or account.currency
                 amount = float(item.get("amount") or item.get("value") or 0)
-                timestamp = item.get("timestamp") or item.get("date") or datetime.now(timezone.utc).isoformat()
+                timestamp = item.get("timestamp") or item.get("date") or fetched_at.isoformat()
                 captured_at = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
-                self.db.add(WiseBalance(
-                    company_id=self.company_id,
-                    wise_balance_account_id=account.wise_balance_account_id,
-                    currency=currency,
-                    amount=amount,
-                    timestamp=captured_at,
-                    fetched_at=datetime.now(timezone.utc),
-                ))
-                bank_account = self.db.query(BankAccount).filter(
-                    BankAccount.company_id == self.company_id,
-                    BankAccount.provider == "wise",
-                    BankAccount.provider_account_id == account.wise_balance_account_id,
-                ).first()
+                bank_account = bank_accounts.get(account.wise_balance_account_id)
                 if bank_account:
                     bank_account.balance = amount
-                    self.db.add(BankBalance(
+                    captures.append({
+                        "bank_account_id": bank_account.id,
+                        "provider": "wise",
+                        "provider_account_id": account.wise_balance_account_id,
+                        "currency": currency,
+                        "balance": amount,
+                        "captured_at": captured_at,
+                    })
+                else:
+                    self.db.add(WiseBalance(
                         company_id=self.company_id,
-                        bank_account_id=bank_account.id,
-                        provider="wise",
-                        provider_account_id=account.wise_balance_account_id,
+                        wise_balance_account_id=account.wise_balance_account_id,
                         currency=currency,
-                        balance=amount,
-                        captured_at=captured_at,
+                        amount=amount,
+                        timestamp=captured_at,
+                        fetched_at=fetched_at,
                     ))
                 count += 1
+        for capture in record_bank_balances(self.db, self.company_id, captures):
+            self.db.add(WiseBalance(
+                company_id=self.company_id,
+                wise_balance_account_id=capture["provider_account_id"],
+                currency=capture["currency"],
+                amount=capture["balance"],
+                timestamp=capture["captured_at"],
+                fetched_at=fetched_at,
+            ))
         self.db.commit()
         return count
 
-    def sync_transactions(self) -> int:
-        creds = self._credentials()
-        cursor_map = creds.sync_cursor_transactions or {}
-        total = 0
+    def _fetch_balances(self, accounts: list[WiseBalanceAccount], token: str) -> dict[str, Any]:
+        payloads: dict[str, Any] = {}
+        with ThreadPoolExecutor(max_workers=settings.wise_fetch_concurrency) as pool:
+            futures = {
+                pool.submit(
+                    self.client.send,
+                    "GET",
+                    self.endpoints.balances.format(balance_account_id=account.wise_balance_account_id),
+                    token,
+                ): account.wise_balance_account_id
+                for account in accounts
+            }
+            for future in as_completed(futures):
+                payloads[futures[future]] = future.result()
+        return payloads
+
+    def _with_auth_retry(self, fetch: Callable[[str], Any]) -> Any:
+        token = self.client.auth_token()
+        try:
+            return fetch(token)
+        except WiseApiError as exc:
+            if exc.status_code != 401:
+                raise
+            token = self.client.refresh_auth_token()
+            if not token:
+                raise
+            return fetch(token)
+
+    def sync_transactions(self, max_pages: int | None = None) -> int:
+        max_pages = max_pages or settings.wise_transactions_max_pages
         accounts = self.db.query(WiseBalanceAccount).filter(
             WiseBalanceAccount.company_id == self.company_id
         ).all()
-        for account in accounts:
-            cursor = cursor_map.get(account.wise_balance_account_id)
-            params = {
-                "balanceAccountId": account.wise_balance_account_id,
-            }
-            if cursor:
-                params["cursor"] = cursor
-            payload = self.client.request("GET", self.endpoints.transactions, params=params)
-            transactions = payload.get("transactions") if isinstance(payload, dict) else payload
-            transactions = transactions or []
-            for item in transactions:
-                transaction_id = str(item.get("id") or item.get("transactionId"))
-                occurred_at = item.get("date") or item.get("occurred_at") or datetime.now(timezone.utc).isoformat()
-                occurred_dt = datetime.fromisoformat(str(occurred_at).replace("Z", "+00:00"))
-                amount = float(item.get("amount") or item.get("value") or 0)
-                currency = item.get("currency") or account.currency or "USD"
-                existing = self.db.query(WiseTransactionRaw).filter(
-                    WiseTransactionRaw.company_id == self.company_id,
-                    WiseTransactionRaw.wise_transaction_id == transaction_id,
-                ).first()
-                if existing:
-                    existing.occurred_at = occurred_dt
-                    existing.amount = amount
-                    existing.currency = currency
-                    existing.description = item.get("description")
-                    existing.raw = item
-                    existing.fetched_at = datetime.now(timezone.utc)
-                else:
-                    self.db.add(WiseTransactionRaw(
-                        company_id=self.company_id,
-                        wise_transaction_id=transaction_id,
-                        wise_balance_account_id=account.wise_balance_account_id,
-                        occurred_at=occurred_dt,
-                        amount=amount,
-                        currency=currency,
-                        description=item.get("description"),
-                        raw=item,
-                        fetched_at=datetime.now(timezone.utc),
-                    ))
-                bank_account = self.db.query(BankAccount).filter(
-                    BankAccount.company_id == self.company_id,
-                    BankAccount.provider == "wise",
-                    BankAccount.provider_account_id == account.wise_balance_account_id,
-                ).first()
-                if bank_account:
-                    existing_tx = self.db.query(BankTransaction).filter(
-                        BankTransaction.company_id == self.company_id,
-                        BankTransaction.provider == "wise",
-                        BankTransaction.provider_transaction_id == transaction_id,
-                    ).first()
-                    if existing_tx:
-                        existing_tx.amount = amount
-                        existing_tx.currency = currency
-                        existing_tx.posted_at = occurred_dt.date()
-                        existing_tx.description = item.get("description")
-                        existing_tx.raw_reference = item.get("reference")
-                    else:
-                        self.db.add(BankTransaction(
-                            bank_account_id=bank_account.id,
-                            company_id=self.company_id,
-                            posted_at=occurred_dt.date(),
-                            amount=amount,
-                            currency=currency,
-                            description=item.get("description"),
-                            category=item.get("type"),
-                            provider="wise",
-                            provider_transaction_id=transaction_id,
-                            raw_reference=item.get("reference"),
-                        ))
-                total += 1
-            cursor_map[account.wise_balance_account_id] = payload.get("nextCursor") if isinstance(payload, dict) else cursor
+        if not accounts:
+            return 0
+        bank_accounts = self._bank_accounts_by_provider_id()
+        stored = [0]
+        self._with_auth_retry(lambda token: self._stream_transaction_pages(accounts, bank_accounts, max_pages, token, stored))
+        return stored[0]
+
+    def _stream_transaction_pages(
+        self,
+        accounts: list[WiseBalanceAccount],
+        bank_accounts: dict[str, BankAccount],
+        max_pages: int,
+        token: str,
+        stored: list[int],
+    ) -> None:
+        # Fetch threads walk each account's cursor chain; this thread is the only
+        # one touching the session and writes/checkpoints pages as they arrive.
+        cursors = dict(self._credentials().sync_cursor_transactions or {})
+        accounts_by_id = {account.wise_balance_account_id: account for account in accounts}
+        pages: queue.Queue = queue.Queue(maxsize=settings.wise_fetch_concurrency * 2)
+        stop = threading.Event()
+
+        def put(item: tuple) -> bool:
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def walk(balance_account_id: str, cursor: str | None) -> None:
+            try:
+                for _ in range(max_pages):
+                    params = {"balanceAccountId": balance_account_id}
+                    if cursor:
+                        params["cursor"] = cursor
+                    payload = self.client.send("GET", self.endpoints.transactions, token, params=params)
+                    next_cursor = payload.get("nextCursor") if isinstance(payload, dict) else None
+                    if not put(("page", balance_account_id, (payload, cursor, next_cursor))):
+                        return
+                    if not next_cursor or next_cursor == cursor:
+                        break
+                    cursor = next_cursor
+            except Exception as exc:
+                put(("error", balance_account_id, exc))
+            finally:
+                put(("done", balance_account_id, None))
+
+        with ThreadPoolExecutor(max_workers=settings.wise_fetch_concurrency) as pool:
+            for balance_account_id in accounts_by_id:
+                pool.submit(walk, balance_account_id, cursors.get(balance_account_id))
+            remaining = len(accounts_by_id)
+            try:
+                while remaining:
+                    kind, balance_account_id, data = pages.get()
+                    if kind == "done":
+                        remaining -= 1
+                        continue
+                    if kind == "error":
+                        raise data
+                    payload, cursor, next_cursor = data
+                    transactions = payload.get("transactions") if isinstance(payload, dict) else payload
+                    stored[0] += self._store_transactions(
+                        accounts_by_id[balance_account_id],
+                        transactions or [],
+                        bank_accounts.get(balance_account_id),
+                    )
+                    self._checkpoint_cursor(balance_account_id, next_cursor or cursor)
+            finally:
+                stop.set()
+
+    def _checkpoint_cursor(self, balance_account_id: str, cursor: str | None) -> None:
+        creds = self._credentials()
+        cursor_map = dict(creds.sync_cursor_transactions or {})
+        cursor_map[balance_account_id] = cursor
         creds.sync_cursor_transactions = cursor_map
         creds.updated_at = datetime.now(timezone.utc)
         self.db.commit()
-        return total
+
+    def _bank_accounts_by_provider_id(self) -> dict[str, BankAccount]:
+        accounts = self.db.query(BankAccount).filter(
+            BankAccount.company_id == self.company_id,
+            BankAccount.provider == "wise",
+        ).all()
+        return {account.provider_account_id: account for account in accounts}
+
+    def _store_transactions(
+        self,
+        account: WiseBalanceAccount,
+        transactions: list[dict[str, Any]],
+        bank_account: BankAccount | None = None,
+    ) -> int:
+        if not transactions:
+            return 0
+        if bank_account is None:
+            bank_account = self._bank_accounts_by_provider_id().get(account.wise_balance_account_id)
+        transaction_ids = [str(item.get("id") or item.get("transactionId")) for item in transactions]
+        existing_raw = dict(self.db.query(WiseTransactionRaw.wise_transaction_id, WiseTransactionRaw.raw).filter(
+            WiseTransactionRaw.company_id == self.company_id,
+            WiseTransactionRaw.wise_transaction_id.in_(transaction_ids),
+        ).all())
+        existing_bank_ids = set()
+        if bank_account:
+            existing_bank_ids = {row[0] for row in self.db.query(BankTransaction.provider_transaction_id).filter(
+                BankTransaction.company_id == self.company_id,
+                BankTransaction.provider == "wise",
+                BankTransaction.provider_transaction_id.in_(transaction_ids),
+            ).all()}
+        fetched_at = datetime.now(timezone.utc)
+        raw_rows = []
+        bank_rows = []
+        for transaction_id, item in zip(transaction_ids, transactions):
+            unchanged = existing_raw.get(transaction_id) == item
+            if unchanged and (not bank_account or transaction_id in existing_bank_ids):
+                continue
+            occurred_at = item.get("date") or item.get("occurred_at") or fetched_at.isoformat()
+            occurred_dt = datetime.fromisoformat(str(occurred_at).replace("Z", "+00:00"))
+            amount = float(item.get("amount") or item.get("value") or 0)
+            currency = item.get("currency") or account.currency or "USD"
+            raw_rows.append({
+                "company_id": self.company_id,
+                "wise_transaction_id": transaction_id,
+                "wise_balance_account_id": account.wise_balance_account_id,
+                "occurred_at": occurred_dt,
+                "amount": amount,
+                "currency": currency,
+                "description": item.get("description"),
+                "raw": item,
+                "fetched_at": fetched_at,
+            })
+            if bank_account:
+                bank_rows.append({
+                    "bank_account_id": bank_account.id,
+                    "company_id": self.company_id,
+                    "posted_at": occurred_dt.date(),
+                    "amount": amount,
+                    "currency": currency,
+                    "description": item.get("description"),
+                    "category": item.get("type"),
+                    "provider": "wise",
+                    "provider_transaction_id": transaction_id,
+                    "raw_reference": item.get("reference"),
+                })
+        upsert_rows(
+            self.db,
+            WiseTransactionRaw,
+            raw_rows,
+            conflict_columns=["company_id", "wise_transaction_id"],
+            update_columns=["occurred_at", "amount", "currency", "description", "raw", "fetched_at"],
+        )
+        upsert_rows(
+            self.db,
+            BankTransaction,
+            bank_rows,
+            conflict_columns=["company_id", "provider", "provider_transaction_id"],
+            update_columns=["amount", "currency", "posted_at", "description", "raw_reference"],
+        )
+        return len(transactions)
 
     def register_webhooks(self) -> str | None:
         existing = self.db.query(WiseWebhookSubscription).filter(
@@ -283,6 +408,7 @@ class WiseConnector:
             updated_at=datetime.now(timezone.utc),
         ))
         self.db.commit()
+        invalidate_webhook_routes()
         return subscription_id
 
     def create_transfer(self, payee_id: str, amount: float, currency: str, reference: str, idempotency_key: str) -> WiseTransfer:
@@ -315,6 +441,15 @@ class WiseConnector:
     def create_batch_group(self, reference: str, idempotency_key: str) -> WiseBatch:
         if not settings.wise_write_enabled:
             raise RuntimeError("Wise write mode disabled")
+        # The row is only committed once Wise has answered, so an existing one is the group to reuse;
+        # creating another would open a second group at Wise and then hit the unique key.
+        existing = self.db.query(WiseBatch).filter(
+            WiseBatch.company_id == self.company_id,
+            WiseBatch.idempotency_key == idempotency_key,
+            WiseBatch.wise_batch_id.is_not(None),
+        ).first()
+        if existing:
+            return existing
         batch = WiseBatch(
             company_id=self.company_id,
             status="created",
@@ -346,6 +481,46 @@ class WiseConnector:
         log_event(self.db, self.company_id, "wise.batch.add_transfer", "wise_batch", batch_id, self.actor_user_id, payload)
         return response
 
+    def add_transfers_to_batch(
+        self,
+        batch_id: str,
+        transfers: dict[str, dict[str, Any]],
+        on_result: Callable[[str, Any, Exception | None], None],
+    ) -> None:
+        # transfers maps idempotency key -> payload. Requests run in a bounded pool;
+        # on_result is always called from this thread so callers can write to the session.
+        if not settings.wise_write_enabled:
+            raise RuntimeError("Wise write mode disabled")
+        path = self.endpoints.batch_payments.format(batch_id=batch_id)
+        token = self.client.auth_token()
+        pending = dict(transfers)
+        for attempt in range(2):
+            unauthorized: dict[str, dict[str, Any]] = {}
+            with ThreadPoolExecutor(max_workers=settings.wise_payment_concurrency) as pool:
+                futures = {
+                    pool.submit(self.client.send, "POST", path, token, json=payload | {"idempotencyKey": key}): key
+                    for key, payload in pending.items()
+                }
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        response = future.result()
+                    except WiseApiError as exc:
+                        if exc.status_code == 401 and attempt == 0:
+                            unauthorized[key] = pending[key]
+                        else:
+                            on_result(key, None, exc)
+                        continue
+                    on_result(key, response, None)
+            if not unauthorized:
+                return
+            token = self.client.refresh_auth_token()
+            if not token:
+                for key in unauthorized:
+                    on_result(key, None, WiseApiError("Wise API unauthorized", 401))
+                return
+            pending = unauthorized
+
     def fund_batch(self, batch_id: str, idempotency_key: str) -> dict[str, Any]:
         if not settings.wise_write_enabled:
             raise RuntimeError("Wise write mode disabled")
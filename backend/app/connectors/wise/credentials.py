@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+import redis
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+
+@dataclass
+class WiseCredentialEntry:
+    api_token: str | None
+    client_id: str | None
+    client_secret: str | None
+    access_token: str | None = None
+    access_token_encrypted: str | None = None
+
+
+# Keyed by (company_id, environment, version). Entries are per process; the version is a Redis
+# counter bumped on every invalidation, so other processes stop using changed credentials at once.
+credential_cache = TTLCache(ttl_seconds=settings.wise_credential_cache_ttl_seconds)
+
+
+def _version_key(company_id: int) -> str:
+    return f"wise:credentials:version:{company_id}"
+
+
+def credential_version(company_id: int) -> str | None:
+    try:
+        return get_redis().get(_version_key(company_id)) or "0"
+    except redis.RedisError:
+        return None
+
+
+def invalidate_wise_credentials(company_id: int, environment: str | None = None) -> int:
+    try:
+        get_redis().incr(_version_key(company_id))
+    except redis.RedisError:
+        pass
+    return credential_cache.invalidate(
+        lambda key: key[0] == company_id and (environment is None or key[1] == environment)
+    )
@@ -0,0 +1,82 @@
+import json
+from datetime import datetime, timezone
+from typing import Any
+import redis
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from app.models.models import AuditLog, WiseWebhookReceipt
+from app.services.redis_client import get_redis
+
+
+RECEIPTS_KEY = "wise:webhook:receipts"
+PROCESSING_KEY = "wise:webhook:receipts:processing"
+FLUSH_LOCK_KEY = "wise:webhook:receipts:flush"
+FLUSH_LOCK_SECONDS = 300
+
+
+def buffer_receipt(receipt: dict[str, Any], client: redis.Redis | None = None) -> None:
+    client = client or get_redis()
+    client.rpush(RECEIPTS_KEY, json.dumps(receipt, default=str))
+
+
+def acquire_flush_lock(client: redis.Redis | None = None) -> bool:
+    # One flusher at a time, so the processing list only ever holds the batch being written.
+    client = client or get_redis()
+    return bool(client.set(FLUSH_LOCK_KEY, "1", nx=True, ex=FLUSH_LOCK_SECONDS))
+
+
+def release_flush_lock(client: redis.Redis | None = None) -> None:
+    (client or get_redis()).delete(FLUSH_LOCK_KEY)
+
+
+def requeue_unacked(client: redis.Redis | None = None) -> int:
+    # Receipts left behind by a flush that failed before its commit go back to the front of the queue.
+    client = client or get_redis()
+    moved = 0
+    while client.lmove(PROCESSING_KEY, RECEIPTS_KEY, "RIGHT", "LEFT") is not None:
+        moved += 1
+    return moved
+
+
+def drain_receipts(batch_size: int, client: redis.Redis | None = None) -> list[dict[str, Any]]:
+    # LMOVE rather than LPOP: receipts stay in the processing list until ack_receipts runs after the commit.
+    client = client or get_redis()
+    pipe = client.pipeline(transaction=False)
+    for _ in range(batch_size):
+        pipe.lmove(RECEIPTS_KEY, PROCESSING_KEY, "LEFT", "RIGHT")
+    return [json.loads(item) for item in pipe.execute() if item is not None]
+
+
+def ack_receipts(client: redis.Redis | None = None) -> None:
+    (client or get_redis()).delete(PROCESSING_KEY)
+
+
+def persist_receipts(db: Session, receipts: list[dict[str, Any]]) -> int:
+    if not receipts:
+        return 0
+    receipt_rows = []
+    audit_rows = []
+    for receipt in receipts:
+        received_at = datetime.fromisoformat(receipt["received_at"]) if receipt.get("received_at") else datetime.now(timezone.utc)
+        receipt_rows.append({
+            "company_id": receipt["company_id"],
+            "wise_subscription_id": receipt.get("wise_subscription_id"),
+            "event_type": receipt.get("event_type"),
+            "status": receipt["status"],
+            "reason": receipt.get("reason"),
+            "raw": receipt.get("raw") or {},
+            "received_at": received_at,
+        })
+        audit_rows.append({
+            "company_id": receipt["company_id"],
+            "actor_user_id": None,
+            "action": f"wise.webhook.{receipt['status']}",
+            "entity_type": "webhook",
+            "entity_id": receipt.get("wise_subscription_id") or "unknown",
+            "metadata_json": {"event_type": receipt.get("event_type")},
+            "created_at": received_at,
+        })
+    db.execute(insert(WiseWebhookReceipt), receipt_rows)
+    db.execute(insert(AuditLog), audit_rows)
+    db.commit()
+    return len(receipt_rows)
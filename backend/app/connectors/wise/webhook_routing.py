@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+import redis
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.wise_encryption import wise_decrypt
+from app.models.models import IntegrationCredentialWise, WiseSettings, WiseWebhookSubscription
+from app.services.redis_client import get_redis
+
+
+@dataclass
+class WebhookRoute:
+    company_id: int
+    environment: str
+    secret: str | None
+
+
+# Keyed by (Wise subscription id, version); "" is for unsubscribed deliveries routed to the primary
+# company. Subscriptions and secrets change in the API and worker processes while webhooks are served
+# by wise-api, so invalidation bumps a Redis version that every process reads.
+webhook_route_cache = TTLCache(ttl_seconds=settings.wise_webhook_route_cache_ttl_seconds)
+ROUTES_VERSION_KEY = "wise:webhook_routes:version"
+
+
+def _routes_version() -> str | None:
+    try:
+        return get_redis().get(ROUTES_VERSION_KEY) or "0"
+    except redis.RedisError:
+        return None
+
+
+def _load_route(subscription_id: str) -> WebhookRoute | None:
+    db = SessionLocal()
+    try:
+        subscription = None
+        if subscription_id:
+            subscription = db.query(WiseWebhookSubscription).filter(
+                WiseWebhookSubscription.wise_subscription_id == subscription_id
+            ).first()
+        company_id = subscription.company_id if subscription else settings.primary_company_id
+        if not company_id:
+            return None
+        secret = subscription.secret_ref if subscription and subscription.secret_ref else None
+        if not secret:
+            env = subscription.wise_environment if subscription and subscription.wise_environment else "sandbox"
+            stored = db.query(WiseSettings).filter(
+                WiseSettings.company_id == company_id,
+                WiseSettings.wise_environment == env,
+            ).first()
+            if stored and stored.webhook_secret_encrypted:
+                secret = wise_decrypt(stored.webhook_secret_encrypted)
+        if subscription and subscription.wise_environment:
+            environment = subscription.wise_environment
+        else:
+            creds = db.query(IntegrationCredentialWise).filter(
+                IntegrationCredentialWise.company_id == company_id,
+            ).first()
+            environment = creds.wise_environment if creds else "sandbox"
+        return WebhookRoute(company_id=company_id, environment=environment, secret=secret)
+    finally:
+        db.close()
+
+
+def resolve_webhook_route(subscription_id: str) -> WebhookRoute | None:
+    version = _routes_version()
+    if version is None:
+        return _load_route(subscription_id)
+    return webhook_route_cache.get_or_load((subscription_id, version), lambda: _load_route(subscription_id))
+
+
+def invalidate_webhook_routes() -> int:
+    # Routes are keyed by subscription id, and any of them may fall back to a
+    # company's settings secret, so settings changes drop the whole cache.
+    try:
+        get_redis().incr(ROUTES_VERSION_KEY)
+    except redis.RedisError:
+        pass
+    return webhook_route_cache.invalidate()
@@ -14,7 +14,29 @@ class Settings(BaseSettings):
     openai_api_key: str = ""
     llm_model: str = "gpt-4o-mini"
     embedding_model: str = "text-embedding-3-small"
+    embedding_provider: str = "openai"
+    vector_search_ef_search: int = 100
+    vector_search_iterative_scan: str = "relaxed_order"
+    vector_search_concurrency: int = 4
+    document_search_mode: str = "hybrid"
+    hybrid_search_candidates: int = 50
+    hybrid_search_rrf_k: int = 60
+    query_embedding_cache_ttl_seconds: float = 900.0
+    query_embedding_cache_size: int = 2048
+    document_models_cache_ttl_seconds: float = 300.0
+    embedding_concurrency: int = 4
+    embedding_requests_per_second: float = 8.0
+    embedding_batch_max_tokens: int = 60000
+    embedding_batch_max_items: int = 512
+    embedding_max_retries: int = 3
+    embedding_retry_base_seconds: float = 1.0
     document_storage_path: str = "storage/documents"
+    document_ingest_batch_size: int = 256
+    document_parse_workers: int = 0
+    document_embed_workers: int = 4
+    document_pipeline_queue_size: int = 8
+    document_reindex_batch_size: int = 50
+    document_queue: str = "documents"
     shopify_url: str = ""
     shopify_access_token: str = ""
     shopify_use_graphql: bool = False
@@ -35,7 +57,32 @@ class Settings(BaseSettings):
     wise_public_key: str = ""
     wise_private_key: str = ""
     wise_api_token: str = ""
+    wise_credential_cache_ttl_seconds: int = 300
+    wise_transactions_max_pages: int = 50
+    wise_fetch_concurrency: int = 4
+    wise_rate_limit_per_second: float = 10.0
+    balance_history_retention_days: int = 90
+    wise_webhook_quiet_seconds: float = 5.0
+    wise_webhook_max_delay_seconds: float = 30.0
+    wise_webhook_route_cache_ttl_seconds: int = 300
+    wise_webhook_flush_seconds: float = 2.0
+    wise_webhook_flush_batch_size: int = 500
+    wise_retry_base_seconds: float = 5.0
+    wise_retry_max_seconds: float = 900.0
+    wise_retry_max_attempts: int = 6
+    wise_circuit_failure_threshold: int = 5
+    wise_circuit_window_seconds: float = 60.0
+    wise_circuit_cooldown_seconds: float = 30.0
+    wise_payment_concurrency: int = 8
     stripe_api_base: str = "http://stripe-api:8002"
+    stripe_ledger_backfill_days: int = 90
+    stripe_ledger_pending_lookback_days: int = 14
+    stripe_ledger_batch_size: int = 500
+    stripe_api_stream_read_timeout_seconds: int = 120
+    stripe_api_pool_size: int = 10
+    reconciliation_date_tolerance_days: int = 2
+    reconciliation_amount_tolerance_minor: int = 0
+    reconciliation_max_assignment_size: int = 40
     dify_external_kb_api_key: str = ""
 
     @field_validator("primary_company_id", mode="before")
@@ -1,4 +1,5 @@
 import base64
+from functools import lru_cache
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from app.core.config import settings
@@ -8,16 +9,26 @@ def _normalize_pem(value: str) -> bytes:
     return value.replace("\\n", "\n").encode("utf-8")
 
 
+@lru_cache(maxsize=4)
+def _parse_public_key(pem: str):
+    return serialization.load_pem_public_key(_normalize_pem(pem))
+
+
+@lru_cache(maxsize=4)
+def _parse_private_key(pem: str):
+    return serialization.load_pem_private_key(_normalize_pem(pem), password=None)
+
+
 def _load_public_key():
     if not settings.wise_public_key:
         raise ValueError("WISE_PUBLIC_KEY is not set")
-    return serialization.load_pem_public_key(_normalize_pem(settings.wise_public_key))
+    return _parse_public_key(settings.wise_public_key)
 
 
 def _load_private_key():
     if not settings.wise_private_key:
         raise ValueError("WISE_PRIVATE_KEY is not set")
-    return serialization.load_pem_private_key(_normalize_pem(settings.wise_private_key), password=None)
+    return _parse_private_key(settings.wise_private_key)
 
 
 def wise_encrypt(value: str) -> str:
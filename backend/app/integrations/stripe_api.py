@@ -0,0 +1,81 @@
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Any, Iterator
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.models import Integration, IntegrationType
+
+
+class StripeApiError(RuntimeError):
+    pass
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.stripe_api_pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# One keep-alive pool per process, shared by the API and the Celery jobs that call stripe-api.
+_session = _build_session()
+
+
+def stripe_integration(db: Session, company_id: int) -> Integration | None:
+    return db.query(Integration).filter(
+        Integration.company_id == company_id,
+        Integration.type == IntegrationType.stripe,
+    ).first()
+
+
+def _request_body(credentials: dict[str, Any], payload: dict[str, Any] | None) -> dict[str, Any]:
+    return {
+        "stripe_account": credentials.get("stripe_account"),
+        "publishable_key": credentials.get("publishable_key"),
+        "secret_key": credentials.get("secret_key"),
+    } | (payload or {})
+
+
+def stripe_api_post(path: str, credentials: dict[str, Any], payload: dict[str, Any] | None = None, timeout: int = 60) -> dict[str, Any]:
+    body = _request_body(credentials, payload)
+    try:
+        response = _session.post(f"{settings.stripe_api_base.rstrip('/')}{path}", json=body, timeout=timeout)
+        response.raise_for_status()
+    except requests.RequestException as exc:
+        detail = getattr(exc.response, "text", "") if getattr(exc, "response", None) else str(exc)
+        raise StripeApiError(detail) from exc
+    return response.json()
+
+
+def stripe_api_stream(path: str, credentials: dict[str, Any], payload: dict[str, Any] | None = None) -> Iterator[tuple[str, dict[str, Any]]]:
+    # Reads the NDJSON mode of stripe-api line by line; the read timeout applies per chunk,
+    # not to the whole pull.
+    try:
+        response = _session.post(
+            f"{settings.stripe_api_base.rstrip('/')}{path}",
+            params={"stream": "true"},
+            json=_request_body(credentials, payload),
+            stream=True,
+            timeout=(10, settings.stripe_api_stream_read_timeout_seconds),
+        )
+        response.raise_for_status()
+    except requests.RequestException as exc:
+        detail = getattr(exc.response, "text", "") if getattr(exc, "response", None) else str(exc)
+        raise StripeApiError(detail) from exc
+    with response:
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                message = json.loads(line)
+                kind = message.get("kind")
+                if kind == "summary":
+                    return
+                if kind == "error":
+                    raise StripeApiError(message.get("detail") or "Stripe stream failed")
+                yield kind, message["item"]
+        except requests.RequestException as exc:
+            raise StripeApiError(str(exc)) from exc
+    raise StripeApiError("Stripe stream ended without a summary")
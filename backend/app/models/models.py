@@ -1,11 +1,30 @@
 ﻿from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, JSON, Enum, Date
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, JSON, Enum, Date, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import UserDefinedType
 import enum
 from app.core.database import Base
 from pgvector.sqlalchemy import Vector
 
 
+class HalfVector(UserDefinedType):
+    # pgvector's half-precision type; used to cast 3072-dim vectors into an indexable form.
+    cache_ok = True
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def get_col_spec(self, **kw):
+        return f"HALFVEC({self.dim})"
+
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None:
+                return None
+            return "[" + ",".join(str(float(item)) for item in value) + "]"
+        return process
+
+
 class Role(enum.Enum):
     founder = "Founder"
     finance = "Finance"
@@ -90,14 +109,72 @@ class Integration(Base):
 
 class StripeMetric(Base):
     __tablename__ = "stripe_metrics"
+    __table_args__ = (
+        UniqueConstraint("company_id", "metric_type", "stripe_id", name="uq_stripe_metrics_company_type_stripe_id"),
+        Index("ix_stripe_metrics_company_txn_date", "company_id", "txn_date"),
+    )
 
     id = Column(Integer, primary_key=True)
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
     metric_type = Column(String, nullable=False)
+    stripe_id = Column(String)
+    txn_type = Column(String)
+    txn_date = Column(DateTime)
+    gross = Column(Float)
+    fee = Column(Float)
+    net = Column(Float)
+    currency = Column(String)
     payload = Column(JSON, nullable=False)
     created_at = Column(DateTime, default=utcnow, nullable=False)
 
 
+class StripeBalanceTransaction(Base):
+    __tablename__ = "stripe_balance_transactions"
+    __table_args__ = (
+        UniqueConstraint("company_id", "stripe_id", name="uq_stripe_balance_transactions_company_stripe_id"),
+        Index("ix_stripe_balance_transactions_company_created", "company_id", "created"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    stripe_account = Column(String, nullable=False, default="")
+    stripe_id = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    status = Column(String)
+    reporting_category = Column(String)
+    description = Column(String)
+    source_id = Column(String)
+    currency = Column(String, nullable=False)
+    gross_amount = Column(Float, default=0.0)
+    fee = Column(Float, default=0.0)
+    net_amount = Column(Float, default=0.0)
+    created = Column(DateTime, nullable=False)
+    available_on = Column(DateTime)
+    payment_intent_amount = Column(Float)
+    tax_amount = Column(Float)
+    customer_metadata = Column(JSON)
+    payout_status = Column(String)
+    payout_arrival_date = Column(DateTime)
+    payout_method = Column(String)
+    payout_type = Column(String)
+    synced_at = Column(DateTime, default=utcnow)
+
+
+class StripeSyncState(Base):
+    __tablename__ = "stripe_sync_state"
+    __table_args__ = (
+        UniqueConstraint("company_id", "stripe_account", name="uq_stripe_sync_state_company_account"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    stripe_account = Column(String, nullable=False, default="")
+    last_created = Column(DateTime)
+    last_balance_transaction_id = Column(String)
+    last_synced_at = Column(DateTime)
+    backfilled_from = Column(Date)
+
+
 class IntegrationCredentialWise(Base):
     __tablename__ = "integration_credentials_wise"
 
@@ -170,6 +247,9 @@ class WiseBalance(Base):
 
 class WiseTransactionRaw(Base):
     __tablename__ = "wise_transactions_raw"
+    __table_args__ = (
+        UniqueConstraint("company_id", "wise_transaction_id", name="uq_wise_transactions_company"),
+    )
 
     id = Column(Integer, primary_key=True)
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
@@ -242,6 +322,48 @@ class WiseBatch(Base):
     updated_at = Column(DateTime, default=utcnow)
 
 
+class WisePaymentRun(Base):
+    __tablename__ = "wise_payment_runs"
+    __table_args__ = (
+        UniqueConstraint("company_id", "idempotency_key", name="uq_wise_payment_runs_company_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
+    wise_environment = Column(String, nullable=False, default="sandbox")
+    status = Column(String, default="pending")
+    reference = Column(String)
+    idempotency_key = Column(String, nullable=False)
+    wise_batch_id = Column(String)
+    total_items = Column(Integer, default=0)
+    added_items = Column(Integer, default=0)
+    failed_items = Column(Integer, default=0)
+    error = Column(String)
+    created_by_user_id = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime, default=utcnow)
+    updated_at = Column(DateTime, default=utcnow)
+    funded_at = Column(DateTime)
+
+
+class WisePaymentRunItem(Base):
+    __tablename__ = "wise_payment_run_items"
+
+    id = Column(Integer, primary_key=True)
+    payment_run_id = Column(Integer, ForeignKey("wise_payment_runs.id"), nullable=False, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    bill_id = Column(Integer, ForeignKey("bills.id"))
+    payee_id = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+    currency = Column(String, nullable=False)
+    reference = Column(String)
+    idempotency_key = Column(String, nullable=False, unique=True)
+    status = Column(String, default="pending")
+    wise_transfer_id = Column(String)
+    error = Column(String)
+    raw = Column(JSON, default=dict)
+    updated_at = Column(DateTime, default=utcnow)
+
+
 class AuditLog(Base):
     __tablename__ = "audit_log"
 
@@ -412,6 +534,9 @@ class BankAccount(Base):
 
 class BankTransaction(Base):
     __tablename__ = "bank_transactions"
+    __table_args__ = (
+        UniqueConstraint("company_id", "provider", "provider_transaction_id", name="uq_bank_transactions_company_provider"),
+    )
 
     id = Column(Integer, primary_key=True)
     bank_account_id = Column(Integer, ForeignKey("bank_accounts.id"), nullable=False)
@@ -426,6 +551,27 @@ class BankTransaction(Base):
     raw_reference = Column(String)
 
 
+class ReconciliationMatch(Base):
+    __tablename__ = "reconciliation_matches"
+    __table_args__ = (
+        UniqueConstraint("company_id", "payout_source", "payout_ref", name="uq_reconciliation_matches_payout"),
+        UniqueConstraint("bank_transaction_id", name="uq_reconciliation_matches_bank_transaction"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    payout_source = Column(String, nullable=False)
+    payout_ref = Column(String, nullable=False)
+    bank_transaction_id = Column(Integer, ForeignKey("bank_transactions.id"), nullable=False)
+    amount = Column(Float, nullable=False)
+    bank_amount = Column(Float, nullable=False)
+    currency = Column(String, nullable=False)
+    payout_date = Column(Date, nullable=False)
+    posted_at = Column(Date, nullable=False)
+    method = Column(String, nullable=False)
+    matched_at = Column(DateTime, default=utcnow, nullable=False)
+
+
 class BankBalance(Base):
     __tablename__ = "bank_balances"
 
@@ -439,6 +585,20 @@ class BankBalance(Base):
     captured_at = Column(DateTime, nullable=False)
 
 
+class BankBalanceLatest(Base):
+    __tablename__ = "bank_balance_latest"
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
+    bank_account_id = Column(Integer, ForeignKey("bank_accounts.id"), nullable=False, unique=True)
+    provider = Column(String, default="manual")
+    provider_account_id = Column(String)
+    currency = Column(String, nullable=False)
+    balance = Column(Float, default=0.0)
+    captured_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=utcnow)
+
+
 class MarketingSpend(Base):
     __tablename__ = "marketing_spend"
 
@@ -507,10 +667,30 @@ class Document(Base):
 
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
+    __table_args__ = (
+        Index("ix_document_chunks_company_dim", "company_id", "embedding_dim"),
+    )
 
     id = Column(Integer, primary_key=True)
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
     company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
     chunk_index = Column(Integer, nullable=False)
     content = Column(String, nullable=False)
-    embedding = Column(Vector(3072), nullable=False)
+    # Stored at the model's native size; search casts to a fixed dimension so the
+    # partial HNSW index for that dimension applies (see migration 0024).
+    embedding = Column(Vector(), nullable=False)
+    embedding_dim = Column(Integer, nullable=False)
+
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+    __table_args__ = (
+        UniqueConstraint("company_id", "content_hash", "model", name="uq_embedding_cache_company_hash_model"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    model = Column(String, nullable=False)
+    embedding = Column(Vector(), nullable=False)
+    created_at = Column(DateTime, default=utcnow, nullable=False)
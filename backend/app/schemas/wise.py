@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class WiseSettingsOut(BaseModel):
@@ -16,3 +17,48 @@ class WiseSettingsUpdate(BaseModel):
     webhook_secret: str | None = None
     wise_api_token: str | None = None
     auth_mode: str | None = None
+
+
+class PaymentRunItemIn(BaseModel):
+    bill_id: int | None = None
+    payee_id: str
+    amount: float | None = None
+    currency: str
+    reference: str | None = None
+
+
+class PaymentRunCreate(BaseModel):
+    wise_environment: str = Field(default="sandbox", pattern="^(sandbox|production)$")
+    reference: str | None = None
+    idempotency_key: str | None = None
+    items: list[PaymentRunItemIn]
+
+
+class PaymentRunItemOut(BaseModel):
+    id: int
+    bill_id: int | None
+    payee_id: str
+    amount: float
+    currency: str
+    status: str
+    wise_transfer_id: str | None
+    error: str | None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class PaymentRunOut(BaseModel):
+    id: int
+    wise_environment: str
+    status: str
+    reference: str | None
+    wise_batch_id: str | None
+    total_items: int
+    added_items: int
+    failed_items: int
+    error: str | None
+    created_at: datetime | None
+    funded_at: datetime | None
+    items: list[PaymentRunItemOut] = []
+
+    model_config = ConfigDict(from_attributes=True)
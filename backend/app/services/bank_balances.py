@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from sqlalchemy import and_, delete, func, insert, select
+from sqlalchemy.orm import Session
+from app.models.models import BankBalance, BankBalanceLatest, WiseBalance
+from app.services.upserts import upsert_rows
+
+
+def record_bank_balances(db: Session, company_id: int, captures: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    if not captures:
+        return []
+    account_ids = {capture["bank_account_id"] for capture in captures}
+    latest = {
+        row.bank_account_id: row
+        for row in db.query(BankBalanceLatest).filter(
+            BankBalanceLatest.company_id == company_id,
+            BankBalanceLatest.bank_account_id.in_(account_ids),
+        ).all()
+    }
+    changed = []
+    for capture in captures:
+        current = latest.get(capture["bank_account_id"])
+        if current and current.balance == capture["balance"] and current.currency == capture["currency"]:
+            continue
+        changed.append(capture)
+    if not changed:
+        return []
+    rows = [{"company_id": company_id} | capture for capture in changed]
+    db.execute(insert(BankBalance), rows)
+    now = datetime.now(timezone.utc)
+    upsert_rows(
+        db,
+        BankBalanceLatest,
+        [row | {"updated_at": now} for row in rows],
+        conflict_columns=["bank_account_id"],
+        update_columns=["provider", "provider_account_id", "currency", "balance", "captured_at", "updated_at"],
+    )
+    return changed
+
+
+def _downsample_to_daily_close(db: Session, model, account_column, time_column, cutoff: datetime) -> int:
+    day = func.date(time_column)
+    closes = select(
+        model.company_id.label("company_id"),
+        account_column.label("account_id"),
+        func.max(time_column).label("close_at"),
+    ).where(time_column < cutoff).group_by(model.company_id, account_column, day).subquery()
+    keep_ids = select(func.max(model.id)).join(
+        closes,
+        and_(
+            model.company_id == closes.c.company_id,
+            account_column == closes.c.account_id,
+            time_column == closes.c.close_at,
+        ),
+    ).group_by(model.company_id, account_column, time_column)
+    result = db.execute(
+        delete(model)
+        .where(time_column < cutoff, model.id.not_in(keep_ids))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount or 0
+
+
+def downsample_balance_history(db: Session, older_than_days: int) -> dict[str, int]:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    counts = {
+        "bank_balances": _downsample_to_daily_close(db, BankBalance, BankBalance.bank_account_id, BankBalance.captured_at, cutoff),
+        "wise_balances": _downsample_to_daily_close(db, WiseBalance, WiseBalance.wise_balance_account_id, WiseBalance.timestamp, cutoff),
+    }
+    db.commit()
+    return counts
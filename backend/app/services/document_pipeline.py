@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.models import Document
+from app.services.documents import parse_document, set_document_progress, store_document_chunks
+
+
+def set_document_status(db: Session, document_id: int, status: str, **fields) -> None:
+    db.query(Document).filter(Document.id == document_id).update({"status": status, **fields})
+    db.commit()
+
+
+def embed_document(db: Session, document_id: int, chunks: Iterable[str]) -> int:
+    document = db.get(Document, document_id)
+    if not document:
+        raise ValueError("Document not found.")
+    set_document_status(db, document_id, "embedding")
+    count = store_document_chunks(db, document, chunks)
+    set_document_status(db, document_id, "indexed", indexed_chunks=count, indexed_at=datetime.now(timezone.utc))
+    return count
+
+
+def mark_document_failed(db: Session, document_id: int, exc: Exception) -> None:
+    db.rollback()
+    set_document_progress(document_id, None)
+    set_document_status(db, document_id, "error", error_message=str(exc))
+
+
+def _parse_executor(workers: int, documents: int) -> Executor:
+    # Celery's prefork children are daemonic and may not start processes of their own, so parsing
+    # falls back to threads there. Spawn keeps the embed threads' locks out of the children.
+    if documents < 2 or workers < 2 or multiprocessing.current_process().daemon:
+        return ThreadPoolExecutor(max_workers=workers)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def run_document_pipeline(bind, document_ids: list[int]) -> dict[str, int]:
+    with Session(bind=bind) as db:
+        jobs = db.query(Document.id, Document.storage_path, Document.file_type, Document.chunk_size).filter(
+            Document.id.in_(document_ids),
+        ).all()
+    summary = {"documents": len(jobs), "indexed": 0, "failed": 0, "chunks": 0}
+    if not jobs:
+        return summary
+    parse_workers = max(1, min(len(jobs), settings.document_parse_workers or os.cpu_count() or 1))
+    embed_workers = max(1, min(len(jobs), settings.document_embed_workers))
+    # Bounded hand-off: parsing stalls instead of piling up chunk lists when embedding falls behind.
+    parsed: queue.Queue = queue.Queue(maxsize=settings.document_pipeline_queue_size)
+    lock = threading.Lock()
+
+    def embed_stage() -> None:
+        with Session(bind=bind) as db:
+            while (item := parsed.get()) is not None:
+                document_id, chunks, error = item
+                try:
+                    if error is not None:
+                        raise error
+                    count = embed_document(db, document_id, chunks)
+                except Exception as exc:
+                    mark_document_failed(db, document_id, exc)
+                    outcome, count = "failed", 0
+                else:
+                    outcome = "indexed"
+                with lock:
+                    summary[outcome] += 1
+                    summary["chunks"] += count
+
+    threads = [threading.Thread(target=embed_stage, daemon=True) for _ in range(embed_workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        with _parse_executor(parse_workers, len(jobs)) as pool, Session(bind=bind) as db:
+            in_flight = {}
+
+            def hand_off(done) -> None:
+                for future in done:
+                    document_id = in_flight.pop(future)
+                    error = future.exception()
+                    parsed.put((document_id, None if error else future.result(), error))
+
+            for document_id, storage_path, file_type, chunk_size in jobs:
+                set_document_status(db, document_id, "parsing", error_message=None)
+                path = Path(settings.document_storage_path) / storage_path
+                in_flight[pool.submit(parse_document, path, file_type, chunk_size)] = document_id
+                if len(in_flight) >= parse_workers * 2:
+                    hand_off(wait(in_flight, return_when=FIRST_COMPLETED).done)
+            hand_off(wait(in_flight).done)
+    finally:
+        for _ in threads:
+            parsed.put(None)
+        for thread in threads:
+            thread.join()
+    return summary
@@ -1,101 +1,522 @@
 import csv
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Iterable
+from typing import Any, Iterable, Iterator
 from pypdf import PdfReader
 from docx import Document as DocxDocument
 from openpyxl import load_workbook
+from pgvector.sqlalchemy import Vector
+import redis
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import Float, and_, cast, func, insert, literal, literal_column, or_, select, text as sql_text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.models.models import Document, DocumentChunk
-from app.services.embeddings import embed_texts
+from app.models.models import Document, DocumentChunk, HalfVector
+from app.services.audit_log import log_event
+from app.services.embeddings import EmbeddingStats, embed_texts, embed_texts_cached
+from app.services.redis_client import get_redis
 
 
-def _read_pdf(path: Path) -> str:
+VECTOR_INDEX_MAX_DIM = 2000
+SEARCH_MODES = ("vector", "hybrid")
+SCORE_KEYS = ("distance", "text_rank", "rrf_score", "embedding_model")
+TEXT_SEARCH_CONFIG = "english"
+HNSW_ITERATIVE_SCANS = ("relaxed_order", "strict_order")
+HNSW_MAX_EF_SEARCH = 1000
+FILTERED_EF_SEARCH_FACTOR = 4
+# Generated column and GIN index from migration 0025. It is not mapped on DocumentChunk because
+# SQLite (used by the tests) cannot build a tsvector column.
+chunk_search_vector = literal_column("document_chunks.content_tsv", TSVECTOR)
+
+
+def _iter_pdf(path: Path) -> Iterator[str]:
     reader = PdfReader(str(path))
-    return "\n".join(page.extract_text() or "" for page in reader.pages)
+    for page in reader.pages:
+        yield page.extract_text() or ""
 
 
-def _read_docx(path: Path) -> str:
+def _iter_docx(path: Path) -> Iterator[str]:
     doc = DocxDocument(str(path))
-    return "\n".join(paragraph.text for paragraph in doc.paragraphs if paragraph.text)
+    for paragraph in doc.paragraphs:
+        if paragraph.text:
+            yield paragraph.text
 
 
-def _read_csv(path: Path) -> str:
-    rows = []
+def _iter_csv(path: Path) -> Iterator[str]:
     with path.open("r", encoding="utf-8", newline="") as handle:
         reader = csv.reader(handle)
         for row in reader:
-            rows.append(" | ".join(cell.strip() for cell in row if cell is not None))
-    return "\n".join(rows)
+            yield " | ".join(cell.strip() for cell in row if cell is not None)
+
+
+def _iter_xlsx(path: Path) -> Iterator[str]:
+    # Read-only mode streams rows from the sheet XML instead of building every cell up front.
+    workbook = load_workbook(filename=str(path), read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield f"# Sheet: {sheet.title}"
+            for row in sheet.iter_rows(values_only=True):
+                cells = [str(cell).strip() for cell in row if cell is not None]
+                if cells:
+                    yield " | ".join(cells)
+    finally:
+        workbook.close()
+
+
+EXTRACTORS = {
+    "pdf": _iter_pdf,
+    "docx": _iter_docx,
+    "csv": _iter_csv,
+    "xlsx": _iter_xlsx,
+}
 
 
-def _read_xlsx(path: Path) -> str:
-    workbook = load_workbook(filename=str(path), data_only=True)
-    lines = []
-    for sheet in workbook.worksheets:
-        lines.append(f"# Sheet: {sheet.title}")
-        for row in sheet.iter_rows(values_only=True):
-            cells = [str(cell).strip() for cell in row if cell is not None]
-            if cells:
-                lines.append(" | ".join(cells))
-    return "\n".join(lines)
+def iter_text(path: Path, file_type: str) -> Iterator[str]:
+    extractor = EXTRACTORS.get(file_type.lower())
+    if extractor is None:
+        raise ValueError(f"Unsupported document type: {file_type}")
+    return extractor(path)
 
 
 def extract_text(path: Path, file_type: str) -> str:
-    file_type = file_type.lower()
-    if file_type == "pdf":
-        return _read_pdf(path)
-    if file_type == "docx":
-        return _read_docx(path)
-    if file_type == "csv":
-        return _read_csv(path)
-    if file_type == "xlsx":
-        return _read_xlsx(path)
-    raise ValueError(f"Unsupported document type: {file_type}")
+    return "\n".join(iter_text(path, file_type))
+
+
+def iter_chunks(pieces: Iterable[str], max_chars: int = 1200, overlap: int = 200) -> Iterator[str]:
+    # Same windows as slicing the whitespace-collapsed text of all pieces joined together, but only
+    # the current window is held in memory.
+    step = max(1, max_chars - overlap)
+    window = ""
+    for piece in pieces:
+        words = piece.split()
+        if not words:
+            continue
+        cleaned = " ".join(words)
+        window = f"{window} {cleaned}" if window else cleaned
+        while len(window) > max_chars:
+            yield window[:max_chars]
+            window = window[step:]
+    if window:
+        yield window
 
 
 def chunk_text(text: str, max_chars: int = 1200, overlap: int = 200) -> Iterable[str]:
-    cleaned = " ".join(text.split())
-    if not cleaned:
-        return []
-    chunks = []
-    start = 0
-    length = len(cleaned)
-    while start < length:
-        end = min(start + max_chars, length)
-        chunks.append(cleaned[start:end])
-        if end == length:
-            break
-        start = max(0, end - overlap)
-    return chunks
+    return list(iter_chunks([text], max_chars=max_chars, overlap=overlap))
+
+
+def _batched(items: Iterable[str], size: int) -> Iterator[list[str]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_document(path: Path, file_type: str, chunk_size: int | None = None) -> Iterator[str]:
+    return iter_chunks(iter_text(path, file_type), max_chars=chunk_size or 1200)
+
+
+def parse_document(path: Path, file_type: str, chunk_size: int | None = None) -> list[str]:
+    # CPU-bound half of ingestion; module-level and DB-free so it can run in a process pool.
+    return list(stream_document(path, file_type, chunk_size))
+
+
+def document_path(document: Document) -> Path:
+    return Path(settings.document_storage_path) / document.storage_path
+
+
+def _progress_key(document_id: int) -> str:
+    return f"documents:progress:{document_id}"
+
+
+def set_document_progress(document_id: int, chunks: int | None) -> None:
+    # Progress lives in Redis so the chunk rows can stay in one transaction until the document is done.
+    try:
+        if chunks is None:
+            get_redis().delete(_progress_key(document_id))
+        else:
+            get_redis().set(_progress_key(document_id), chunks, ex=24 * 60 * 60)
+    except redis.RedisError:
+        pass
+
+
+def document_progress(document_ids: list[int]) -> dict[int, int]:
+    if not document_ids:
+        return {}
+    try:
+        values = get_redis().mget([_progress_key(document_id) for document_id in document_ids])
+    except redis.RedisError:
+        return {}
+    return {document_id: int(value) for document_id, value in zip(document_ids, values) if value is not None}
+
+
+def store_document_chunks(db: Session, document: Document, chunks: Iterable[str]) -> int:
+    document_id, company_id, model = document.id, document.company_id, document.embedding_model
+    stats = EmbeddingStats()
+    count = 0
+    for batch in _batched(chunks, settings.document_ingest_batch_size):
+        embeddings, _ = embed_texts_cached(db, company_id, batch, model=model, stats=stats)
+        if count == 0:
+            db.query(DocumentChunk).filter(
+                DocumentChunk.document_id == document_id,
+                DocumentChunk.company_id == company_id,
+            ).delete()
+        # Core executemany instead of one ORM object per chunk: no unit-of-work bookkeeping for
+        # thousands of vector rows, and nothing held in the session between groups.
+        db.execute(insert(DocumentChunk), [
+            {
+                "document_id": document_id,
+                "company_id": company_id,
+                "chunk_index": count + offset,
+                "content": chunk,
+                "embedding": embedding,
+                "embedding_dim": len(embedding),
+            }
+            for offset, (chunk, embedding) in enumerate(zip(batch, embeddings))
+        ])
+        count += len(batch)
+        set_document_progress(document_id, count)
+    if not count:
+        return 0
+    # Old chunks are replaced in a single commit; a failure part way leaves the previous index intact.
+    db.query(Document).filter(Document.id == document_id).update({"indexed_chunks": count})
+    db.commit()
+    set_document_progress(document_id, None)
+    log_event(db, company_id, "document.embedded", "document", str(document_id), None, stats.as_dict())
+    return count
 
 
 def ingest_document(db: Session, document_id: int) -> int:
     document = db.query(Document).filter(Document.id == document_id).first()
     if not document:
         raise ValueError("Document not found.")
-    file_path = Path(settings.document_storage_path) / document.storage_path
-    text = extract_text(file_path, document.file_type)
-    max_chars = document.chunk_size or 1200
-    chunks = list(chunk_text(text, max_chars=max_chars))
-    if not chunks:
-        return 0
-    embeddings = embed_texts(chunks, model=document.embedding_model)
-    db.query(DocumentChunk).filter(
-        DocumentChunk.document_id == document.id,
-        DocumentChunk.company_id == document.company_id,
-    ).delete()
-    for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-        db.add(DocumentChunk(
-            document_id=document.id,
-            company_id=document.company_id,
-            chunk_index=idx,
-            content=chunk,
-            embedding=embedding,
-        ))
-    db.commit()
-    return len(chunks)
+    return store_document_chunks(db, document, stream_document(document_path(document), document.file_type, document.chunk_size))
+
+
+def chunk_distance(dims: int, query_vector: list[float]):
+    # Matches the expressions of the partial HNSW indexes from migration 0024: vector(n) up to
+    # pgvector's 2000-dim index limit, halfvec(n) above it.
+    if dims > VECTOR_INDEX_MAX_DIM:
+        return cast(DocumentChunk.embedding, HalfVector(dims)).op("<=>", return_type=Float)(
+            cast(literal(query_vector, type_=HalfVector(dims)), HalfVector(dims))
+        )
+    return cast(DocumentChunk.embedding, Vector(dims)).cosine_distance(query_vector)
+
+
+query_embedding_cache = TTLCache(
+    ttl_seconds=settings.query_embedding_cache_ttl_seconds,
+    maxsize=settings.query_embedding_cache_size,
+)
+document_models_cache = TTLCache(ttl_seconds=settings.document_models_cache_ttl_seconds)
+
+
+def _version_key(company_id: int) -> str:
+    return f"documents:version:{company_id}"
+
+
+def bump_document_version(company_id: int) -> None:
+    # Called whenever a company's document set changes; other processes see the new version in Redis.
+    document_models_cache.invalidate(lambda key: key[0] == company_id)
+    try:
+        get_redis().incr(_version_key(company_id))
+    except redis.RedisError:
+        pass
+
+
+def _document_version(company_id: int) -> str | None:
+    try:
+        return get_redis().get(_version_key(company_id)) or "0"
+    except redis.RedisError:
+        return None
+
+
+def company_embedding_models(db: Session, company_id: int) -> list[str | None]:
+    def load() -> list[str | None]:
+        rows = db.query(Document.embedding_model).filter(Document.company_id == company_id).distinct().all()
+        return [row[0] for row in rows] or [settings.embedding_model]
+
+    version = _document_version(company_id)
+    if version is None:
+        return load()
+    return document_models_cache.get_or_load((company_id, version), load)
+
+
+def query_embedding(company_id: int, query: str, model: str) -> list[float]:
+    # Per company, like the chunk embedding cache: a shared entry would let one tenant tell from the
+    # response time whether another has asked the same question.
+    normalized = " ".join(query.split())
+    return query_embedding_cache.get_or_load(
+        (company_id, model, normalized),
+        lambda: embed_texts([normalized], model=model)[0],
+    )
+
+
+def text_search_query(query: str):
+    # OR the terms together: AND-ing every word of a question would rarely match a chunk.
+    # ts_rank_cd still puts chunks that contain more of them first.
+    terms = re.findall(r"\w[\w.\-/]*", query)
+    return func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, " or ".join(terms))
+
+
+def supports_text_search(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _match_row(chunk: DocumentChunk, document: Document, **scores) -> dict:
+    return {
+        "document_id": document.id,
+        "filename": document.filename,
+        "file_type": document.file_type,
+        "content": chunk.content,
+        "chunk_id": chunk.id,
+        **scores,
+    }
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    where: Any = None
+    max_distance: float | None = None
+    min_text_rank: float | None = None
+
+
+METADATA_COLUMNS = {
+    "file_type": Document.file_type,
+    "filetype": Document.file_type,
+    "filename": Document.filename,
+    "file_name": Document.filename,
+    "document_id": Document.id,
+    "doc_id": Document.id,
+    "uploaded_at": Document.uploaded_at,
+    "upload_date": Document.uploaded_at,
+    "uploaded": Document.uploaded_at,
+}
+
+
+def _date_bounds(value: Any) -> tuple[datetime, datetime, bool]:
+    # (start, end, whole_day): a bare date covers the whole day, a timestamp is a single instant.
+    text = str(value).strip()
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError as exc:
+        raise ValueError(f"Invalid date in metadata condition: {text}") from exc
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if len(text) == 10:
+        return parsed, parsed + timedelta(days=1), True
+    return parsed, parsed, False
+
+
+def _date_clause(column, comparison: str, value: Any):
+    if comparison == "between":
+        values = value if isinstance(value, (list, tuple)) else str(value).split(",")
+        if len(values) != 2:
+            raise ValueError("between needs a start and an end date.")
+        start, _, _ = _date_bounds(values[0])
+        _, end, whole_day = _date_bounds(values[1])
+        return (column >= start) & ((column < end) if whole_day else (column <= end))
+    start, end, whole_day = _date_bounds(value)
+    if comparison in {"before", "<"}:
+        return column < start
+    if comparison in {"after", ">"}:
+        return column >= end if whole_day else column > end
+    if comparison in {"<=", "≤"}:
+        return column < end if whole_day else column <= end
+    if comparison in {">=", "≥"}:
+        return column >= start
+    if comparison in {"is", "=", "equals", "eq"}:
+        return ((column >= start) & (column < end)) if whole_day else column == start
+    return None
+
+
+def _document_id_clause(comparison: str, value: Any):
+    values = value if isinstance(value, (list, tuple)) else str(value).split(",")
+    ids = [int(item) for item in (str(item).strip() for item in values) if item.isdigit()]
+    if comparison in {"is", "=", "equals", "eq", "contains", "in"}:
+        return Document.id.in_(ids)
+    if comparison in {"is not", "≠", "!=", "not in", "not contains"}:
+        return Document.id.not_in(ids)
+    return None
+
+
+def _text_clause(column, comparison: str, value: Any):
+    value = str(value if value is not None else "")
+    if comparison in {"is", "=", "equals", "eq"}:
+        return column == value
+    if comparison in {"is not", "≠", "!="}:
+        return column != value
+    if comparison in {"contains", "in"}:
+        return column.contains(value, autoescape=True)
+    if comparison == "not contains":
+        return ~column.contains(value, autoescape=True)
+    if comparison == "start with":
+        return column.startswith(value, autoescape=True)
+    if comparison == "end with":
+        return column.endswith(value, autoescape=True)
+    if comparison == "empty":
+        return or_(column.is_(None), column == "")
+    if comparison == "not empty":
+        return and_(column.is_not(None), column != "")
+    return None
+
+
+def metadata_filter(conditions: list[dict[str, Any]] | None, logical_operator: str | None = None):
+    # Dify metadata conditions as a WHERE clause on Document. Unknown fields and operators are
+    # ignored, as they were when the filter ran in Python.
+    clauses = []
+    for condition in conditions or []:
+        names = condition.get("name") or ""
+        comparison = str(condition.get("comparison_operator") or "").lower()
+        value = condition.get("value")
+        for name in names if isinstance(names, list) else [names]:
+            column = METADATA_COLUMNS.get(str(name).lower())
+            if column is None:
+                continue
+            if column is Document.uploaded_at:
+                clause = _date_clause(column, comparison, value)
+            elif column is Document.id:
+                clause = _document_id_clause(comparison, value)
+            else:
+                clause = _text_clause(column, comparison, value)
+            if clause is not None:
+                clauses.append(clause)
+            break
+    if not clauses:
+        return None
+    return or_(*clauses) if str(logical_operator or "and").lower() == "or" else and_(*clauses)
+
+
+def _hnsw_settings(limit: int, filtered: bool) -> list[str]:
+    # HNSW filters by company (and any metadata, distance or term filter) after the graph walk, so a
+    # plain scan can return fewer than `limit` rows. Iterative scans (pgvector 0.8+) keep walking until
+    # the limit is met; relaxed order is fine because the matches are re-sorted by distance afterwards.
+    # Older pgvector ("off") gets a proportionally wider candidate list instead.
+    ef_search = max(int(settings.vector_search_ef_search), limit)
+    iterative_scan = settings.vector_search_iterative_scan
+    if iterative_scan in HNSW_ITERATIVE_SCANS:
+        return [f"SET LOCAL hnsw.ef_search = {ef_search}", f"SET LOCAL hnsw.iterative_scan = {iterative_scan}"]
+    if filtered:
+        ef_search = min(HNSW_MAX_EF_SEARCH, ef_search * FILTERED_EF_SEARCH_FACTOR)
+    return [f"SET LOCAL hnsw.ef_search = {ef_search}"]
+
+
+def _search_model(
+    db: Session,
+    company_id: int,
+    model: str | None,
+    query: str,
+    limit: int,
+    prefilter: bool = False,
+    filters: SearchFilters = SearchFilters(),
+) -> list[dict]:
+    query_model = model or settings.embedding_model
+    query_vector = query_embedding(company_id, query, query_model)
+    dims = len(query_vector)
+    if db.get_bind().dialect.name == "postgresql":
+        filtered = prefilter or filters.where is not None or filters.max_distance is not None
+        for statement in _hnsw_settings(limit, filtered):
+            db.execute(sql_text(statement))
+    distance = chunk_distance(dims, query_vector)
+    stmt = (
+        select(DocumentChunk, Document, distance)
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .where(Document.company_id == company_id)
+        .where(DocumentChunk.company_id == company_id)
+        .where(DocumentChunk.embedding_dim == dims)
+        .where(Document.embedding_model.is_(None) if model is None else Document.embedding_model == model)
+        .order_by(distance)
+        .limit(limit)
+    )
+    if prefilter:
+        # Only chunks sharing a term with the query are ranked by distance; the GIN index finds them.
+        stmt = stmt.where(chunk_search_vector.op("@@")(text_search_query(query)))
+    if filters.where is not None:
+        stmt = stmt.where(filters.where)
+    if filters.max_distance is not None:
+        stmt = stmt.where(distance <= filters.max_distance)
+    return [
+        _match_row(chunk, document, embedding_model=query_model, distance=float(distance_value or 0))
+        for chunk, document, distance_value in db.execute(stmt).all()
+    ]
+
+
+def _search_text(
+    db: Session,
+    company_id: int,
+    query: str,
+    limit: int,
+    filters: SearchFilters = SearchFilters(),
+) -> list[dict]:
+    tsquery = text_search_query(query)
+    # Normalization 32 maps the rank into 0..1.
+    rank = func.ts_rank_cd(chunk_search_vector, tsquery, 32)
+    stmt = (
+        select(DocumentChunk, Document, rank)
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .where(Document.company_id == company_id)
+        .where(DocumentChunk.company_id == company_id)
+        .where(chunk_search_vector.op("@@")(tsquery))
+        .order_by(rank.desc(), DocumentChunk.id)
+        .limit(limit)
+    )
+    if filters.where is not None:
+        stmt = stmt.where(filters.where)
+    if filters.min_text_rank is not None:
+        stmt = stmt.where(rank >= filters.min_text_rank)
+    return [
+        _match_row(chunk, document, text_rank=float(rank_value or 0))
+        for chunk, document, rank_value in db.execute(stmt).all()
+    ]
+
+
+def _in_session(bind, search, *args) -> list[dict]:
+    with Session(bind=bind) as session:
+        return search(session, *args)
+
+
+def _search_vectors(
+    db: Session,
+    company_id: int,
+    query: str,
+    limit: int,
+    prefilter: bool,
+    filters: SearchFilters,
+) -> list[dict]:
+    models = company_embedding_models(db, company_id)
+    if len(models) == 1:
+        matches = _search_model(db, company_id, models[0], query, limit, prefilter, filters)
+    else:
+        # Each model needs its own query embedding and vector scan; run them side by side,
+        # one session per thread.
+        bind = db.get_bind()
+        with ThreadPoolExecutor(max_workers=min(len(models), settings.vector_search_concurrency)) as pool:
+            results = pool.map(
+                lambda model: _in_session(bind, _search_model, company_id, model, query, limit, prefilter, filters),
+                models,
+            )
+            matches = [match for model_matches in results for match in model_matches]
+    matches.sort(key=lambda item: item["distance"])
+    if prefilter and not matches:
+        # No chunk shares a term with the query; a purely semantic match is better than nothing.
+        return _search_vectors(db, company_id, query, limit, False, filters)
+    return matches[:limit]
+
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], k: int = 60) -> list[dict]:
+    fused: dict[int, dict] = {}
+    for ranking in rankings:
+        for position, match in enumerate(ranking, start=1):
+            entry = fused.setdefault(match["chunk_id"], {"rrf_score": 0.0})
+            entry.update({key: value for key, value in match.items() if key not in entry})
+            entry["rrf_score"] += 1.0 / (k + position)
+    return sorted(fused.values(), key=lambda item: item["rrf_score"], reverse=True)
 
 
 def search_document_chunks(
@@ -104,43 +525,29 @@ def search_document_chunks(
     query: str,
     limit: int = 5,
     include_score: bool = False,
+    mode: str | None = None,
+    prefilter: bool = False,
+    filters: SearchFilters | None = None,
 ) -> list[dict]:
-    model_rows = db.query(Document.embedding_model).filter(
-        Document.company_id == company_id
-    ).distinct().all()
-    models = [row[0] for row in model_rows] or [settings.embedding_model]
-    all_matches: list[dict] = []
-    for model in models:
-        query_model = model or settings.embedding_model
-        embeddings = embed_texts([query], model=query_model)
-        query_vector = embeddings[0]
-        distance = DocumentChunk.embedding.cosine_distance(query_vector)
-        stmt = (
-            select(DocumentChunk, Document, distance)
-            .join(Document, Document.id == DocumentChunk.document_id)
-            .where(Document.company_id == company_id)
-            .where(DocumentChunk.company_id == company_id)
-            .where(Document.embedding_model == model)
-            .order_by(distance)
-            .limit(limit)
-        )
-        results = db.execute(stmt).all()
-        for chunk, document, distance_value in results:
-            record = {
-                "document_id": document.id,
-                "filename": document.filename,
-                "file_type": document.file_type,
-                "content": chunk.content,
-                "chunk_id": chunk.id,
-                "embedding_model": query_model,
-                "distance": float(distance_value or 0),
-            }
-            all_matches.append(record)
-    all_matches.sort(key=lambda item: item["distance"])
-    trimmed = all_matches[:limit]
+    mode = mode or settings.document_search_mode
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unsupported search mode: {mode}")
+    filters = filters or SearchFilters()
+    text_search = supports_text_search(db)
+    prefilter = prefilter and text_search
+    if mode == "hybrid" and text_search:
+        candidates = max(limit, settings.hybrid_search_candidates)
+        bind = db.get_bind()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            lexical = pool.submit(_in_session, bind, _search_text, company_id, query, candidates, filters)
+            semantic = _search_vectors(db, company_id, query, candidates, prefilter, filters)
+            ranked = reciprocal_rank_fusion([semantic, lexical.result()], k=settings.hybrid_search_rrf_k)
+    else:
+        ranked = _search_vectors(db, company_id, query, limit, prefilter, filters)
+    trimmed = ranked[:limit]
     if include_score:
         return trimmed
     for item in trimmed:
-        item.pop("distance", None)
-        item.pop("embedding_model", None)
+        for key in SCORE_KEYS:
+            item.pop(key, None)
     return trimmed
@@ -1,22 +1,255 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Protocol
+import openai
 from openai import OpenAI
+from sqlalchemy.orm import Session
 from app.core.config import settings
+from app.models.models import EmbeddingCache, utcnow
+from app.services.rate_limit import rate_limiter
+from app.services.upserts import upsert_rows
 
 
-EMBEDDING_DIM = 3072
+EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+DEFAULT_EMBEDDING_DIM = 1536
 
 
-def _pad_embedding(embedding: list[float]) -> list[float]:
-    if len(embedding) >= EMBEDDING_DIM:
-        return embedding[:EMBEDDING_DIM]
-    return embedding + [0.0] * (EMBEDDING_DIM - len(embedding))
+def embedding_dimensions(model: str | None) -> int:
+    return EMBEDDING_DIMENSIONS.get(model or settings.embedding_model, DEFAULT_EMBEDDING_DIM)
 
 
-def embed_texts(texts: list[str], model: str | None = None) -> list[list[float]]:
-    if not settings.openai_api_key:
-        raise ValueError("OPENAI_API_KEY not configured for embeddings.")
-    client = OpenAI(api_key=settings.openai_api_key)
-    response = client.embeddings.create(
-        model=model or settings.embedding_model,
-        input=texts,
-    )
-    return [_pad_embedding(item.embedding) for item in response.data]
+def estimate_tokens(text: str) -> int:
+    # No tokenizer dependency: three characters per token over-counts English and stays
+    # safe for number-heavy financial text, which tokenizes denser.
+    return max(1, math.ceil(len(text) / 3))
+
+
+class EmbeddingProvider(Protocol):
+    name: str
+
+    def embed(self, texts: list[str], model: str) -> list[list[float]]:
+        ...
+
+    def is_retryable(self, exc: Exception) -> bool:
+        ...
+
+
+class OpenAIEmbeddingProvider:
+    name = "openai"
+
+    def __init__(self):
+        self._client: OpenAI | None = None
+        self._lock = threading.Lock()
+
+    def client(self) -> OpenAI:
+        if not settings.openai_api_key:
+            raise ValueError("OPENAI_API_KEY not configured for embeddings.")
+        with self._lock:
+            if self._client is None:
+                # Retries are handled per batch by embed_texts.
+                self._client = OpenAI(api_key=settings.openai_api_key, max_retries=0)
+            return self._client
+
+    def embed(self, texts: list[str], model: str) -> list[list[float]]:
+        response = self.client().embeddings.create(model=model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def is_retryable(self, exc: Exception) -> bool:
+        return isinstance(exc, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+
+
+class HashEmbeddingProvider:
+    # Deterministic local stand-in for tests and benchmarks: hashed bag of words, L2-normalized,
+    # so texts sharing words still land close together. Produces the model's native dimensions.
+    name = "hash"
+
+    def __init__(self, dimensions: int | None = None):
+        self.dimensions = dimensions
+
+    def embed(self, texts: list[str], model: str) -> list[list[float]]:
+        dimensions = self.dimensions or embedding_dimensions(model)
+        vectors = []
+        for text in texts:
+            vector = [0.0] * dimensions
+            for token in re.findall(r"\w+", text.lower()):
+                digest = hashlib.blake2b(f"{model}:{token}".encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "big") % dimensions
+                vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            vectors.append([value / norm for value in vector])
+        return vectors
+
+    def is_retryable(self, exc: Exception) -> bool:
+        return False
+
+
+EMBEDDING_PROVIDERS = {
+    "openai": OpenAIEmbeddingProvider,
+    "hash": HashEmbeddingProvider,
+}
+_providers: dict[str, EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(name: str | None = None) -> EmbeddingProvider:
+    name = name or settings.embedding_provider
+    with _providers_lock:
+        if name not in _providers:
+            if name not in EMBEDDING_PROVIDERS:
+                raise ValueError(f"Unknown embedding provider: {name}")
+            _providers[name] = EMBEDDING_PROVIDERS[name]()
+        return _providers[name]
+
+
+def batch_texts(texts: list[str], max_tokens: int, max_items: int) -> list[tuple[int, int]]:
+    # Consecutive (start, end) slices, each within the token budget and item cap.
+    batches = []
+    start = 0
+    tokens = 0
+    for position, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if position > start and (tokens + cost > max_tokens or position - start >= max_items):
+            batches.append((start, position))
+            start = position
+            tokens = 0
+        tokens += cost
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+@dataclass
+class EmbeddingStats:
+    texts: int = 0
+    cached: int = 0
+    tokens: int = 0
+    batches: int = 0
+    retried_batches: int = 0
+    seconds: float = 0.0
+    provider: str = ""
+
+    def as_dict(self) -> dict:
+        return {
+            "texts": self.texts,
+            "cached": self.cached,
+            "embedded": self.texts - self.cached,
+            "tokens": self.tokens,
+            "batches": self.batches,
+            "retried_batches": self.retried_batches,
+            "seconds": round(self.seconds, 3),
+            "texts_per_second": round((self.texts - self.cached) / self.seconds, 1) if self.seconds else None,
+            "provider": self.provider,
+        }
+
+
+def embed_texts(
+    texts: list[str],
+    model: str | None = None,
+    provider: EmbeddingProvider | None = None,
+    stats: EmbeddingStats | None = None,
+) -> list[list[float]]:
+    if not texts:
+        return []
+    model = model or settings.embedding_model
+    provider = provider or get_embedding_provider()
+    stats = stats if stats is not None else EmbeddingStats()
+    stats.provider = provider.name
+    limiter = rate_limiter(("embeddings", provider.name), settings.embedding_requests_per_second)
+    pending = batch_texts(texts, settings.embedding_batch_max_tokens, settings.embedding_batch_max_items)
+    stats.batches += len(pending)
+    stats.tokens += sum(estimate_tokens(text) for text in texts)
+    results: list[list[float] | None] = [None] * len(texts)
+
+    def run(batch: tuple[int, int]) -> tuple[int, int]:
+        limiter.acquire()
+        start, end = batch
+        vectors = provider.embed(texts[start:end], model)
+        if len(vectors) != end - start:
+            raise ValueError("Embedding provider returned a different number of vectors than inputs.")
+        results[start:end] = [list(vector) for vector in vectors]
+        return batch
+
+    started = time.perf_counter()
+    workers = max(1, min(settings.embedding_concurrency, len(pending)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for attempt in range(settings.embedding_max_retries + 1):
+            futures = {pool.submit(run, batch): batch for batch in pending}
+            failed = []
+            for future, batch in futures.items():
+                exc = future.exception()
+                if exc is None:
+                    continue
+                if not provider.is_retryable(exc) or attempt == settings.embedding_max_retries:
+                    raise exc
+                failed.append(batch)
+            if not failed:
+                break
+            # Only the batches that failed go round again.
+            stats.retried_batches += len(failed)
+            pending = failed
+            time.sleep(settings.embedding_retry_base_seconds * 2 ** attempt)
+    stats.seconds += time.perf_counter() - started
+    stats.texts += len(texts)
+    return results
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embed_texts_cached(
+    db: Session,
+    company_id: int,
+    texts: list[str],
+    model: str | None = None,
+    batch_size: int = 500,
+    stats: EmbeddingStats | None = None,
+) -> tuple[list[list[float]], EmbeddingStats]:
+    # Scoped per company: a shared cache would let one tenant learn from hit latency or the `cached`
+    # stat whether another tenant has ingested the same text.
+    model = model or settings.embedding_model
+    stats = stats if stats is not None else EmbeddingStats()
+    texts_before = stats.texts
+    hashes = [content_hash(text) for text in texts]
+    unique = list(dict.fromkeys(hashes))
+    cached: dict[str, list[float]] = {}
+    for offset in range(0, len(unique), batch_size):
+        rows = db.query(EmbeddingCache.content_hash, EmbeddingCache.embedding).filter(
+            EmbeddingCache.company_id == company_id,
+            EmbeddingCache.model == model,
+            EmbeddingCache.content_hash.in_(unique[offset:offset + batch_size]),
+        ).all()
+        cached.update({row_hash: list(embedding) for row_hash, embedding in rows})
+    misses = {text_hash: text for text_hash, text in zip(hashes, texts) if text_hash not in cached}
+    if misses:
+        vectors = embed_texts(list(misses.values()), model=model, stats=stats)
+        fresh = dict(zip(misses, vectors))
+        now = utcnow()
+        upsert_rows(
+            db,
+            EmbeddingCache,
+            [
+                {
+                    "company_id": company_id,
+                    "content_hash": text_hash,
+                    "model": model,
+                    "embedding": vector,
+                    "created_at": now,
+                }
+                for text_hash, vector in fresh.items()
+            ],
+            conflict_columns=["company_id", "content_hash", "model"],
+        )
+        cached.update(fresh)
+    stats.cached += len(texts) - len(misses)
+    stats.texts = texts_before + len(texts)
+    return [cached[text_hash] for text_hash in hashes], stats
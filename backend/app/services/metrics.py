@@ -1,9 +1,8 @@
 ﻿from datetime import datetime, timedelta, timezone, date
 from typing import Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from app.models.models import (
-    Order, Refund, InventorySnapshot, Bill, BankAccount, BankBalance, MetricRun, Alert, Company, MarketingSpend
+    Order, Refund, InventorySnapshot, Bill, BankAccount, BankBalanceLatest, MetricRun, Alert, Company, MarketingSpend
 )
 from app.services.finance_brain import FinanceBrain
 from app.services.completeness import compute_confidence
@@ -45,19 +44,11 @@ def _company_currency(db: Session, company_id: int) -> str:
 
 
 def _cash_position_by_provider(db: Session, company_id: int) -> dict[str, float]:
-    latest = db.query(
-        BankBalance.bank_account_id,
-        func.max(BankBalance.captured_at).label("max_captured"),
-    ).filter(
-        BankBalance.company_id == company_id
-    ).group_by(BankBalance.bank_account_id).subquery()
-    balances = db.query(BankBalance, BankAccount).join(
-        latest,
-        (BankBalance.bank_account_id == latest.c.bank_account_id) &
-        (BankBalance.captured_at == latest.c.max_captured),
-    ).join(
+    balances = db.query(BankBalanceLatest, BankAccount).join(
         BankAccount,
-        BankBalance.bank_account_id == BankAccount.id,
+        BankBalanceLatest.bank_account_id == BankAccount.id,
+    ).filter(
+        BankBalanceLatest.company_id == company_id
     ).all()
     totals: dict[str, float] = {}
     if balances:
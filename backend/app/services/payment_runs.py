@@ -0,0 +1,245 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import Any
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.connectors.wise.client import WiseApiError, WiseRetryableError
+from app.connectors.wise.connector import WiseConnector
+from app.models.models import Bill, WisePaymentRun, WisePaymentRunItem
+from app.services.audit_log import log_event
+
+
+COMMIT_EVERY = 50
+
+
+def _sha256(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def payment_item_key(
+    company_id: int,
+    run_key: str,
+    bill_id: int | None,
+    payee_id: str,
+    amount: float,
+    currency: str,
+    occurrence: int = 0,
+) -> str:
+    # occurrence tells apart identical payments without a bill (same payee, amount and currency).
+    base = f"{company_id}:{run_key}:{bill_id}:{payee_id}:{amount:.2f}:{currency.upper()}"
+    return _sha256(f"{base}:{occurrence}" if occurrence else base)
+
+
+def _bills_already_paying(db: Session, company_id: int, bill_ids: set[int]) -> list[int]:
+    # A bill sitting in a live run (pending, adding, funding or funded) must not be sent again;
+    # items Wise rejected leave the bill payable.
+    rows = db.query(WisePaymentRunItem.bill_id).join(
+        WisePaymentRun, WisePaymentRun.id == WisePaymentRunItem.payment_run_id,
+    ).filter(
+        WisePaymentRunItem.company_id == company_id,
+        WisePaymentRunItem.bill_id.in_(bill_ids),
+        WisePaymentRunItem.status != "failed",
+        WisePaymentRun.status != "failed",
+    ).distinct().all()
+    return sorted(bill_id for (bill_id,) in rows)
+
+
+def create_payment_run(
+    db: Session,
+    company_id: int,
+    environment: str,
+    items: list[dict[str, Any]],
+    reference: str | None = None,
+    actor_user_id: int | None = None,
+    idempotency_key: str | None = None,
+) -> WisePaymentRun:
+    if not items:
+        raise ValueError("Payment run has no items")
+    listed_bill_ids = [item["bill_id"] for item in items if item.get("bill_id")]
+    bill_ids = set(listed_bill_ids)
+    if len(bill_ids) != len(listed_bill_ids):
+        raise ValueError("A bill can only appear once in a payment run")
+    bills = {
+        bill.id: bill
+        for bill in db.query(Bill).filter(Bill.company_id == company_id, Bill.id.in_(bill_ids)).all()
+    } if bill_ids else {}
+    missing = bill_ids - set(bills)
+    if missing:
+        raise ValueError(f"Unknown bills: {sorted(missing)}")
+    normalized = []
+    for item in items:
+        bill = bills.get(item.get("bill_id"))
+        amount = item.get("amount") if item.get("amount") is not None else (bill.amount if bill else None)
+        if not amount or amount <= 0:
+            raise ValueError("Each payment needs a positive amount")
+        normalized.append({
+            "bill_id": bill.id if bill else None,
+            "payee_id": str(item["payee_id"]),
+            "amount": round(float(amount), 2),
+            "currency": str(item["currency"]).upper(),
+            "reference": item.get("reference") or (f"Bill {bill.id} {bill.vendor}" if bill else reference),
+        })
+    run_key = idempotency_key or _sha256(json.dumps(
+        {"reference": reference, "environment": environment, "items": sorted(normalized, key=json.dumps)},
+        sort_keys=True,
+    ))
+    existing = db.query(WisePaymentRun).filter(
+        WisePaymentRun.company_id == company_id,
+        WisePaymentRun.idempotency_key == run_key,
+    ).first()
+    if existing:
+        return existing
+    paid = sorted(bill.id for bill in bills.values() if bill.status == "paid")
+    if paid:
+        raise ValueError(f"Bills already paid: {paid}")
+    in_flight = _bills_already_paying(db, company_id, bill_ids) if bill_ids else []
+    if in_flight:
+        raise ValueError(f"Bills already in another payment run: {in_flight}")
+    now = datetime.now(timezone.utc)
+    run = WisePaymentRun(
+        company_id=company_id,
+        wise_environment=environment,
+        status="pending",
+        reference=reference,
+        idempotency_key=run_key,
+        total_items=len(normalized),
+        added_items=0,
+        failed_items=0,
+        created_by_user_id=actor_user_id,
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(run)
+    db.flush()
+    occurrences: dict[tuple, int] = {}
+    for item in normalized:
+        identity = (item["bill_id"], item["payee_id"], item["amount"], item["currency"])
+        occurrence = occurrences.get(identity, 0)
+        occurrences[identity] = occurrence + 1
+        db.add(WisePaymentRunItem(
+            payment_run_id=run.id,
+            company_id=company_id,
+            idempotency_key=payment_item_key(company_id, run_key, *identity, occurrence=occurrence),
+            status="pending",
+            updated_at=now,
+            **item,
+        ))
+    db.commit()
+    log_event(db, company_id, "wise.payment_run.created", "wise_payment_run", str(run.id), actor_user_id, {"items": len(normalized)})
+    return run
+
+
+def _refresh_counts(db: Session, run: WisePaymentRun) -> dict[str, int]:
+    db.flush()
+    counts = dict(
+        db.query(WisePaymentRunItem.status, func.count(WisePaymentRunItem.id))
+        .filter(WisePaymentRunItem.payment_run_id == run.id)
+        .group_by(WisePaymentRunItem.status)
+        .all()
+    )
+    run.added_items = counts.get("added", 0)
+    run.failed_items = counts.get("failed", 0)
+    run.updated_at = datetime.now(timezone.utc)
+    return counts
+
+
+def execute_payment_run(db: Session, run_id: int) -> WisePaymentRun:
+    # Safe to call repeatedly: the batch group is created once, items already added
+    # are skipped, and every Wise call carries a deterministic idempotency key.
+    run = db.get(WisePaymentRun, run_id)
+    if run is None:
+        raise ValueError("Payment run not found")
+    if run.status in {"funded", "failed"}:
+        return run
+    connector = WiseConnector(db, run.company_id, run.wise_environment, run.created_by_user_id)
+    if not run.wise_batch_id:
+        batch = connector.create_batch_group(run.reference or f"Payment run {run.id}", _sha256(f"{run.idempotency_key}:batch"))
+        run.wise_batch_id = batch.wise_batch_id
+        run.status = "adding"
+        run.updated_at = datetime.now(timezone.utc)
+        db.commit()
+
+    items = {
+        item.idempotency_key: item
+        for item in db.query(WisePaymentRunItem).filter(
+            WisePaymentRunItem.payment_run_id == run.id,
+            WisePaymentRunItem.status == "pending",
+        ).all()
+    }
+    retryable: list[WiseRetryableError] = []
+    written = 0
+
+    def on_result(key: str, response: Any, error: Exception | None) -> None:
+        nonlocal written
+        item = items[key]
+        item.updated_at = datetime.now(timezone.utc)
+        if error is None:
+            item.status = "added"
+            item.wise_transfer_id = str(response.get("id")) if isinstance(response, dict) and response.get("id") else None
+            item.raw = response if isinstance(response, dict) else {"response": response}
+            item.error = None
+        elif isinstance(error, WiseRetryableError):
+            retryable.append(error)
+            item.error = str(error)
+        else:
+            item.status = "failed"
+            item.error = str(error)
+        written += 1
+        if written % COMMIT_EVERY == 0:
+            db.commit()
+
+    if items:
+        connector.add_transfers_to_batch(
+            run.wise_batch_id,
+            {
+                key: {
+                    "targetAccount": item.payee_id,
+                    "sourceAmount": item.amount,
+                    "sourceCurrency": item.currency,
+                    "reference": item.reference,
+                }
+                for key, item in items.items()
+            },
+            on_result,
+        )
+    counts = _refresh_counts(db, run)
+    db.commit()
+    log_event(
+        db, run.company_id, "wise.payment_run.items_added", "wise_payment_run", str(run.id), run.created_by_user_id,
+        {"added": run.added_items, "failed": run.failed_items, "pending": counts.get("pending", 0)},
+    )
+    if counts.get("pending"):
+        run.error = f"{counts['pending']} payments pending retry"
+        db.commit()
+        raise max(retryable, key=lambda exc: exc.retry_after or 0) if retryable else WiseRetryableError(run.error)
+    if not run.added_items:
+        run.status = "failed"
+        run.error = "No payments could be added to the batch"
+        db.commit()
+        return run
+
+    run.status = "funding"
+    db.commit()
+    try:
+        connector.fund_batch(run.wise_batch_id, _sha256(f"{run.idempotency_key}:fund"))
+    except WiseApiError as exc:
+        run.error = str(exc)
+        db.commit()
+        raise
+    now = datetime.now(timezone.utc)
+    run.status = "funded"
+    run.error = None
+    run.funded_at = now
+    run.updated_at = now
+    paid_bill_ids = [
+        bill_id for (bill_id,) in db.query(WisePaymentRunItem.bill_id).filter(
+            WisePaymentRunItem.payment_run_id == run.id,
+            WisePaymentRunItem.status == "added",
+            WisePaymentRunItem.bill_id.isnot(None),
+        ).all()
+    ]
+    if paid_bill_ids:
+        db.query(Bill).filter(Bill.id.in_(paid_bill_ids)).update({Bill.status: "paid"}, synchronize_session=False)
+    db.commit()
+    return run
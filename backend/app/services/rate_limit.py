@@ -0,0 +1,41 @@
+import threading
+import time
+from typing import Hashable
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: int | None = None):
+        self.rate_per_second = rate_per_second
+        self.capacity = float(burst or max(1, int(rate_per_second)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        if self.rate_per_second <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate_per_second
+            time.sleep(delay)
+            waited += delay
+
+
+_buckets: dict[Hashable, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def rate_limiter(key: Hashable, rate_per_second: float, burst: int | None = None) -> TokenBucket:
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None or bucket.rate_per_second != rate_per_second:
+            bucket = TokenBucket(rate_per_second, burst)
+            _buckets[key] = bucket
+        return bucket
@@ -0,0 +1,286 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.models import (
+    BankAccount,
+    BankTransaction,
+    Company,
+    Payout,
+    ReconciliationMatch,
+    StripeBalanceTransaction,
+    utcnow,
+)
+from app.services.stripe_ledger import PAYOUT_REVERSAL_TYPES
+
+
+UNMATCHED_COST = 10**9
+
+
+@dataclass(frozen=True)
+class PayoutRecord:
+    source: str
+    ref: str
+    amount: float
+    currency: str
+    day: date
+    expected_lag_days: int
+
+
+@dataclass(frozen=True)
+class BankCredit:
+    id: int
+    amount: float
+    currency: str
+    day: date
+
+
+def _minor(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+def _day(value: date | datetime) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _unmatched_payouts(db: Session, company_id: int) -> list[PayoutRecord]:
+    matched = set(db.query(ReconciliationMatch.payout_source, ReconciliationMatch.payout_ref).filter(
+        ReconciliationMatch.company_id == company_id,
+    ).all())
+    company = db.get(Company, company_id)
+    company_currency = (company.currency if company else None) or "USD"
+    settlement_lag = company.settlement_lag_days if company and company.settlement_lag_days is not None else 2
+    records = [
+        PayoutRecord("payout", str(payout_id), amount, company_currency.upper(), payout_date, settlement_lag)
+        for payout_id, amount, payout_date in db.query(Payout.id, Payout.amount, Payout.payout_date).filter(
+            Payout.company_id == company_id,
+            Payout.amount > 0,
+        )
+    ]
+    # Stripe books a payout as a negative balance transaction; the payout's arrival date is when the
+    # bank sees it. Failed or cancelled payouts never arrive.
+    reversed_payouts = select(StripeBalanceTransaction.source_id).where(
+        StripeBalanceTransaction.company_id == company_id,
+        StripeBalanceTransaction.type.in_(PAYOUT_REVERSAL_TYPES),
+        StripeBalanceTransaction.source_id.is_not(None),
+    )
+    records += [
+        PayoutRecord("stripe", stripe_id, -gross, currency.upper(), _day(arrival_date or available_on or created), 0)
+        for stripe_id, gross, currency, arrival_date, available_on, created in db.query(
+            StripeBalanceTransaction.stripe_id,
+            StripeBalanceTransaction.gross_amount,
+            StripeBalanceTransaction.currency,
+            StripeBalanceTransaction.payout_arrival_date,
+            StripeBalanceTransaction.available_on,
+            StripeBalanceTransaction.created,
+        ).filter(
+            StripeBalanceTransaction.company_id == company_id,
+            StripeBalanceTransaction.type == "payout",
+            StripeBalanceTransaction.gross_amount < 0,
+            or_(
+                StripeBalanceTransaction.payout_status.is_(None),
+                StripeBalanceTransaction.payout_status.not_in(("failed", "canceled")),
+            ),
+            or_(
+                StripeBalanceTransaction.source_id.is_(None),
+                StripeBalanceTransaction.source_id.not_in(reversed_payouts),
+            ),
+        )
+    ]
+    return [record for record in records if (record.source, record.ref) not in matched]
+
+
+def _unmatched_credits(db: Session, company_id: int, start: date, end: date) -> list[BankCredit]:
+    matched_ids = select(ReconciliationMatch.bank_transaction_id).where(ReconciliationMatch.company_id == company_id)
+    rows = db.query(
+        BankTransaction.id,
+        BankTransaction.amount,
+        func.coalesce(BankTransaction.currency, BankAccount.currency),
+        BankTransaction.posted_at,
+    ).join(BankAccount, BankAccount.id == BankTransaction.bank_account_id).filter(
+        BankTransaction.company_id == company_id,
+        BankTransaction.amount > 0,
+        BankTransaction.posted_at >= start,
+        BankTransaction.posted_at <= end,
+        BankTransaction.id.not_in(matched_ids),
+    )
+    return [BankCredit(row_id, amount, (currency or "USD").upper(), posted_at) for row_id, amount, currency, posted_at in rows]
+
+
+def _candidates(
+    payouts: list[PayoutRecord],
+    credits: list[BankCredit],
+    date_tolerance_days: int,
+    amount_tolerance_minor: int,
+) -> dict[int, list[tuple[int, int]]]:
+    index: dict[tuple[int, str, date], list[int]] = defaultdict(list)
+    for position, credit in enumerate(credits):
+        index[(_minor(credit.amount), credit.currency, credit.day)].append(position)
+    # Cost orders by distance from the expected settlement day first, then by amount difference.
+    day_weight = 2 * amount_tolerance_minor + 1
+    edges: dict[int, list[tuple[int, int]]] = {}
+    for position, payout in enumerate(payouts):
+        minor = _minor(payout.amount)
+        found = []
+        for shift in range(-date_tolerance_days, date_tolerance_days + 1):
+            day = payout.day + timedelta(days=payout.expected_lag_days + shift)
+            for delta in range(-amount_tolerance_minor, amount_tolerance_minor + 1):
+                for credit_position in index.get((minor + delta, payout.currency, day), ()):
+                    found.append((credit_position, abs(shift) * day_weight + abs(delta)))
+        if found:
+            edges[position] = found
+    return edges
+
+
+def _components(edges: dict[int, list[tuple[int, int]]]) -> list[tuple[list[int], list[int]]]:
+    parent: dict[tuple[str, int], tuple[str, int]] = {}
+
+    def find(node):
+        root = node
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for payout_position, found in edges.items():
+        for credit_position, _ in found:
+            parent[find(("p", payout_position))] = find(("c", credit_position))
+    groups: dict[tuple[str, int], tuple[list[int], list[int]]] = defaultdict(lambda: ([], []))
+    for node in list(parent):
+        kind, position = node
+        groups[find(node)][0 if kind == "p" else 1].append(position)
+    return list(groups.values())
+
+
+def assign(cost: list[list[int]]) -> list[tuple[int, int]]:
+    # Hungarian method (potentials form) on a rectangular matrix; returns (row, column) pairs.
+    transposed = len(cost) > len(cost[0])
+    if transposed:
+        cost = [list(column) for column in zip(*cost)]
+    n, m = len(cost), len(cost[0])
+    u = [0] * (n + 1)
+    v = [0] * (m + 1)
+    owner = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for row in range(1, n + 1):
+        owner[0] = row
+        column = 0
+        best = [float("inf")] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[column] = True
+            current_row = owner[column]
+            delta = float("inf")
+            next_column = 0
+            for j in range(1, m + 1):
+                if used[j]:
+                    continue
+                reduced = cost[current_row - 1][j - 1] - u[current_row] - v[j]
+                if reduced < best[j]:
+                    best[j] = reduced
+                    way[j] = column
+                if best[j] < delta:
+                    delta = best[j]
+                    next_column = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    best[j] -= delta
+            column = next_column
+            if owner[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+    pairs = [(owner[j] - 1, j - 1) for j in range(1, m + 1) if owner[j]]
+    return [(j, i) for i, j in pairs] if transposed else pairs
+
+
+def _match(edges: dict[int, list[tuple[int, int]]], max_assignment_size: int) -> list[tuple[int, int, str]]:
+    matches = []
+    for payout_positions, credit_positions in _components(edges):
+        if len(payout_positions) == 1 and len(credit_positions) == 1:
+            matches.append((payout_positions[0], credit_positions[0], "exact"))
+            continue
+        component_edges = [
+            (edge_cost, payout_position, credit_position)
+            for payout_position in payout_positions
+            for credit_position, edge_cost in edges[payout_position]
+        ]
+        if len(payout_positions) * len(credit_positions) > max_assignment_size ** 2:
+            # Long runs of equal amounts chain into one big component; cheapest-edge-first keeps it near linear.
+            taken_payouts, taken_credits = set(), set()
+            for _, payout_position, credit_position in sorted(component_edges):
+                if payout_position in taken_payouts or credit_position in taken_credits:
+                    continue
+                taken_payouts.add(payout_position)
+                taken_credits.add(credit_position)
+                matches.append((payout_position, credit_position, "greedy"))
+            continue
+        rows = {position: row for row, position in enumerate(payout_positions)}
+        columns = {position: column for column, position in enumerate(credit_positions)}
+        cost = [[UNMATCHED_COST] * len(credit_positions) for _ in payout_positions]
+        for edge_cost, payout_position, credit_position in component_edges:
+            row, column = rows[payout_position], columns[credit_position]
+            cost[row][column] = min(cost[row][column], edge_cost)
+        for row, column in assign(cost):
+            if cost[row][column] < UNMATCHED_COST:
+                matches.append((payout_positions[row], credit_positions[column], "assignment"))
+    return matches
+
+
+def reconcile_payouts(db: Session, company_id: int) -> dict[str, Any]:
+    tolerance = settings.reconciliation_date_tolerance_days
+    payouts = _unmatched_payouts(db, company_id)
+    if not payouts:
+        return {"payouts": 0, "matched": 0, "methods": {}, "unmatched": []}
+    start = min(payout.day + timedelta(days=payout.expected_lag_days) for payout in payouts) - timedelta(days=tolerance)
+    end = max(payout.day + timedelta(days=payout.expected_lag_days) for payout in payouts) + timedelta(days=tolerance)
+    credits = _unmatched_credits(db, company_id, start, end)
+    edges = _candidates(payouts, credits, tolerance, settings.reconciliation_amount_tolerance_minor)
+    matches = _match(edges, settings.reconciliation_max_assignment_size)
+    now = utcnow()
+    db.add_all([
+        ReconciliationMatch(
+            company_id=company_id,
+            payout_source=payouts[payout_position].source,
+            payout_ref=payouts[payout_position].ref,
+            bank_transaction_id=credits[credit_position].id,
+            amount=payouts[payout_position].amount,
+            bank_amount=credits[credit_position].amount,
+            currency=payouts[payout_position].currency,
+            payout_date=payouts[payout_position].day,
+            posted_at=credits[credit_position].day,
+            method=method,
+            matched_at=now,
+        )
+        for payout_position, credit_position, method in matches
+    ])
+    db.commit()
+    matched_positions = {payout_position for payout_position, _, _ in matches}
+    methods: dict[str, int] = defaultdict(int)
+    for _, _, method in matches:
+        methods[method] += 1
+    return {
+        "payouts": len(payouts),
+        "matched": len(matches),
+        "methods": dict(methods),
+        "unmatched": [
+            {
+                "source": payout.source,
+                "ref": payout.ref,
+                "amount": payout.amount,
+                "currency": payout.currency,
+                "date": payout.day.isoformat(),
+            }
+            for position, payout in enumerate(payouts)
+            if position not in matched_positions
+        ],
+    }
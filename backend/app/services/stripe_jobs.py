@@ -0,0 +1,128 @@
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Callable
+from sqlalchemy.orm import Session
+from app.integrations.stripe_api import stripe_api_stream, stripe_integration
+from app.models.models import Integration, IntegrationType, SyncRun, utcnow
+from app.services.audit_log import log_event
+from app.services.stripe_ledger import ledger_balance_payouts, ledger_true_net_margin, sync_stripe_ledger
+from app.services.stripe_metrics import store_metrics
+from app.services.sync_runs import finish_sync_run, start_sync_run
+
+
+def _credentials(integration: Integration | None) -> dict[str, Any]:
+    return integration.credentials if integration else {}
+
+
+def _sync_ledger(db: Session, company_id: int, params: dict[str, Any]) -> dict[str, Any]:
+    integration = stripe_integration(db, company_id)
+    start_date = params.get("start_date")
+    counts = sync_stripe_ledger(
+        db,
+        company_id,
+        _credentials(integration),
+        params.get("limit"),
+        backfill_from=date.fromisoformat(start_date) if start_date else None,
+    )
+    if integration:
+        integration.last_sync_at = utcnow()
+        db.commit()
+    return counts
+
+
+def _revenue(db: Session, company_id: int, params: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    integration = stripe_integration(db, company_id)
+    # Fold the stream into per-currency totals as it arrives rather than holding every item.
+    totals: dict[str, dict[str, Any]] = {}
+    count = 0
+    for _, item in stripe_api_stream("/sync/revenue", _credentials(integration)):
+        currency = (item.get("currency") or "").upper()
+        entry = totals.setdefault(currency, {
+            "currency": currency, "count": 0, "amount_gross": 0.0, "fee": 0.0, "amount_net": 0.0,
+        })
+        entry["count"] += 1
+        for key in ("amount_gross", "fee", "amount_net"):
+            entry[key] += float(item.get(key) or 0)
+        count += 1
+    if not integration:
+        db.add(Integration(
+            company_id=company_id,
+            type=IntegrationType.stripe,
+            status="connected",
+            credentials={},
+            last_sync_at=utcnow(),
+        ))
+    else:
+        integration.status = "connected"
+        integration.last_sync_at = utcnow()
+    db.commit()
+    for entry in totals.values():
+        for key in ("amount_gross", "fee", "amount_net"):
+            entry[key] = round(entry[key], 2)
+    return {"totals": sorted(totals.values(), key=lambda entry: entry["currency"]), "count": count}, {"revenue": count}
+
+
+def _balance_payouts(db: Session, company_id: int, params: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    fetched = _sync_ledger(db, company_id, params)["fetched"]
+    result = ledger_balance_payouts(db, company_id, params.get("start_date"), params.get("end_date"))
+    return result, {
+        "fetched": fetched,
+        "balance_transactions": result["balance_count"],
+        "payouts": result["payout_count"],
+    }
+
+
+def _true_net_margin(db: Session, company_id: int, params: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    fetched = _sync_ledger(db, company_id, params)["fetched"]
+    items = ledger_true_net_margin(db, company_id, params.get("start_date"), params.get("end_date"))
+    return {"items": items, "count": len(items)}, {"fetched": fetched, "items": len(items)}
+
+
+def _store_true_net_margin(db: Session, company_id: int, params: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    fetched = _sync_ledger(db, company_id, params)["fetched"]
+    items = ledger_true_net_margin(db, company_id, params.get("start_date"), params.get("end_date"))
+    stored = store_metrics(db, company_id, items)
+    db.commit()
+    return {"stored": stored, "count": len(items)}, {"fetched": fetched, "items": len(items), "stored": stored}
+
+
+STRIPE_JOBS: dict[str, Callable[[Session, int, dict[str, Any]], tuple[dict[str, Any], dict[str, Any]]]] = {
+    "revenue": _revenue,
+    "balance_payouts": _balance_payouts,
+    "true_net_margin": _true_net_margin,
+    "store_true_net_margin": _store_true_net_margin,
+}
+
+
+def queue_stripe_job(db: Session, company_id: int, kind: str, trace_id: str) -> SyncRun:
+    if kind not in STRIPE_JOBS:
+        raise ValueError(f"Unknown Stripe job: {kind}")
+    account = _credentials(stripe_integration(db, company_id)).get("stripe_account") or "default"
+    return start_sync_run(db, company_id, "stripe", account, trace_id, status="queued", counts={"job": kind})
+
+
+def run_stripe_job(db: Session, run_id: int, kind: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
+    run = db.get(SyncRun, run_id)
+    if run is None:
+        raise ValueError("Sync run not found")
+    company_id = run.company_id
+    now = datetime.now(timezone.utc)
+    queued_at = run.started_at.replace(tzinfo=timezone.utc) if run.started_at.tzinfo is None else run.started_at
+    # started_at moves to the moment a worker picks the job up; the queue wait is kept in counts.
+    run.status = "running"
+    run.started_at = now
+    db.commit()
+    timings = {"job": kind, "queued_ms": int((now - queued_at).total_seconds() * 1000)}
+    started = time.perf_counter()
+    try:
+        result, counts = STRIPE_JOBS[kind](db, company_id, params or {})
+    except Exception as exc:
+        db.rollback()
+        timings["duration_ms"] = int((time.perf_counter() - started) * 1000)
+        finish_sync_run(db, run_id, "failed", timings, str(exc))
+        log_event(db, company_id, "stripe.sync.failed", "sync_run", str(run_id), None, {"job": kind, "error": str(exc)})
+        raise
+    timings["duration_ms"] = int((time.perf_counter() - started) * 1000)
+    finish_sync_run(db, run_id, "success", timings | counts)
+    log_event(db, company_id, "stripe.sync.completed", "sync_run", str(run_id), None, timings | counts)
+    return result
@@ -0,0 +1,260 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Any
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.integrations.stripe_api import stripe_api_stream
+from app.models.models import StripeBalanceTransaction, StripeSyncState
+from app.services.upserts import upsert_rows
+
+
+LEDGER_UPDATE_COLUMNS = [
+    "status",
+    "reporting_category",
+    "description",
+    "available_on",
+    "payment_intent_amount",
+    "tax_amount",
+    "customer_metadata",
+    "payout_status",
+    "payout_arrival_date",
+    "payout_method",
+    "payout_type",
+    "synced_at",
+]
+PAYOUT_REVERSAL_TYPES = ("payout_failure", "payout_cancel")
+# A payout keeps changing (in transit, then paid or failed) after its balance transaction is available.
+PAYOUT_OPEN_STATUSES = ("pending", "in_transit")
+
+
+def _utc(value: datetime | None) -> datetime | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _parse(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    return _utc(datetime.fromisoformat(value.replace("Z", "+00:00")))
+
+
+def _ledger_row(company_id: int, account: str, item: dict[str, Any], synced_at: datetime) -> dict[str, Any]:
+    return {
+        "company_id": company_id,
+        "stripe_account": account,
+        "stripe_id": item["id"],
+        "type": item.get("type") or "unknown",
+        "status": item.get("status"),
+        "reporting_category": item.get("reporting_category"),
+        "description": item.get("description"),
+        "source_id": item.get("source_id"),
+        "currency": item.get("currency") or "",
+        "gross_amount": item.get("gross_amount") or 0.0,
+        "fee": item.get("stripe_fee") or 0.0,
+        "net_amount": item.get("net_amount") or 0.0,
+        "created": _parse(item["date"]),
+        "available_on": _parse(item.get("available_on")),
+        "payment_intent_amount": item.get("payment_intent_amount"),
+        "tax_amount": item.get("tax_amount"),
+        "customer_metadata": item.get("customer_metadata"),
+        "payout_status": item.get("payout_status"),
+        "payout_arrival_date": _parse(item.get("payout_arrival_date")),
+        "payout_method": item.get("payout_method"),
+        "payout_type": item.get("payout_type"),
+        "synced_at": synced_at,
+    }
+
+
+def _sync_start(db: Session, company_id: int, account: str, state: StripeSyncState) -> datetime | None:
+    last_created = _utc(state.last_created)
+    if last_created is None:
+        return None
+    # Balance transactions only change while pending, and payouts until they are paid or failed, so
+    # re-list from the oldest row still open.
+    oldest_pending = db.query(func.min(StripeBalanceTransaction.created)).filter(
+        StripeBalanceTransaction.company_id == company_id,
+        StripeBalanceTransaction.stripe_account == account,
+        or_(
+            StripeBalanceTransaction.status == "pending",
+            and_(
+                StripeBalanceTransaction.type == "payout",
+                StripeBalanceTransaction.payout_status.in_(PAYOUT_OPEN_STATUSES),
+            ),
+        ),
+        StripeBalanceTransaction.created >= last_created - timedelta(days=settings.stripe_ledger_pending_lookback_days),
+    ).scalar()
+    oldest_pending = _utc(oldest_pending)
+    return min(last_created, oldest_pending) if oldest_pending else last_created
+
+
+def _stream_into_ledger(
+    db: Session,
+    company_id: int,
+    account: str,
+    credentials: dict[str, Any],
+    payload: dict[str, Any],
+    synced_at: datetime,
+) -> tuple[int, tuple[datetime, str] | None]:
+    fetched = 0
+    newest: tuple[datetime, str] | None = None
+    batch: list[dict[str, Any]] = []
+
+    def flush() -> None:
+        upsert_rows(db, StripeBalanceTransaction, batch, ["company_id", "stripe_id"], LEDGER_UPDATE_COLUMNS)
+        db.commit()
+        batch.clear()
+
+    for _, item in stripe_api_stream("/sync/balance-transactions", credentials, payload):
+        row = _ledger_row(company_id, account, item, synced_at)
+        batch.append(row)
+        fetched += 1
+        if newest is None or (row["created"], row["stripe_id"]) > newest:
+            newest = (row["created"], row["stripe_id"])
+        if len(batch) >= settings.stripe_ledger_batch_size:
+            flush()
+    flush()
+    return fetched, newest
+
+
+def sync_stripe_ledger(
+    db: Session,
+    company_id: int,
+    credentials: dict[str, Any],
+    page_size: int | None = None,
+    backfill_from: date | None = None,
+) -> dict[str, Any]:
+    account = credentials.get("stripe_account") or ""
+    state = db.query(StripeSyncState).filter(
+        StripeSyncState.company_id == company_id,
+        StripeSyncState.stripe_account == account,
+    ).first()
+    if not state:
+        state = StripeSyncState(company_id=company_id, stripe_account=account)
+        db.add(state)
+    since = _sync_start(db, company_id, account, state)
+    payload: dict[str, Any] = {"limit": page_size}
+    if since:
+        payload["created_after"] = int(since.timestamp())
+    else:
+        default_start = date.today() - timedelta(days=settings.stripe_ledger_backfill_days)
+        start = min(default_start, backfill_from) if backfill_from else default_start
+        payload["start_date"] = start.isoformat()
+        state.backfilled_from = start
+    synced_at = datetime.now(timezone.utc)
+    fetched, newest = _stream_into_ledger(db, company_id, account, credentials, payload, synced_at)
+    backfilled = 0
+    covered_from = state.backfilled_from or date.today()
+    if backfill_from and backfill_from < covered_from:
+        # Reports asked for a range older than the ledger holds: fetch just the missing stretch.
+        backfilled, _ = _stream_into_ledger(db, company_id, account, credentials, {
+            "limit": page_size,
+            "start_date": backfill_from.isoformat(),
+            "end_date": covered_from.isoformat(),
+        }, synced_at)
+        state.backfilled_from = backfill_from
+    # Stripe lists newest first, so the mark only moves once the whole stream has been stored.
+    if newest and (not state.last_created or newest[0] >= _utc(state.last_created)):
+        state.last_created, state.last_balance_transaction_id = newest
+    state.last_synced_at = synced_at
+    db.commit()
+    return {"fetched": fetched + backfilled, "backfilled": backfilled, "since": since.isoformat() if since else None}
+
+
+def _window(start_date: str | None, end_date: str | None, default_days: int) -> tuple[datetime, datetime]:
+    end = (
+        datetime.combine(date.fromisoformat(end_date), datetime.max.time()).replace(tzinfo=timezone.utc)
+        if end_date else datetime.now(timezone.utc)
+    )
+    start = (
+        datetime.combine(date.fromisoformat(start_date), datetime.min.time()).replace(tzinfo=timezone.utc)
+        if start_date else end - timedelta(days=default_days)
+    )
+    return (start, end) if start <= end else (end, start)
+
+
+def _ledger_rows(db: Session, company_id: int, start_date: str | None, end_date: str | None, default_days: int):
+    start, end = _window(start_date, end_date, default_days)
+    return db.query(StripeBalanceTransaction).filter(
+        StripeBalanceTransaction.company_id == company_id,
+        StripeBalanceTransaction.created >= start,
+        StripeBalanceTransaction.created <= end,
+    ).order_by(StripeBalanceTransaction.created.desc(), StripeBalanceTransaction.stripe_id.desc())
+
+
+def _iso(value: datetime | None) -> str | None:
+    return _utc(value).isoformat() if value else None
+
+
+def ledger_true_net_margin(db: Session, company_id: int, start_date: str | None = None, end_date: str | None = None, default_days: int = 7) -> list[dict[str, Any]]:
+    items = []
+    for row in _ledger_rows(db, company_id, start_date, end_date, default_days):
+        gross = row.gross_amount or 0.0
+        net = row.net_amount or 0.0
+        items.append({
+            "id": row.stripe_id,
+            "type": row.type,
+            "date": _iso(row.created),
+            "gross_amount": gross,
+            "stripe_fee": row.fee or 0.0,
+            "net_amount": net,
+            "margin_pct": round((net / gross) * 100, 2) if gross > 0 else 0.0,
+            "currency": row.currency,
+            "available_on": _iso(row.available_on),
+            "payment_intent_amount": row.payment_intent_amount,
+            "tax_amount": row.tax_amount,
+            "customer_metadata": row.customer_metadata,
+            "source_id": row.source_id,
+        })
+    return items
+
+
+def ledger_balance_payouts(db: Session, company_id: int, start_date: str | None = None, end_date: str | None = None, default_days: int = 7) -> dict[str, Any]:
+    balance_history = []
+    payout_rows = []
+    for row in _ledger_rows(db, company_id, start_date, end_date, default_days):
+        balance_history.append({
+            "transaction_id": row.stripe_id,
+            "date": _iso(row.created),
+            "amount_gross": row.gross_amount or 0.0,
+            "fee": row.fee or 0.0,
+            "amount_net": row.net_amount or 0.0,
+            "currency": row.currency,
+            "status": row.status or "unknown",
+            "type": row.type,
+            "source_id": row.source_id,
+            "description": row.description,
+        })
+        if row.type == "payout":
+            payout_rows.append(row)
+    # A failed or cancelled payout is reversed by a later payout_failure/payout_cancel row, possibly
+    # outside the window; those payouts never arrived.
+    payout_ids = [row.source_id for row in payout_rows if row.source_id]
+    reversals = dict(db.query(StripeBalanceTransaction.source_id, StripeBalanceTransaction.type).filter(
+        StripeBalanceTransaction.company_id == company_id,
+        StripeBalanceTransaction.type.in_(PAYOUT_REVERSAL_TYPES),
+        StripeBalanceTransaction.source_id.in_(payout_ids),
+    ).all()) if payout_ids else {}
+    payouts = []
+    for row in payout_rows:
+        status = row.payout_status or "unknown"
+        if row.source_id in reversals:
+            status = "failed" if reversals[row.source_id] == "payout_failure" else "canceled"
+        payouts.append({
+            "payout_id": row.source_id or row.stripe_id,
+            "amount": -(row.gross_amount or 0.0),
+            "currency": row.currency,
+            "status": status,
+            "arrival_date": _iso(row.payout_arrival_date),
+            "created_at": _iso(row.created),
+            "method": row.payout_method,
+            "payout_type": row.payout_type,
+        })
+    return {
+        "balance_history": balance_history,
+        "payouts": payouts,
+        "balance_count": len(balance_history),
+        "payout_count": len(payouts),
+    }
@@ -0,0 +1,112 @@
+from datetime import date, datetime, timezone
+from typing import Any
+from sqlalchemy import func
+from sqlalchemy.orm import Query, Session
+from app.models.models import StripeMetric, utcnow
+from app.services.upserts import upsert_rows
+
+
+TRUE_NET_MARGIN = "true_net_margin"
+
+
+def _parse_date(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+
+
+def _bounds(start_date: str | None, end_date: str | None) -> tuple[datetime | None, datetime | None]:
+    start = _parse_date(start_date)
+    end = _parse_date(end_date)
+    if end and end_date and len(end_date) == 10:
+        # A bare YYYY-MM-DD end date includes the whole day.
+        end = datetime.combine(date.fromisoformat(end_date), datetime.max.time()).replace(tzinfo=timezone.utc)
+    return start, end
+
+
+def metric_row(company_id: int, metric_type: str, item: dict[str, Any], created_at: datetime) -> dict[str, Any]:
+    return {
+        "company_id": company_id,
+        "metric_type": metric_type,
+        "stripe_id": item.get("id"),
+        "txn_type": item.get("type"),
+        "txn_date": _parse_date(item.get("date")),
+        "gross": item.get("gross_amount") or 0.0,
+        "fee": item.get("stripe_fee") or 0.0,
+        "net": item.get("net_amount") or 0.0,
+        "currency": item.get("currency"),
+        "payload": item,
+        "created_at": created_at,
+    }
+
+
+def _metric_count(db: Session, company_id: int, metric_type: str) -> int:
+    return db.query(func.count(StripeMetric.id)).filter(
+        StripeMetric.company_id == company_id,
+        StripeMetric.metric_type == metric_type,
+    ).scalar() or 0
+
+
+def store_metrics(db: Session, company_id: int, items: list[dict[str, Any]], metric_type: str = TRUE_NET_MARGIN) -> int:
+    # Re-storing a transaction refreshes its amounts; only genuinely new rows count as stored.
+    before = _metric_count(db, company_id, metric_type)
+    now = utcnow()
+    upsert_rows(
+        db,
+        StripeMetric,
+        [metric_row(company_id, metric_type, item, now) for item in items if item.get("id")],
+        conflict_columns=["company_id", "metric_type", "stripe_id"],
+        update_columns=["txn_type", "txn_date", "gross", "fee", "net", "currency", "payload"],
+    )
+    db.flush()
+    return _metric_count(db, company_id, metric_type) - before
+
+
+def metrics_query(
+    db: Session,
+    company_id: int,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    metric_type: str = TRUE_NET_MARGIN,
+) -> Query:
+    start, end = _bounds(start_date, end_date)
+    query = db.query(StripeMetric).filter(
+        StripeMetric.company_id == company_id,
+        StripeMetric.metric_type == metric_type,
+    )
+    if start:
+        query = query.filter(StripeMetric.txn_date >= start)
+    if end:
+        query = query.filter(StripeMetric.txn_date <= end)
+    return query
+
+
+def margin_by_day(
+    db: Session,
+    company_id: int,
+    start_date: str | None = None,
+    end_date: str | None = None,
+    metric_type: str = TRUE_NET_MARGIN,
+) -> list[dict[str, Any]]:
+    day = func.date(StripeMetric.txn_date)
+    query = metrics_query(db, company_id, start_date, end_date, metric_type).with_entities(
+        day.label("day"),
+        StripeMetric.currency,
+        func.count(StripeMetric.id),
+        func.coalesce(func.sum(StripeMetric.gross), 0.0),
+        func.coalesce(func.sum(StripeMetric.fee), 0.0),
+        func.coalesce(func.sum(StripeMetric.net), 0.0),
+    ).group_by(day, StripeMetric.currency).order_by(day, StripeMetric.currency)
+    return [
+        {
+            "date": str(txn_day),
+            "currency": currency,
+            "count": count,
+            "gross_amount": round(gross, 2),
+            "stripe_fee": round(fee, 2),
+            "net_amount": round(net, 2),
+            "margin_pct": round((net / gross) * 100, 2) if gross > 0 else 0.0,
+        }
+        for txn_day, currency, count, gross, fee, net in query.all()
+    ]
@@ -3,15 +3,23 @@ from sqlalchemy.orm import Session
 from app.models.models import SyncRun
 
 
-def start_sync_run(db: Session, company_id: int, provider: str, environment: str, trace_id: str | None = None) -> SyncRun:
+def start_sync_run(
+    db: Session,
+    company_id: int,
+    provider: str,
+    environment: str,
+    trace_id: str | None = None,
+    status: str = "started",
+    counts: dict | None = None,
+) -> SyncRun:
     run = SyncRun(
         company_id=company_id,
         provider=provider,
         environment=environment,
-        status="started",
+        status=status,
         started_at=datetime.now(timezone.utc),
         trace_id=trace_id,
-        counts={},
+        counts=counts or {},
     )
     db.add(run)
     db.commit()
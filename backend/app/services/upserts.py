@@ -0,0 +1,38 @@
+from typing import Any
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def _dialect_insert(db: Session, model):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise ValueError(f"Upserts not supported for dialect: {dialect}")
+
+
+def upsert_rows(
+    db: Session,
+    model,
+    rows: list[dict[str, Any]],
+    conflict_columns: list[str],
+    update_columns: list[str] | None = None,
+    batch_size: int = 500,
+) -> int:
+    if not rows:
+        return 0
+    # Postgres rejects a statement that touches the same conflict key twice.
+    unique_rows = list({tuple(row[col] for col in conflict_columns): row for row in rows}.values())
+    for offset in range(0, len(unique_rows), batch_size):
+        batch = unique_rows[offset:offset + batch_size]
+        stmt = _dialect_insert(db, model).values(batch)
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=conflict_columns,
+                set_={column: stmt.excluded[column] for column in update_columns},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+        db.execute(stmt)
+    return len(unique_rows)
@@ -4,6 +4,7 @@ from app.core.config import settings
 from app.core.logging import configure_logging, request_id_middleware
 from app.api.wise import router as wise_router
 from app.api.webhooks import router as webhooks_router
+from app.connectors.wise.credentials import credential_cache
 
 configure_logging()
 
@@ -32,4 +33,8 @@ def health():
 
 @app.get("/metrics")
 def metrics():
-    return {"app": f"{settings.app_name}-wise", "environment": settings.environment}
+    return {
+        "app": f"{settings.app_name}-wise",
+        "environment": settings.environment,
+        "wise_credential_cache": credential_cache.stats(),
+    }
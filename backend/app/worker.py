@@ -7,13 +7,46 @@ import hashlib
 from app.models.models import Company, Integration, IntegrationType, Order, OrderLine, Product, InventorySnapshot, Refund, Document, IntegrationCredentialWise
 from app.integrations.shopify import fetch_orders, fetch_inventory
 from app.services.alerts import recompute_alerts
-from app.services.documents import ingest_document
+from app.services.documents import document_path, stream_document
+from app.services.document_pipeline import embed_document, mark_document_failed, run_document_pipeline, set_document_status
 from app.services.locks import try_advisory_lock, release_advisory_lock
 from app.services.sync_runs import start_sync_run, finish_sync_run
 from app.services.audit_log import log_event
+from app.services.redis_client import get_redis
+from app.services.bank_balances import downsample_balance_history
+from app.services.payment_runs import execute_payment_run
+from app.services.stripe_jobs import run_stripe_job
+from app.connectors.wise.circuit import retry_countdown
+from app.connectors.wise.client import WiseRetryableError
 from app.connectors.wise.connector import WiseConnector
+from app.connectors.wise.receipts import (
+    ack_receipts,
+    acquire_flush_lock,
+    drain_receipts,
+    persist_receipts,
+    release_flush_lock,
+    requeue_unacked,
+)
+from app.connectors.wise.coalescing import claim_scopes, mark_dirty, scopes_for_event, seconds_until_sync
 
 celery = Celery("ai_cfo", broker=settings.redis_url, backend=settings.redis_url)
+celery.conf.beat_schedule = {
+    "compact-balance-history": {
+        "task": "app.worker.compact_balance_history",
+        "schedule": 24 * 60 * 60,
+    },
+    "flush-wise-webhook-receipts": {
+        "task": "app.worker.flush_wise_webhook_receipts",
+        "schedule": settings.wise_webhook_flush_seconds,
+    },
+}
+# Document tasks go to their own queue, consumed by a worker running a thread or solo pool: prefork
+# children are daemonic and cannot start the parse process pool.
+celery.conf.task_routes = {
+    "app.worker.process_document": {"queue": settings.document_queue},
+    "app.worker.reindex_documents": {"queue": settings.document_queue},
+    "app.worker.reindex_document_batch": {"queue": settings.document_queue},
+}
 
 
 @celery.task
@@ -233,21 +266,12 @@ def process_document(document_id: int):
         document = db.query(Document).filter(Document.id == document_id).first()
         if not document:
             return "not_found"
-        document.status = "processing"
-        document.error_message = None
-        db.commit()
-        chunks = ingest_document(db, document_id)
-        document.indexed_chunks = chunks
-        document.indexed_at = datetime.now(timezone.utc)
-        document.status = "indexed"
-        db.commit()
+        set_document_status(db, document_id, "parsing", error_message=None)
+        # A single upload streams parse into embed, so only one embedding group is held at a time.
+        embed_document(db, document_id, stream_document(document_path(document), document.file_type, document.chunk_size))
         return "ok"
     except Exception as exc:
-        document = db.query(Document).filter(Document.id == document_id).first()
-        if document:
-            document.status = "error"
-            document.error_message = str(exc)
-            db.commit()
+        mark_document_failed(db, document_id, exc)
         raise
     finally:
         db.close()
@@ -264,15 +288,31 @@ def reindex_documents(company_id: int):
             document.indexed_chunks = 0
             document.indexed_at = None
         db.commit()
-        for document in documents:
-            process_document.delay(document.id)
-        return {"queued": len(documents)}
+        # Batches of documents go out as separate tasks, so a large company's reindex spreads over the
+        # documents workers and a failed task only redoes its own batch.
+        ids = [document.id for document in documents]
+        size = max(1, settings.document_reindex_batch_size)
+        batches = [ids[start:start + size] for start in range(0, len(ids), size)]
+        for batch in batches:
+            reindex_document_batch.delay(batch)
+        return {"queued": len(documents), "batches": len(batches)}
     finally:
         db.close()
 
 
 @celery.task
-def wise_full_sync(company_id: int, environment: str):
+def reindex_document_batch(document_ids: list[int]):
+    # One pipeline per batch: parsing spreads over the cores while embedding shares the provider
+    # rate limit, instead of one task per document competing for both.
+    db: Session = SessionLocal()
+    try:
+        return run_document_pipeline(db.get_bind(), document_ids)
+    finally:
+        db.close()
+
+
+@celery.task(bind=True)
+def wise_full_sync(self, company_id: int, environment: str):
     db: Session = SessionLocal()
     if not try_advisory_lock(db, company_id, "wise", environment):
         return "locked"
@@ -296,43 +336,149 @@ def wise_full_sync(company_id: int, environment: str):
         log_event(db, company_id, "wise.sync.completed", "sync_run", str(run.id), None, counts)
         return "ok"
     except Exception as exc:
-        finish_sync_run(db, run.id, "failed", counts, str(exc))
-        log_event(db, company_id, "wise.sync.failed", "sync_run", str(run.id), None, {"error": str(exc)})
+        retrying = _will_retry(exc, self.request.retries)
+        finish_sync_run(db, run.id, "retrying" if retrying else "failed", counts, str(exc))
+        log_event(db, company_id, "wise.sync.failed", "sync_run", str(run.id), None, {"error": str(exc), "retrying": retrying})
+        if retrying:
+            raise self.retry(exc=exc, countdown=retry_countdown(exc.retry_after, self.request.retries), max_retries=None)
         raise
     finally:
         release_advisory_lock(db, company_id, "wise", environment)
         db.close()
 
 
-@celery.task
-def wise_incremental_sync(company_id: int, subscription_id: str | None = None):
-    db: Session = SessionLocal()
-    environment = "sandbox"
+def _will_retry(exc: Exception, retries: int) -> bool:
+    return isinstance(exc, WiseRetryableError) and retries < settings.wise_retry_max_attempts
+
+
+def _wise_environment(db: Session, company_id: int) -> str:
     creds = db.query(IntegrationCredentialWise).filter(
         IntegrationCredentialWise.company_id == company_id,
     ).first()
-    if creds:
-        environment = creds.wise_environment
+    return creds.wise_environment if creds else "sandbox"
+
+
+def _wise_incremental(
+    company_id: int,
+    environment: str,
+    scopes: set[str],
+    subscription_id: str | None = None,
+    retries: int = 0,
+):
+    db: Session = SessionLocal()
     if not try_advisory_lock(db, company_id, "wise", environment):
+        db.close()
         return "locked"
     run = start_sync_run(db, company_id, "wise", environment)
     counts = {}
     try:
         connector = WiseConnector(db, company_id, environment)
-        counts["balances"] = connector.sync_balances()
-        counts["transactions"] = connector.sync_transactions()
+        if "balances" in scopes:
+            counts["balances"] = connector.sync_balances()
+        if "transactions" in scopes:
+            counts["transactions"] = connector.sync_transactions()
         finish_sync_run(db, run.id, "success", counts)
-        log_event(db, company_id, "wise.sync.incremental", "sync_run", str(run.id), None, {"subscription_id": subscription_id})
+        log_event(
+            db, company_id, "wise.sync.incremental", "sync_run", str(run.id), None,
+            {"subscription_id": subscription_id, "scopes": sorted(scopes)},
+        )
         return "ok"
     except Exception as exc:
-        finish_sync_run(db, run.id, "failed", counts, str(exc))
-        log_event(db, company_id, "wise.sync.incremental_failed", "sync_run", str(run.id), None, {"error": str(exc)})
+        retrying = _will_retry(exc, retries)
+        finish_sync_run(db, run.id, "retrying" if retrying else "failed", counts, str(exc))
+        log_event(
+            db, company_id, "wise.sync.incremental_failed", "sync_run", str(run.id), None,
+            {"error": str(exc), "retrying": retrying},
+        )
         raise
     finally:
         release_advisory_lock(db, company_id, "wise", environment)
         db.close()
 
 
+@celery.task(bind=True)
+def wise_incremental_sync(self, company_id: int, subscription_id: str | None = None):
+    db: Session = SessionLocal()
+    try:
+        environment = _wise_environment(db, company_id)
+    finally:
+        db.close()
+    try:
+        return _wise_incremental(
+            company_id, environment, {"balances", "transactions"}, subscription_id, self.request.retries
+        )
+    except WiseRetryableError as exc:
+        if not _will_retry(exc, self.request.retries):
+            raise
+        raise self.retry(exc=exc, countdown=retry_countdown(exc.retry_after, self.request.retries), max_retries=None)
+
+
+def schedule_wise_sync(company_id: int, environment: str, event_type: str | None) -> bool:
+    if not mark_dirty(company_id, environment, scopes_for_event(event_type)):
+        return False
+    wise_coalesced_sync.apply_async((company_id, environment), countdown=settings.wise_webhook_quiet_seconds)
+    return True
+
+
+@celery.task
+def wise_coalesced_sync(company_id: int, environment: str, retries: int = 0, scopes: list[str] | None = None):
+    if scopes is None:
+        delay = seconds_until_sync(company_id, environment)
+        if delay > 0:
+            wise_coalesced_sync.apply_async((company_id, environment, retries), countdown=delay)
+            return "deferred"
+        scopes = claim_scopes(company_id, environment)
+    else:
+        # A retry carries the scopes it failed on; anything marked since rides along.
+        scopes = set(scopes) | claim_scopes(company_id, environment)
+    if not scopes:
+        return "noop"
+    if "transfers" in scopes:
+        wise_refresh_transfers(company_id)
+    data_scopes = scopes - {"transfers"}
+    if not data_scopes:
+        return "ok"
+    try:
+        result = _wise_incremental(company_id, environment, data_scopes, retries=retries)
+    except WiseRetryableError as exc:
+        if not _will_retry(exc, retries):
+            raise
+        # The scopes travel in the task args: the backoff (or Retry-After) can outlast the coalescing
+        # keys' TTL, so marking them dirty again could lose them before the retry runs.
+        wise_coalesced_sync.apply_async(
+            (company_id, environment, retries + 1, sorted(data_scopes)),
+            countdown=retry_countdown(exc.retry_after, retries),
+        )
+        return "retrying"
+    if result == "locked":
+        # A full sync holds the lock; put the scopes back so they are picked up after it.
+        if mark_dirty(company_id, environment, data_scopes):
+            wise_coalesced_sync.apply_async((company_id, environment), countdown=settings.wise_webhook_quiet_seconds)
+    return result
+
+
+@celery.task(bind=True)
+def wise_execute_payment_run(self, run_id: int):
+    db: Session = SessionLocal()
+    try:
+        return execute_payment_run(db, run_id).status
+    except WiseRetryableError as exc:
+        if not _will_retry(exc, self.request.retries):
+            raise
+        raise self.retry(exc=exc, countdown=retry_countdown(exc.retry_after, self.request.retries), max_retries=None)
+    finally:
+        db.close()
+
+
+@celery.task
+def stripe_sync_job(run_id: int, kind: str, params: dict | None = None):
+    db: Session = SessionLocal()
+    try:
+        return run_stripe_job(db, run_id, kind, params)
+    finally:
+        db.close()
+
+
 @celery.task
 def wise_refresh_transfers(company_id: int, subscription_id: str | None = None):
     db: Session = SessionLocal()
@@ -341,3 +487,32 @@ def wise_refresh_transfers(company_id: int, subscription_id: str | None = None):
         return "ok"
     finally:
         db.close()
+
+
+@celery.task
+def flush_wise_webhook_receipts():
+    client = get_redis()
+    if not acquire_flush_lock(client):
+        return 0
+    db: Session = SessionLocal()
+    total = 0
+    try:
+        requeue_unacked(client)
+        while True:
+            receipts = drain_receipts(settings.wise_webhook_flush_batch_size, client)
+            if not receipts:
+                return total
+            total += persist_receipts(db, receipts)
+            ack_receipts(client)
+    finally:
+        db.close()
+        release_flush_lock(client)
+
+
+@celery.task
+def compact_balance_history(older_than_days: int | None = None):
+    db: Session = SessionLocal()
+    try:
+        return downsample_balance_history(db, older_than_days or settings.balance_history_retention_days)
+    finally:
+        db.close()
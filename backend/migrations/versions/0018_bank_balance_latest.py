@@ -0,0 +1,48 @@
+"""add bank balance latest table
+
+Revision ID: 0018_bank_balance_latest
+Revises: 0017_document_embedding_settings
+Create Date: 2026-02-09 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0018_bank_balance_latest"
+down_revision = "0017_document_embedding_settings"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "bank_balance_latest",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False),
+        sa.Column("bank_account_id", sa.Integer(), sa.ForeignKey("bank_accounts.id"), nullable=False),
+        sa.Column("provider", sa.String(), nullable=True),
+        sa.Column("provider_account_id", sa.String(), nullable=True),
+        sa.Column("currency", sa.String(), nullable=False),
+        sa.Column("balance", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("captured_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+    )
+    op.create_unique_constraint("uq_bank_balance_latest_account", "bank_balance_latest", ["bank_account_id"])
+    op.create_index("ix_bank_balance_latest_company_id", "bank_balance_latest", ["company_id"])
+    op.execute(
+        """
+        INSERT INTO bank_balance_latest
+            (company_id, bank_account_id, provider, provider_account_id, currency, balance, captured_at, updated_at)
+        SELECT DISTINCT ON (bank_account_id)
+            company_id, bank_account_id, provider, provider_account_id, currency, balance, captured_at, now()
+        FROM bank_balances
+        ORDER BY bank_account_id, captured_at DESC, id DESC
+        """
+    )
+
+
+def downgrade():
+    op.drop_index("ix_bank_balance_latest_company_id", table_name="bank_balance_latest")
+    op.drop_constraint("uq_bank_balance_latest_account", "bank_balance_latest", type_="unique")
+    op.drop_table("bank_balance_latest")
@@ -0,0 +1,66 @@
+"""add wise payment runs
+
+Revision ID: 0019_wise_payment_runs
+Revises: 0018_bank_balance_latest
+Create Date: 2026-02-12 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0019_wise_payment_runs"
+down_revision = "0018_bank_balance_latest"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "wise_payment_runs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False),
+        sa.Column("wise_environment", sa.String(), nullable=False, server_default="sandbox"),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("reference", sa.String(), nullable=True),
+        sa.Column("idempotency_key", sa.String(), nullable=False),
+        sa.Column("wise_batch_id", sa.String(), nullable=True),
+        sa.Column("total_items", sa.Integer(), nullable=True),
+        sa.Column("added_items", sa.Integer(), nullable=True),
+        sa.Column("failed_items", sa.Integer(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("created_by_user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.Column("funded_at", sa.DateTime(), nullable=True),
+    )
+    op.create_unique_constraint(
+        "uq_wise_payment_runs_company_key", "wise_payment_runs", ["company_id", "idempotency_key"]
+    )
+    op.create_index("ix_wise_payment_runs_company_id", "wise_payment_runs", ["company_id"])
+    op.create_table(
+        "wise_payment_run_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("payment_run_id", sa.Integer(), sa.ForeignKey("wise_payment_runs.id"), nullable=False),
+        sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False),
+        sa.Column("bill_id", sa.Integer(), sa.ForeignKey("bills.id"), nullable=True),
+        sa.Column("payee_id", sa.String(), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("currency", sa.String(), nullable=False),
+        sa.Column("reference", sa.String(), nullable=True),
+        sa.Column("idempotency_key", sa.String(), nullable=False, unique=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("wise_transfer_id", sa.String(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("raw", sa.JSON(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_wise_payment_run_items_payment_run_id", "wise_payment_run_items", ["payment_run_id"])
+
+
+def downgrade():
+    op.drop_index("ix_wise_payment_run_items_payment_run_id", table_name="wise_payment_run_items")
+    op.drop_table("wise_payment_run_items")
+    op.drop_index("ix_wise_payment_runs_company_id", table_name="wise_payment_runs")
+    op.drop_constraint("uq_wise_payment_runs_company_key", "wise_payment_runs", type_="unique")
+    op.drop_table("wise_payment_runs")
@@ -0,0 +1,72 @@
+"""add stripe balance transaction ledger
+
+Revision ID: 0020_stripe_ledger
+Revises: 0019_wise_payment_runs
+Create Date: 2026-02-16 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0020_stripe_ledger"
+down_revision = "0019_wise_payment_runs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "stripe_balance_transactions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False),
+        sa.Column("stripe_account", sa.String(), nullable=False, server_default=""),
+        sa.Column("stripe_id", sa.String(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("reporting_category", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("source_id", sa.String(), nullable=True),
+        sa.Column("currency", sa.String(), nullable=False),
+        sa.Column("gross_amount", sa.Float(), nullable=True),
+        sa.Column("fee", sa.Float(), nullable=True),
+        sa.Column("net_amount", sa.Float(), nullable=True),
+        sa.Column("created", sa.DateTime(), nullable=False),
+        sa.Column("available_on", sa.DateTime(), nullable=True),
+        sa.Column("payment_intent_amount", sa.Float(), nullable=True),
+        sa.Column("tax_amount", sa.Float(), nullable=True),
+        sa.Column("customer_metadata", sa.JSON(), nullable=True),
+        sa.Column("synced_at", sa.DateTime(), nullable=True),
+    )
+    op.create_unique_constraint(
+        "uq_stripe_balance_transactions_company_stripe_id",
+        "stripe_balance_transactions",
+        ["company_id", "stripe_id"],
+    )
+    op.create_index(
+        "ix_stripe_balance_transactions_company_created",
+        "stripe_balance_transactions",
+        ["company_id", "created"],
+    )
+    op.create_table(
+        "stripe_sync_state",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False),
+        sa.Column("stripe_account", sa.String(), nullable=False, server_default=""),
+        sa.Column("last_created", sa.DateTime(), nullable=True),
+        sa.Column("last_balance_transaction_id", sa.String(), nullable=True),
+        sa.Column("last_synced_at", sa.DateTime(), nullable=True),
+    )
+    op.create_unique_constraint(
+        "uq_stripe_sync_state_company_account", "stripe_sync_state", ["company_id", "stripe_account"]
+    )
+
+
+def downgrade():
+    op.drop_constraint("uq_stripe_sync_state_company_account", "stripe_sync_state", type_="unique")
+    op.drop_table("stripe_sync_state")
+    op.drop_index("ix_stripe_balance_transactions_company_created", table_name="stripe_balance_transactions")
+    op.drop_constraint(
+        "uq_stripe_balance_transactions_company_stripe_id", "stripe_balance_transactions", type_="unique"
+    )
+    op.drop_table("stripe_balance_transactions")
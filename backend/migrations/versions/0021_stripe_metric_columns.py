@@ -0,0 +1,61 @@
+"""typed columns for stripe metrics
+
+Revision ID: 0021_stripe_metric_columns
+Revises: 0020_stripe_ledger
+Create Date: 2026-02-18 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0021_stripe_metric_columns"
+down_revision = "0020_stripe_ledger"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("stripe_metrics", sa.Column("stripe_id", sa.String(), nullable=True))
+    op.add_column("stripe_metrics", sa.Column("txn_type", sa.String(), nullable=True))
+    op.add_column("stripe_metrics", sa.Column("txn_date", sa.DateTime(), nullable=True))
+    op.add_column("stripe_metrics", sa.Column("gross", sa.Float(), nullable=True))
+    op.add_column("stripe_metrics", sa.Column("fee", sa.Float(), nullable=True))
+    op.add_column("stripe_metrics", sa.Column("net", sa.Float(), nullable=True))
+    op.add_column("stripe_metrics", sa.Column("currency", sa.String(), nullable=True))
+    op.execute(
+        """
+        UPDATE stripe_metrics SET
+            stripe_id = NULLIF(payload->>'id', ''),
+            txn_type = payload->>'type',
+            txn_date = (NULLIF(payload->>'date', '')::timestamptz AT TIME ZONE 'UTC'),
+            gross = COALESCE(NULLIF(payload->>'gross_amount', '')::float, 0),
+            fee = COALESCE(NULLIF(payload->>'stripe_fee', '')::float, 0),
+            net = COALESCE(NULLIF(payload->>'net_amount', '')::float, 0),
+            currency = payload->>'currency'
+        """
+    )
+    # Earlier stores could insert the same transaction more than once; keep the newest copy.
+    op.execute(
+        """
+        DELETE FROM stripe_metrics AS older
+        USING stripe_metrics AS newer
+        WHERE older.company_id = newer.company_id
+          AND older.metric_type = newer.metric_type
+          AND older.stripe_id = newer.stripe_id
+          AND older.id < newer.id
+        """
+    )
+    op.create_unique_constraint(
+        "uq_stripe_metrics_company_type_stripe_id",
+        "stripe_metrics",
+        ["company_id", "metric_type", "stripe_id"],
+    )
+    op.create_index("ix_stripe_metrics_company_txn_date", "stripe_metrics", ["company_id", "txn_date"])
+
+
+def downgrade():
+    op.drop_index("ix_stripe_metrics_company_txn_date", table_name="stripe_metrics")
+    op.drop_constraint("uq_stripe_metrics_company_type_stripe_id", "stripe_metrics", type_="unique")
+    for column in ("currency", "net", "fee", "gross", "txn_date", "txn_type", "stripe_id"):
+        op.drop_column("stripe_metrics", column)
@@ -0,0 +1,45 @@
+"""add reconciliation matches
+
+Revision ID: 0022_reconciliation_matches
+Revises: 0021_stripe_metric_columns
+Create Date: 2026-02-20 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0022_reconciliation_matches"
+down_revision = "0021_stripe_metric_columns"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "reconciliation_matches",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False),
+        sa.Column("payout_source", sa.String(), nullable=False),
+        sa.Column("payout_ref", sa.String(), nullable=False),
+        sa.Column("bank_transaction_id", sa.Integer(), sa.ForeignKey("bank_transactions.id"), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("bank_amount", sa.Float(), nullable=False),
+        sa.Column("currency", sa.String(), nullable=False),
+        sa.Column("payout_date", sa.Date(), nullable=False),
+        sa.Column("posted_at", sa.Date(), nullable=False),
+        sa.Column("method", sa.String(), nullable=False),
+        sa.Column("matched_at", sa.DateTime(), nullable=False),
+    )
+    op.create_unique_constraint(
+        "uq_reconciliation_matches_payout", "reconciliation_matches", ["company_id", "payout_source", "payout_ref"]
+    )
+    op.create_unique_constraint(
+        "uq_reconciliation_matches_bank_transaction", "reconciliation_matches", ["bank_transaction_id"]
+    )
+
+
+def downgrade():
+    op.drop_constraint("uq_reconciliation_matches_bank_transaction", "reconciliation_matches", type_="unique")
+    op.drop_constraint("uq_reconciliation_matches_payout", "reconciliation_matches", type_="unique")
+    op.drop_table("reconciliation_matches")
@@ -0,0 +1,33 @@
+"""add embedding cache
+
+Revision ID: 0023_embedding_cache
+Revises: 0022_reconciliation_matches
+Create Date: 2026-02-22 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+revision = "0023_embedding_cache"
+down_revision = "0022_reconciliation_matches"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "embedding_cache",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("model", sa.String(), nullable=False),
+        sa.Column("embedding", Vector(3072), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_unique_constraint("uq_embedding_cache_hash_model", "embedding_cache", ["content_hash", "model"])
+
+
+def downgrade():
+    op.drop_constraint("uq_embedding_cache_hash_model", "embedding_cache", type_="unique")
+    op.drop_table("embedding_cache")
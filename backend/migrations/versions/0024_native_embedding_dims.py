@@ -0,0 +1,108 @@
+"""store embeddings at native dimensions with HNSW indexes
+
+Revision ID: 0024_native_embedding_dims
+Revises: 0023_embedding_cache
+Create Date: 2026-02-24 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0024_native_embedding_dims"
+down_revision = "0023_embedding_cache"
+branch_labels = None
+depends_on = None
+
+
+# Known models map to their native size. A NULL model meant "whatever EMBEDDING_MODEL was", and an
+# unknown one has no size on record, so those fall back to the stored vector: 0017 zero-padded every
+# vector to 3072, so the highest non-zero position tells 1536 from 3072 without dropping any value.
+MODEL_DIMS_SQL = """
+    CASE {model}
+        WHEN 'text-embedding-3-large' THEN 3072
+        WHEN 'text-embedding-3-small' THEN 1536
+        WHEN 'text-embedding-ada-002' THEN 1536
+        ELSE CASE WHEN {highest} > 1536 THEN 3072 ELSE 1536 END
+    END
+"""
+
+HIGHEST_NONZERO_SQL = """
+    (
+        SELECT max(position)
+        FROM unnest({vector}::real[]) WITH ORDINALITY AS item(value, position)
+        WHERE value <> 0
+    )
+"""
+
+
+def upgrade():
+    # HNSW on halfvec needs pgvector 0.7+.
+    op.add_column("document_chunks", sa.Column("embedding_dim", sa.Integer(), nullable=True))
+    op.execute("ALTER TABLE document_chunks ALTER COLUMN embedding TYPE vector")
+    # One size per document, taken over all its chunks, so a chunk whose tail happens to be zero
+    # still lands with its siblings.
+    op.execute(
+        f"""
+        WITH stored AS (
+            SELECT chunk.document_id, max({HIGHEST_NONZERO_SQL.format(vector="chunk.embedding")}) AS highest
+            FROM document_chunks AS chunk
+            GROUP BY chunk.document_id
+        )
+        UPDATE document_chunks AS chunk
+        SET embedding_dim = {MODEL_DIMS_SQL.format(model="document.embedding_model", highest="stored.highest")}
+        FROM documents AS document, stored
+        WHERE document.id = chunk.document_id AND stored.document_id = chunk.document_id
+        """
+    )
+    # Vectors were zero-padded to 3072; cut the padding back off. Only zeros are removed.
+    op.execute(
+        """
+        UPDATE document_chunks
+        SET embedding = ((embedding::real[])[1:embedding_dim])::vector
+        WHERE vector_dims(embedding) > embedding_dim
+        """
+    )
+    op.alter_column("document_chunks", "embedding_dim", nullable=False)
+    op.create_index("ix_document_chunks_company_dim", "document_chunks", ["company_id", "embedding_dim"])
+    op.execute(
+        """
+        CREATE INDEX ix_document_chunks_embedding_1536_hnsw ON document_chunks
+        USING hnsw ((embedding::vector(1536)) vector_cosine_ops)
+        WHERE embedding_dim = 1536
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX ix_document_chunks_embedding_3072_hnsw ON document_chunks
+        USING hnsw ((embedding::halfvec(3072)) halfvec_cosine_ops)
+        WHERE embedding_dim = 3072
+        """
+    )
+
+    op.execute("ALTER TABLE embedding_cache ALTER COLUMN embedding TYPE vector")
+    cache_dims = MODEL_DIMS_SQL.format(model="model", highest=HIGHEST_NONZERO_SQL.format(vector="embedding"))
+    op.execute(
+        f"""
+        UPDATE embedding_cache
+        SET embedding = ((embedding::real[])[1:{cache_dims}])::vector
+        WHERE vector_dims(embedding) > {cache_dims}
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_document_chunks_embedding_3072_hnsw")
+    op.execute("DROP INDEX IF EXISTS ix_document_chunks_embedding_1536_hnsw")
+    op.drop_index("ix_document_chunks_company_dim", table_name="document_chunks")
+    # Re-pad to the fixed 3072 columns.
+    for table in ("document_chunks", "embedding_cache"):
+        op.execute(
+            f"""
+            UPDATE {table}
+            SET embedding = (embedding::real[] || array_fill(0::real, ARRAY[3072 - vector_dims(embedding)]))::vector
+            WHERE vector_dims(embedding) < 3072
+            """
+        )
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN embedding TYPE vector(3072)")
+    op.drop_column("document_chunks", "embedding_dim")
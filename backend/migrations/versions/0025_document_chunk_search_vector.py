@@ -0,0 +1,37 @@
+"""full-text search vector on document chunks
+
+Revision ID: 0025_document_chunk_search_vector
+Revises: 0024_native_embedding_dims
+Create Date: 2026-02-26 10:00:00.000000
+"""
+
+from alembic import op
+
+
+revision = "0025_document_chunk_search_vector"
+down_revision = "0024_native_embedding_dims"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Stored generated column: Postgres keeps it in step with content, ingestion code never writes it.
+    # Adding it rewrites document_chunks once.
+    op.execute(
+        """
+        ALTER TABLE document_chunks
+        ADD COLUMN content_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED
+        """
+    )
+    op.create_index(
+        "ix_document_chunks_content_tsv",
+        "document_chunks",
+        ["content_tsv"],
+        postgresql_using="gin",
+    )
+
+
+def downgrade():
+    op.drop_index("ix_document_chunks_content_tsv", table_name="document_chunks")
+    op.drop_column("document_chunks", "content_tsv")
@@ -0,0 +1,35 @@
+"""track how far back the stripe ledger has been backfilled
+
+Revision ID: 0026_stripe_ledger_backfilled_from
+Revises: 0025_document_chunk_search_vector
+Create Date: 2026-03-02 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0026_stripe_ledger_backfilled_from"
+down_revision = "0025_document_chunk_search_vector"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("stripe_sync_state", sa.Column("backfilled_from", sa.Date(), nullable=True))
+    # The oldest stored transaction is a safe lower bound; at worst one extra backfill re-fetches a few days.
+    op.execute(
+        """
+        UPDATE stripe_sync_state AS state
+        SET backfilled_from = (
+            SELECT min(ledger.created)::date
+            FROM stripe_balance_transactions AS ledger
+            WHERE ledger.company_id = state.company_id
+              AND ledger.stripe_account = state.stripe_account
+        )
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("stripe_sync_state", "backfilled_from")
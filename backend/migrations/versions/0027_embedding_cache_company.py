@@ -0,0 +1,34 @@
+"""scope the embedding cache per company
+
+Revision ID: 0027_embedding_cache_company
+Revises: 0026_stripe_ledger_backfilled_from
+Create Date: 2026-03-03 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0027_embedding_cache_company"
+down_revision = "0026_stripe_ledger_backfilled_from"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing entries have no owner; it is only a cache, so it is emptied and refills on the next ingest.
+    op.execute("DELETE FROM embedding_cache")
+    op.drop_constraint("uq_embedding_cache_hash_model", "embedding_cache", type_="unique")
+    op.add_column("embedding_cache", sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id"), nullable=False))
+    op.create_unique_constraint(
+        "uq_embedding_cache_company_hash_model",
+        "embedding_cache",
+        ["company_id", "content_hash", "model"],
+    )
+
+
+def downgrade():
+    op.execute("DELETE FROM embedding_cache")
+    op.drop_constraint("uq_embedding_cache_company_hash_model", "embedding_cache", type_="unique")
+    op.drop_column("embedding_cache", "company_id")
+    op.create_unique_constraint("uq_embedding_cache_hash_model", "embedding_cache", ["content_hash", "model"])
@@ -0,0 +1,42 @@
+"""store payout status, arrival and method on ledger payout rows
+
+Revision ID: 0028_stripe_ledger_payout_fields
+Revises: 0027_embedding_cache_company
+Create Date: 2026-03-04 10:00:00.000000
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0028_stripe_ledger_payout_fields"
+down_revision = "0027_embedding_cache_company"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("stripe_balance_transactions", sa.Column("payout_status", sa.String(), nullable=True))
+    op.add_column("stripe_balance_transactions", sa.Column("payout_arrival_date", sa.DateTime(), nullable=True))
+    op.add_column("stripe_balance_transactions", sa.Column("payout_method", sa.String(), nullable=True))
+    op.add_column("stripe_balance_transactions", sa.Column("payout_type", sa.String(), nullable=True))
+    # Rows synced before this have no payout fields; re-list them on the next sync so they get filled in.
+    op.execute(
+        """
+        UPDATE stripe_sync_state AS state
+        SET last_created = NULL
+        WHERE EXISTS (
+            SELECT 1 FROM stripe_balance_transactions AS ledger
+            WHERE ledger.company_id = state.company_id
+              AND ledger.stripe_account = state.stripe_account
+              AND ledger.type IN ('payout', 'payout_failure', 'payout_cancel')
+        )
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("stripe_balance_transactions", "payout_type")
+    op.drop_column("stripe_balance_transactions", "payout_method")
+    op.drop_column("stripe_balance_transactions", "payout_arrival_date")
+    op.drop_column("stripe_balance_transactions", "payout_status")
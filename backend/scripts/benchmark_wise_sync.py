@@ -0,0 +1,77 @@
+import argparse
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.connectors.wise.connector import WiseConnector
+from app.core.config import settings
+from app.core.database import Base
+from app.models.models import Company, Integration, IntegrationCredentialWise, IntegrationType
+
+
+def seed(db: Session) -> int:
+    company = Company(name="Wise Benchmark Co")
+    db.add(company)
+    db.flush()
+    integration = Integration(company_id=company.id, type=IntegrationType.wise, status="connected", credentials={})
+    db.add(integration)
+    db.flush()
+    db.add(IntegrationCredentialWise(
+        company_id=company.id,
+        integration_id=integration.id,
+        wise_environment="sandbox",
+        oauth_access_token_encrypted="unused",
+        oauth_refresh_token_encrypted="unused",
+        sync_cursor_transactions={},
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
+    ))
+    db.commit()
+    return company.id
+
+
+def run(base_url: str, concurrency: int, database_url: str) -> dict[str, float]:
+    settings.wise_api_base_sandbox = base_url
+    settings.wise_api_token = "benchmark-token"
+    settings.wise_fetch_concurrency = concurrency
+    settings.wise_rate_limit_per_second = 1000
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        company_id = seed(db)
+        connector = WiseConnector(db, company_id, "sandbox")
+        connector.sync_profiles()
+        connector.sync_balance_accounts()
+        timings = {}
+        started = time.perf_counter()
+        timings["balances"] = connector.sync_balances()
+        timings["balances_seconds"] = time.perf_counter() - started
+        started = time.perf_counter()
+        timings["transactions"] = connector.sync_transactions()
+        timings["transactions_seconds"] = time.perf_counter() - started
+        return timings
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Wise balance/transaction sync against the mock Wise server.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:9101")
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+    for concurrency in args.concurrency:
+        result = run(args.base_url, concurrency, args.database_url)
+        print(
+            f"concurrency={concurrency} "
+            f"balances={result['balances']} in {result['balances_seconds']:.2f}s "
+            f"transactions={result['transactions']} in {result['transactions_seconds']:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+from app.models.models import BankAccount, BankBalance, BankBalanceLatest, Company, WiseBalance
+from app.services.bank_balances import downsample_balance_history, record_bank_balances
+from app.services.metrics import get_cash_position
+
+
+def _capture(account, balance, captured_at):
+    return {
+        "bank_account_id": account.id,
+        "provider": "wise",
+        "provider_account_id": account.provider_account_id,
+        "currency": "USD",
+        "balance": balance,
+        "captured_at": captured_at,
+    }
+
+
+def test_record_bank_balances_skips_unchanged_amounts(db_session):
+    company = Company(name="Balance Co", currency="USD")
+    db_session.add(company)
+    db_session.flush()
+    account = BankAccount(company_id=company.id, name="Wise USD", currency="USD", provider="wise", provider_account_id="bal-1")
+    db_session.add(account)
+    db_session.commit()
+    now = datetime.now(timezone.utc)
+
+    assert len(record_bank_balances(db_session, company.id, [_capture(account, 100.0, now)])) == 1
+    assert record_bank_balances(db_session, company.id, [_capture(account, 100.0, now + timedelta(minutes=5))]) == []
+    assert len(record_bank_balances(db_session, company.id, [_capture(account, 125.5, now + timedelta(minutes=10))])) == 1
+    db_session.commit()
+
+    assert db_session.query(BankBalance).count() == 2
+    latest = db_session.query(BankBalanceLatest).one()
+    assert latest.balance == 125.5
+    assert get_cash_position(db_session, company.id)["by_provider"]["wise"] == 125.5
+
+
+def test_downsample_balance_history_keeps_daily_close(db_session):
+    company = Company(name="History Co", currency="USD")
+    db_session.add(company)
+    db_session.flush()
+    account = BankAccount(company_id=company.id, name="Wise USD", currency="USD", provider="wise", provider_account_id="bal-1")
+    db_session.add(account)
+    db_session.flush()
+    old_day = datetime(2020, 3, 1, tzinfo=timezone.utc)
+    recent = datetime.now(timezone.utc) - timedelta(days=1)
+    for hour, amount in [(8, 10.0), (12, 20.0), (18, 30.0)]:
+        db_session.add(BankBalance(
+            company_id=company.id,
+            bank_account_id=account.id,
+            provider="wise",
+            provider_account_id="bal-1",
+            currency="USD",
+            balance=amount,
+            captured_at=old_day.replace(hour=hour),
+        ))
+        db_session.add(WiseBalance(
+            company_id=company.id,
+            wise_balance_account_id="bal-1",
+            currency="USD",
+            amount=amount,
+            timestamp=old_day.replace(hour=hour),
+        ))
+    for minutes in (0, 30):
+        db_session.add(BankBalance(
+            company_id=company.id,
+            bank_account_id=account.id,
+            provider="wise",
+            provider_account_id="bal-1",
+            currency="USD",
+            balance=40.0 + minutes,
+            captured_at=recent + timedelta(minutes=minutes),
+        ))
+    db_session.commit()
+
+    counts = downsample_balance_history(db_session, older_than_days=90)
+
+    assert counts == {"bank_balances": 2, "wise_balances": 2}
+    remaining = sorted(row.balance for row in db_session.query(BankBalance).all())
+    assert remaining == [30.0, 40.0, 70.0]
+    assert [row.amount for row in db_session.query(WiseBalance).all()] == [30.0]
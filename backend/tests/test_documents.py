@@ -1,4 +1,6 @@
-from app.services.documents import chunk_text
+import pytest
+from openpyxl import Workbook
+from app.services.documents import chunk_text, extract_text, iter_chunks, iter_text
 
 
 def test_chunk_text_splits():
@@ -6,3 +8,417 @@ def test_chunk_text_splits():
     chunks = list(chunk_text(text, max_chars=1000, overlap=100))
     assert len(chunks) == 3
     assert all(len(chunk) <= 1000 for chunk in chunks)
+
+
+def test_embed_texts_cached_only_embeds_misses(monkeypatch, db_session):
+    from app.models.models import EmbeddingCache
+    from app.services import embeddings
+
+    calls = []
+
+    def fake_embed(texts, model=None, **kwargs):
+        calls.append(list(texts))
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+    monkeypatch.setattr(embeddings, "embed_texts", fake_embed)
+    vectors, stats = embeddings.embed_texts_cached(db_session, 1, ["alpha", "beta", "alpha"], model="m1")
+    db_session.commit()
+    assert stats.as_dict()["embedded"] == 2
+    assert calls == [["alpha", "beta"]]
+    assert vectors[0] == vectors[2]
+
+    vectors, stats = embeddings.embed_texts_cached(db_session, 1, ["beta", "gamma"], model="m1")
+    assert stats.cached == 1
+    assert calls[-1] == ["gamma"]
+    assert vectors[0][:2] == [4.0, 1.0]
+
+    # The same text under another model is a separate entry.
+    embeddings.embed_texts_cached(db_session, 1, ["alpha"], model="m2")
+    db_session.commit()
+    assert calls[-1] == ["alpha"]
+    assert db_session.query(EmbeddingCache).count() == 4
+
+    # Another company never hits the first one's entries.
+    vectors, stats = embeddings.embed_texts_cached(db_session, 2, ["alpha", "beta"], model="m1")
+    db_session.commit()
+    assert stats.cached == 0
+    assert calls[-1] == ["alpha", "beta"]
+    assert db_session.query(EmbeddingCache).filter_by(company_id=2).count() == 2
+
+
+def test_batch_texts_respects_token_budget_and_item_cap():
+    from app.services.embeddings import batch_texts
+
+    texts = ["a" * 30, "b" * 30, "c" * 30, "d" * 3, "e" * 3, "f" * 3]
+    assert batch_texts(texts, max_tokens=20, max_items=10) == [(0, 2), (2, 6)]
+    assert batch_texts(texts, max_tokens=1000, max_items=4) == [(0, 4), (4, 6)]
+    # A single oversized text still gets its own batch.
+    assert batch_texts(["x" * 300], max_tokens=10, max_items=10) == [(0, 1)]
+
+
+def test_embed_texts_retries_only_failed_batches(monkeypatch):
+    from app.core import config
+    from app.services import embeddings
+
+    class FlakyProvider(embeddings.HashEmbeddingProvider):
+        name = "flaky"
+
+        def __init__(self):
+            super().__init__(dimensions=8)
+            self.calls = []
+
+        def embed(self, texts, model):
+            self.calls.append(tuple(texts))
+            if texts[0] == "two" and self.calls.count(tuple(texts)) == 1:
+                raise ConnectionError("transient")
+            return super().embed(texts, model)
+
+        def is_retryable(self, exc):
+            return isinstance(exc, ConnectionError)
+
+    monkeypatch.setattr(config.settings, "embedding_batch_max_items", 1)
+    monkeypatch.setattr(config.settings, "embedding_retry_base_seconds", 0)
+    provider = FlakyProvider()
+    stats = embeddings.EmbeddingStats()
+    vectors = embeddings.embed_texts(["one", "two", "three"], model="m", provider=provider, stats=stats)
+
+    assert sorted(provider.calls) == [("one",), ("three",), ("two",), ("two",)]
+    assert (stats.batches, stats.retried_batches, stats.texts) == (3, 1, 3)
+    assert len(vectors[1]) == 8
+    assert vectors[0] == embeddings.embed_texts(["one"], model="m", provider=provider)[0]
+
+
+def test_chunk_distance_matches_partial_index_expressions():
+    from sqlalchemy import select
+    from sqlalchemy.dialects import postgresql
+    from app.services.documents import chunk_distance
+
+    small = str(select(chunk_distance(1536, [0.1] * 1536)).compile(dialect=postgresql.dialect()))
+    large = str(select(chunk_distance(3072, [0.1] * 3072)).compile(dialect=postgresql.dialect()))
+    assert "CAST(document_chunks.embedding AS VECTOR(1536)) <=>" in small
+    assert "CAST(document_chunks.embedding AS HALFVEC(3072)) <=> CAST(" in large
+
+
+def test_filtered_vector_search_fills_top_k(monkeypatch):
+    from types import SimpleNamespace
+    from app.models.models import Document
+    from app.services import documents
+
+    class FakeHnswSession:
+        # Mimics pgvector: the graph walk yields ef_search candidates and filters apply afterwards,
+        # unless an iterative scan is enabled, which keeps walking until the limit is met.
+        def __init__(self):
+            self.settings = {}
+            self.rows = [
+                (SimpleNamespace(id=index, content=f"chunk {index}"),
+                 SimpleNamespace(id=1, filename="ledger.xlsx", file_type="xlsx" if index % 10 == 0 else "pdf"),
+                 index / 1000)
+                for index in range(500)
+            ]
+
+        def get_bind(self):
+            return SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+        def execute(self, statement):
+            text = str(statement)
+            if text.startswith("SET LOCAL"):
+                name, value = text.removeprefix("SET LOCAL ").split(" = ")
+                self.settings[name] = value
+                return None
+            limit = statement._limit_clause.value
+            scanned = self.rows if "hnsw.iterative_scan" in self.settings else self.rows[:int(self.settings["hnsw.ef_search"])]
+            return SimpleNamespace(all=lambda: [row for row in scanned if row[1].file_type == "xlsx"][:limit])
+
+    monkeypatch.setattr(documents, "query_embedding", lambda company_id, query, model: [0.1] * 1536)
+    filters = documents.SearchFilters(where=Document.file_type == "xlsx")
+
+    session = FakeHnswSession()
+    matches = documents._search_model(session, 1, None, "margin", 20, filters=filters)
+    assert session.settings["hnsw.iterative_scan"] == "relaxed_order"
+    assert len(matches) == 20
+
+    # Without iterative scans (pgvector < 0.8) a filtered search widens ef_search instead.
+    monkeypatch.setattr(documents.settings, "vector_search_iterative_scan", "off")
+    session = FakeHnswSession()
+    assert len(documents._search_model(session, 1, None, "margin", 20, filters=filters)) == 20
+    assert session.settings == {"hnsw.ef_search": "400"}
+    assert documents._hnsw_settings(5, filtered=False) == ["SET LOCAL hnsw.ef_search = 100"]
+
+
+def test_query_embeddings_and_model_lists_are_cached(monkeypatch, db_session):
+    from app.models.models import Company, Document, Role, User
+    from app.services import documents
+
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+
+        def get(self, key):
+            return self.data.get(key)
+
+        def incr(self, key):
+            self.data[key] = str(int(self.data.get(key, 0)) + 1)
+            return int(self.data[key])
+
+    calls = []
+
+    def fake_embed(texts, model=None, **kwargs):
+        calls.append((model, tuple(texts)))
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(documents, "get_redis", lambda: fake_redis)
+    monkeypatch.setattr(documents, "embed_texts", fake_embed)
+    documents.query_embedding_cache.clear()
+    documents.document_models_cache.clear()
+
+    documents.query_embedding(1, "cash  runway", "m1")
+    documents.query_embedding(1, " cash runway ", "m1")
+    documents.query_embedding(1, "cash runway", "m2")
+    assert calls == [("m1", ("cash runway",)), ("m2", ("cash runway",))]
+    # Another company's identical question is not served from the first one's entry.
+    documents.query_embedding(2, "cash runway", "m1")
+    assert calls[-1] == ("m1", ("cash runway",)) and len(calls) == 3
+
+    company = Company(name="Docs Co")
+    db_session.add(company)
+    db_session.flush()
+    user = User(company_id=company.id, email="docs@example.com", password_hash="x", role=Role.founder)
+    db_session.add(user)
+    db_session.flush()
+
+    def add_document(model):
+        db_session.add(Document(
+            company_id=company.id, filename="f.csv", file_type="csv", storage_path="f.csv",
+            uploaded_by=user.id, embedding_model=model,
+        ))
+        db_session.commit()
+
+    add_document("text-embedding-3-small")
+    assert documents.company_embedding_models(db_session, company.id) == ["text-embedding-3-small"]
+    add_document("text-embedding-3-large")
+    # Unchanged version: the cached list is served.
+    assert documents.company_embedding_models(db_session, company.id) == ["text-embedding-3-small"]
+    documents.bump_document_version(company.id)
+    assert sorted(documents.company_embedding_models(db_session, company.id)) == [
+        "text-embedding-3-large", "text-embedding-3-small",
+    ]
+
+
+def test_streamed_xlsx_chunks_match_whole_text(tmp_path):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Ledger"
+    for row in range(300):
+        sheet.append([f"2025-01-{row % 28 + 1:02d}", f"Invoice {row}", row * 12.5, None])
+    path = tmp_path / "ledger.xlsx"
+    workbook.save(path)
+
+    rows = list(iter_text(path, "xlsx"))
+    assert rows[0] == "# Sheet: Ledger"
+    assert rows[2] == "2025-01-02 | Invoice 1 | 12.5"
+    streamed = list(iter_chunks(iter_text(path, "xlsx"), max_chars=500, overlap=80))
+    assert len(streamed) > 1
+    assert streamed == list(chunk_text(extract_text(path, "xlsx"), max_chars=500, overlap=80))
+    assert all(left[-80:] == right[:80] for left, right in zip(streamed, streamed[1:]))
+
+
+def test_document_pipeline_parses_in_processes_and_embeds(monkeypatch, tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from app.core.config import settings
+    from app.core.database import Base
+    from app.models.models import Document, DocumentChunk
+    from app.services import document_pipeline
+
+    monkeypatch.setattr(settings, "embedding_provider", "hash")
+    monkeypatch.setattr(settings, "document_storage_path", str(tmp_path))
+    monkeypatch.setattr(settings, "document_parse_workers", 2)
+    engine = create_engine(f"sqlite:///{tmp_path / 'pipeline.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    with Session(bind=engine) as db:
+        for index in range(4):
+            (tmp_path / f"ledger-{index}.csv").write_text(
+                "\n".join(f"2025-01-{day:02d},Invoice {index}-{day},{day * 10}" for day in range(1, 29)),
+                encoding="utf-8",
+            )
+            db.add(Document(company_id=1, filename=f"ledger-{index}.csv", file_type="csv",
+                            storage_path=f"ledger-{index}.csv", uploaded_by=1, chunk_size=300))
+        db.add(Document(company_id=1, filename="missing.pdf", file_type="pdf", storage_path="missing.pdf", uploaded_by=1))
+        db.commit()
+        ids = [document.id for document in db.query(Document).all()]
+
+    summary = document_pipeline.run_document_pipeline(engine, ids)
+
+    assert summary["documents"] == 5
+    assert summary["indexed"] == 4
+    assert summary["failed"] == 1
+    with Session(bind=engine) as db:
+        statuses = {document.filename: (document.status, document.indexed_chunks) for document in db.query(Document)}
+        assert statuses["missing.pdf"][0] == "error"
+        assert all(status == ("indexed", summary["chunks"] // 4) for name, status in statuses.items() if name != "missing.pdf")
+        assert db.query(DocumentChunk).count() == summary["chunks"]
+
+
+def test_reindex_fans_out_batches_on_the_documents_queue(monkeypatch, db_session):
+    from app import worker
+    from app.models.models import Company, Document
+
+    company = Company(name="Reindex Co")
+    db_session.add(company)
+    db_session.commit()
+    for index in range(5):
+        db_session.add(Document(company_id=company.id, filename=f"{index}.csv", file_type="csv",
+                                storage_path=f"{index}.csv", uploaded_by=1, status="indexed", indexed_chunks=3))
+    db_session.commit()
+    dispatched = []
+    monkeypatch.setattr(worker, "SessionLocal", lambda: db_session)
+    monkeypatch.setattr(worker.reindex_document_batch, "delay", dispatched.append)
+    monkeypatch.setattr(worker.settings, "document_reindex_batch_size", 2)
+
+    assert worker.reindex_documents(company.id) == {"queued": 5, "batches": 3}
+    assert [len(batch) for batch in dispatched] == [2, 2, 1]
+    assert {document.status for document in db_session.query(Document)} == {"queued"}
+    for task in ("process_document", "reindex_documents", "reindex_document_batch"):
+        assert worker.celery.conf.task_routes[f"app.worker.{task}"] == {"queue": "documents"}
+
+
+def test_process_document_streams_chunks_into_embedding(monkeypatch, tmp_path, db_session):
+    from types import GeneratorType
+    from app import worker
+    from app.models.models import Company, Document
+
+    company = Company(name="Stream Co")
+    db_session.add(company)
+    db_session.commit()
+    (tmp_path / "notes.csv").write_text("a,b\nc,d\n")
+    document = Document(company_id=company.id, filename="notes.csv", file_type="csv", storage_path="notes.csv",
+                        uploaded_by=1)
+    db_session.add(document)
+    db_session.commit()
+    received = []
+    monkeypatch.setattr(worker.settings, "document_storage_path", str(tmp_path))
+    monkeypatch.setattr(worker, "SessionLocal", lambda: db_session)
+    monkeypatch.setattr(worker, "embed_document", lambda db, document_id, chunks: received.append(chunks))
+
+    assert worker.process_document(document.id) == "ok"
+    assert isinstance(received[0], GeneratorType)
+    assert list(received[0]) == ["a | b c | d"]
+
+
+def test_reciprocal_rank_fusion_merges_vector_and_text_rankings():
+    from app.services.documents import reciprocal_rank_fusion
+
+    semantic = [{"chunk_id": 1, "distance": 0.1}, {"chunk_id": 2, "distance": 0.2}, {"chunk_id": 3, "distance": 0.3}]
+    lexical = [{"chunk_id": 3, "text_rank": 0.9}, {"chunk_id": 4, "text_rank": 0.5}]
+    fused = reciprocal_rank_fusion([semantic, lexical], k=60)
+    assert [item["chunk_id"] for item in fused] == [3, 1, 2, 4]
+    assert fused[0]["distance"] == 0.3 and fused[0]["text_rank"] == 0.9
+    assert fused[0]["rrf_score"] == 1 / 63 + 1 / 61
+
+
+def test_text_search_uses_generated_column_and_or_query():
+    from sqlalchemy.dialects import postgresql
+    from app.services.documents import chunk_search_vector, text_search_query
+
+    compiled = chunk_search_vector.op("@@")(text_search_query("invoice INV-2024-001 from Acme?")).compile(
+        dialect=postgresql.dialect(),
+    )
+    assert str(compiled).startswith("document_chunks.content_tsv @@ websearch_to_tsquery(")
+    assert list(compiled.params.values()) == ["english", "invoice or INV-2024-001 or from or Acme"]
+
+
+def test_store_document_chunks_bulk_inserts_in_one_transaction(monkeypatch, db_session):
+    from app.core.config import settings
+    from app.models.models import Document, DocumentChunk
+    from app.services import documents, embeddings
+
+    class FakeRedis:
+        def __init__(self):
+            self.history = []
+
+        def set(self, key, value, ex=None):
+            self.history.append(value)
+
+        def delete(self, key):
+            self.history.append(None)
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(documents, "get_redis", lambda: fake_redis)
+    monkeypatch.setattr(settings, "embedding_provider", "hash")
+    monkeypatch.setattr(settings, "document_ingest_batch_size", 2)
+
+    document = Document(company_id=1, filename="notes.csv", file_type="csv", storage_path="notes.csv", uploaded_by=1)
+    db_session.add(document)
+    db_session.commit()
+    db_session.add(DocumentChunk(
+        document_id=document.id, company_id=1, chunk_index=0, content="stale", embedding=[1.0], embedding_dim=1,
+    ))
+    db_session.commit()
+
+    count = documents.store_document_chunks(db_session, document, [f"chunk {index}" for index in range(5)])
+
+    assert count == 5
+    assert fake_redis.history == [2, 4, 5, None]
+    assert db_session.query(Document.indexed_chunks).scalar() == 5
+    rows = db_session.query(DocumentChunk).order_by(DocumentChunk.chunk_index).all()
+    assert [row.content for row in rows] == [f"chunk {index}" for index in range(5)]
+    assert [row.chunk_index for row in rows] == list(range(5))
+
+    # A failure in a later group leaves the previous chunks untouched.
+    embed = embeddings.embed_texts
+    calls = []
+
+    def failing_embed(texts, *args, **kwargs):
+        calls.append(texts)
+        if len(calls) == 2:
+            raise RuntimeError("provider down")
+        return embed(texts, *args, **kwargs)
+
+    monkeypatch.setattr(embeddings, "embed_texts", failing_embed)
+    with pytest.raises(RuntimeError):
+        documents.store_document_chunks(db_session, document, [f"new {index}" for index in range(5)])
+    db_session.rollback()
+    assert [row.content for row in db_session.query(DocumentChunk).order_by(DocumentChunk.chunk_index)] == [
+        f"chunk {index}" for index in range(5)
+    ]
+
+
+def test_metadata_filter_translates_dify_conditions_to_sql(db_session):
+    from datetime import datetime
+    from app.models.models import Document
+    from app.services.documents import metadata_filter
+
+    for filename, file_type, uploaded_at in [
+        ("q1-invoices.pdf", "pdf", datetime(2025, 1, 15, 9, 0)),
+        ("q1-ledger.xlsx", "xlsx", datetime(2025, 3, 31, 23, 30)),
+        ("q2-ledger.xlsx", "xlsx", datetime(2025, 4, 1, 8, 0)),
+        ("100%_refunds.csv", "csv", datetime(2025, 5, 2, 12, 0)),
+    ]:
+        db_session.add(Document(company_id=1, filename=filename, file_type=file_type, storage_path=filename,
+                                uploaded_by=1, uploaded_at=uploaded_at))
+    db_session.commit()
+
+    def names(conditions, logical_operator=None):
+        clause = metadata_filter(conditions, logical_operator)
+        query = db_session.query(Document.filename).order_by(Document.id)
+        return [row[0] for row in (query.filter(clause) if clause is not None else query)]
+
+    assert names([{"name": ["file_type"], "comparison_operator": "is", "value": "xlsx"}]) == [
+        "q1-ledger.xlsx", "q2-ledger.xlsx",
+    ]
+    assert names([
+        {"name": "uploaded_at", "comparison_operator": "after", "value": "2025-01-15"},
+        {"name": "uploaded_at", "comparison_operator": "≤", "value": "2025-03-31"},
+    ]) == ["q1-ledger.xlsx"]
+    assert names([{"name": "upload_date", "comparison_operator": "between", "value": ["2025-03-31", "2025-04-01"]}]) == [
+        "q1-ledger.xlsx", "q2-ledger.xlsx",
+    ]
+    assert names([
+        {"name": "filename", "comparison_operator": "start with", "value": "q1"},
+        {"name": "document_id", "comparison_operator": "in", "value": "4"},
+    ], "or") == ["q1-invoices.pdf", "q1-ledger.xlsx", "100%_refunds.csv"]
+    assert names([{"name": "filename", "comparison_operator": "contains", "value": "0%_"}]) == ["100%_refunds.csv"]
+    assert names([{"name": "owner", "comparison_operator": "is", "value": "cfo"}]) == [
+        "q1-invoices.pdf", "q1-ledger.xlsx", "q2-ledger.xlsx", "100%_refunds.csv",
+    ]
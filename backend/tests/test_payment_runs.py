@@ -0,0 +1,140 @@
+from datetime import date
+import threading
+import pytest
+from app.core import config
+from app.connectors.wise.client import WiseApiClient, WiseApiError, WiseRetryableError
+from app.models.models import Bill, Company, WiseBatch, WisePaymentRun, WisePaymentRunItem
+from app.services.payment_runs import create_payment_run, execute_payment_run
+
+
+def _bills(db_session, count):
+    company = Company(name="Pay Co")
+    db_session.add(company)
+    db_session.flush()
+    bills = [
+        Bill(company_id=company.id, vendor=f"Vendor {index}", amount=100.0 + index, due_date=date(2026, 3, 1), status="open")
+        for index in range(count)
+    ]
+    db_session.add_all(bills)
+    db_session.commit()
+    return company, bills
+
+
+def test_payment_run_is_idempotent_and_resumes(monkeypatch, db_session):
+    monkeypatch.setattr(config.settings, "wise_write_enabled", True)
+    company, bills = _bills(db_session, 4)
+    items = [{"bill_id": bill.id, "payee_id": f"payee-{bill.id}", "currency": "gbp"} for bill in bills]
+    run = create_payment_run(db_session, company.id, "sandbox", items, reference="March run")
+    assert create_payment_run(db_session, company.id, "sandbox", list(reversed(items)), reference="March run").id == run.id
+    assert db_session.query(WisePaymentRunItem).count() == 4
+
+    flaky_payee = f"payee-{bills[1].id}"
+    rejected_payee = f"payee-{bills[2].id}"
+    calls = {"batch": 0, "fund": 0, "payments": []}
+    lock = threading.Lock()
+    state = {"flaky_failed": False}
+
+    def fake_send(self, method, path, token, params=None, json=None):
+        if path.endswith("/fund"):
+            calls["fund"] += 1
+            return {"status": "COMPLETED"}
+        if path.endswith("/payments"):
+            with lock:
+                calls["payments"].append(json["targetAccount"])
+            if json["targetAccount"] == rejected_payee:
+                raise WiseApiError("Wise API error 422: invalid recipient", 422)
+            if json["targetAccount"] == flaky_payee and not state["flaky_failed"]:
+                state["flaky_failed"] = True
+                raise WiseRetryableError("Wise API error 503", 503, retry_after=3)
+            return {"id": f"tr-{json['targetAccount']}"}
+        calls["batch"] += 1
+        return {"id": "bg-1"}
+
+    monkeypatch.setattr(WiseApiClient, "send", fake_send)
+    monkeypatch.setattr(WiseApiClient, "auth_token", lambda self: "token")
+
+    # A worker that dies after the batch group is stored but before the run records it resumes
+    # with the same group instead of opening another one.
+    original_commit = db_session.commit
+    commits = {"count": 0}
+
+    def dying_commit():
+        commits["count"] += 1
+        original_commit()
+        if commits["count"] == 1:
+            raise RuntimeError("worker died")
+
+    monkeypatch.setattr(db_session, "commit", dying_commit)
+    with pytest.raises(RuntimeError):
+        execute_payment_run(db_session, run.id)
+    monkeypatch.setattr(db_session, "commit", original_commit)
+    db_session.rollback()
+    db_session.refresh(run)
+    assert run.wise_batch_id is None
+    assert calls["batch"] == 1
+
+    with pytest.raises(WiseRetryableError) as pending:
+        execute_payment_run(db_session, run.id)
+    assert pending.value.retry_after == 3
+    db_session.refresh(run)
+    assert run.status == "adding"
+    assert (run.added_items, run.failed_items) == (2, 1)
+    assert calls["fund"] == 0
+
+    run = execute_payment_run(db_session, run.id)
+    assert run.status == "funded"
+    assert calls["batch"] == 1
+    assert calls["fund"] == 1
+    assert db_session.query(WiseBatch).count() == 1
+    # Only the item that hit a transient error is sent again.
+    assert len(calls["payments"]) == 5
+    assert calls["payments"].count(flaky_payee) == 2
+    statuses = {bill.id: bill.status for bill in db_session.query(Bill).all()}
+    assert statuses[bills[2].id] == "open"
+    assert sorted(status for bill_id, status in statuses.items() if bill_id != bills[2].id) == ["paid"] * 3
+    keys = [item.idempotency_key for item in db_session.query(WisePaymentRunItem).all()]
+    assert len(set(keys)) == 4
+    assert execute_payment_run(db_session, run.id).status == "funded"
+    assert calls["fund"] == 1
+    assert db_session.query(WisePaymentRun).count() == 1
+
+
+def test_payment_run_rejects_bills_that_are_paid_or_already_queued(db_session):
+    company, bills = _bills(db_session, 3)
+    bills[0].status = "paid"
+    db_session.commit()
+
+    with pytest.raises(ValueError, match="already paid"):
+        create_payment_run(db_session, company.id, "sandbox", [{"bill_id": bills[0].id, "payee_id": "p", "currency": "GBP"}])
+    with pytest.raises(ValueError, match="only appear once"):
+        create_payment_run(db_session, company.id, "sandbox", [
+            {"bill_id": bills[1].id, "payee_id": "p", "currency": "GBP"},
+            {"bill_id": bills[1].id, "payee_id": "p", "currency": "GBP"},
+        ])
+
+    queued = create_payment_run(db_session, company.id, "sandbox", [{"bill_id": bills[1].id, "payee_id": "p", "currency": "GBP"}])
+    with pytest.raises(ValueError, match="another payment run"):
+        create_payment_run(
+            db_session, company.id, "sandbox", [{"bill_id": bills[1].id, "payee_id": "p", "currency": "GBP"}],
+            reference="Second attempt",
+        )
+    queued.status = "failed"
+    db_session.commit()
+    assert create_payment_run(
+        db_session, company.id, "sandbox", [{"bill_id": bills[1].id, "payee_id": "p", "currency": "GBP"}],
+        reference="Second attempt",
+    ).id != queued.id
+
+
+def test_payment_run_keys_identical_items_and_idempotency_keys_per_company(db_session):
+    company, _ = _bills(db_session, 0)
+    other = Company(name="Other Co")
+    db_session.add(other)
+    db_session.commit()
+    payment = {"payee_id": "payee-1", "amount": 50, "currency": "EUR"}
+
+    run = create_payment_run(db_session, company.id, "sandbox", [payment, dict(payment)], idempotency_key="k-1")
+    keys = [item.idempotency_key for item in db_session.query(WisePaymentRunItem).filter_by(payment_run_id=run.id)]
+    assert len(set(keys)) == 2
+    other_run = create_payment_run(db_session, other.id, "sandbox", [payment], idempotency_key="k-1")
+    assert other_run.id != run.id
@@ -0,0 +1,115 @@
+from datetime import date, datetime, timedelta
+from app.models.models import BankAccount, BankTransaction, Company, Payout, ReconciliationMatch, StripeBalanceTransaction
+from app.services.reconciliation import assign, reconcile_payouts
+
+
+def _company_with_account(db_session, currency="USD"):
+    company = Company(name="Recon Co", currency=currency)
+    db_session.add(company)
+    db_session.flush()
+    account = BankAccount(company_id=company.id, name="Main", currency=currency)
+    db_session.add(account)
+    db_session.flush()
+    return company, account
+
+
+def _credit(company, account, posted_at, amount, currency=None):
+    return BankTransaction(
+        company_id=company.id,
+        bank_account_id=account.id,
+        posted_at=posted_at,
+        amount=amount,
+        currency=currency,
+    )
+
+
+def test_assign_prefers_lowest_total_cost():
+    assert sorted(assign([[1, 2], [1, 10]])) == [(0, 1), (1, 0)]
+    assert sorted(assign([[5], [1], [3]])) == [(1, 0)]
+
+
+def test_reconcile_matches_exact_and_ambiguous_payouts_once(db_session):
+    company, account = _company_with_account(db_session)
+    day = date(2026, 3, 2)
+    db_session.add_all([
+        Payout(company_id=company.id, amount=120.0, payout_date=day),
+        # Two equal payouts a day apart compete for two equal credits.
+        Payout(company_id=company.id, amount=80.0, payout_date=day),
+        Payout(company_id=company.id, amount=80.0, payout_date=day + timedelta(days=1)),
+        Payout(company_id=company.id, amount=55.0, payout_date=day),
+        StripeBalanceTransaction(
+            company_id=company.id, stripe_id="po_1", type="payout", currency="usd",
+            gross_amount=-300.0, fee=0.0, net_amount=-300.0,
+            created=datetime(2026, 3, 1), available_on=datetime(2026, 3, 3),
+        ),
+        # A failed payout never reaches the bank, so it must not claim the equal credit.
+        StripeBalanceTransaction(
+            company_id=company.id, stripe_id="txn_po_2", type="payout", currency="usd", source_id="po_2",
+            gross_amount=-400.0, fee=0.0, net_amount=-400.0,
+            created=datetime(2026, 3, 1), available_on=datetime(2026, 3, 3),
+        ),
+        StripeBalanceTransaction(
+            company_id=company.id, stripe_id="txn_pf_2", type="payout_failure", currency="usd", source_id="po_2",
+            gross_amount=400.0, fee=0.0, net_amount=400.0, created=datetime(2026, 3, 4),
+        ),
+        _credit(company, account, day + timedelta(days=1), 400.0),
+        _credit(company, account, day + timedelta(days=2), 120.0),
+        _credit(company, account, day + timedelta(days=2), 80.0),
+        _credit(company, account, day + timedelta(days=3), 80.0),
+        _credit(company, account, day + timedelta(days=1), 300.0),
+        _credit(company, account, day, -55.0),
+        _credit(company, account, day, 55.0, currency="EUR"),
+    ])
+    db_session.commit()
+
+    result = reconcile_payouts(db_session, company.id)
+    assert result["matched"] == 4
+    assert result["methods"] == {"exact": 2, "assignment": 2}
+    assert [item["amount"] for item in result["unmatched"]] == [55.0]
+
+    matches = {(m.payout_source, m.amount, m.payout_date): m.posted_at for m in db_session.query(ReconciliationMatch)}
+    assert matches[("payout", 80.0, day)] == day + timedelta(days=2)
+    assert matches[("payout", 80.0, day + timedelta(days=1))] == day + timedelta(days=3)
+    assert matches[("stripe", 300.0, date(2026, 3, 3))] == day + timedelta(days=1)
+
+    rerun = reconcile_payouts(db_session, company.id)
+    assert (rerun["payouts"], rerun["matched"]) == (1, 0)
+    assert db_session.query(ReconciliationMatch).count() == 4
+
+
+def test_reconcile_a_year_of_daily_payouts_scales_with_candidates(monkeypatch, db_session):
+    from app.services import reconciliation
+
+    company, account = _company_with_account(db_session)
+    start = date(2025, 1, 1)
+    rows = []
+    for offset in range(365):
+        day = start + timedelta(days=offset)
+        rows.append(Payout(company_id=company.id, amount=1000.0, payout_date=day))
+        rows.append(_credit(company, account, day + timedelta(days=2), 1000.0))
+        rows += [_credit(company, account, day, float(amount)) for amount in range(10, 20)]
+    db_session.add_all(rows)
+    db_session.commit()
+
+    recorded = {"edges": {}, "assignments": []}
+    candidates, assign_pairs = reconciliation._candidates, reconciliation.assign
+
+    def spy_candidates(*args):
+        recorded["edges"] = candidates(*args)
+        return recorded["edges"]
+
+    def spy_assign(cost):
+        recorded["assignments"].append((len(cost), len(cost[0])))
+        return assign_pairs(cost)
+
+    monkeypatch.setattr(reconciliation, "_candidates", spy_candidates)
+    monkeypatch.setattr(reconciliation, "assign", spy_assign)
+    result = reconcile_payouts(db_session, company.id)
+    assert result["matched"] == 365
+    # The amount/day index only pairs each payout with same-amount credits inside its date window,
+    # never with the 3650 other credits, and no assignment matrix outgrows the configured cap.
+    window = 2 * reconciliation.settings.reconciliation_date_tolerance_days + 1
+    assert 365 <= sum(len(found) for found in recorded["edges"].values()) <= 365 * window
+    cap = reconciliation.settings.reconciliation_max_assignment_size
+    assert all(rows * columns <= cap ** 2 for rows, columns in recorded["assignments"])
+    assert {(m.posted_at - m.payout_date).days for m in db_session.query(ReconciliationMatch)} == {2}
@@ -0,0 +1,288 @@
+from datetime import date, datetime, timedelta, timezone
+import pytest
+from app.integrations.stripe_api import StripeApiError
+from app.models.models import AuditLog, Company, Integration, StripeBalanceTransaction, StripeMetric, StripeSyncState, SyncRun
+from app.services import stripe_jobs, stripe_ledger, stripe_metrics
+
+
+def _item(stripe_id, created, type_="charge", status="available", gross=100.0, fee=3.2):
+    return {
+        "id": stripe_id,
+        "type": type_,
+        "status": status,
+        "date": created.isoformat(),
+        "gross_amount": gross,
+        "stripe_fee": fee,
+        "net_amount": gross - fee,
+        "margin_pct": 0.0,
+        "currency": "USD",
+        "available_on": (created + timedelta(days=2)).isoformat(),
+        "source_id": f"src_{stripe_id}",
+    }
+
+
+def test_ledger_sync_is_incremental_and_reports_locally(monkeypatch, db_session):
+    company = Company(name="Ledger Co")
+    db_session.add(company)
+    db_session.commit()
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    payout = {
+        "payout_status": "in_transit",
+        "payout_arrival_date": (now + timedelta(days=3)).isoformat(),
+        "payout_method": "standard",
+        "payout_type": "bank_account",
+    }
+    pages = [
+        [
+            _item("txn_1", now - timedelta(days=3)),
+            _item("txn_2", now - timedelta(days=2), status="pending"),
+            _item("txn_3", now - timedelta(days=1), type_="payout", gross=-500.0, fee=0.0) | payout,
+        ],
+        [
+            _item("txn_2", now - timedelta(days=2), status="available"),
+            _item("txn_3", now - timedelta(days=1), type_="payout", gross=-500.0, fee=0.0) | payout | {"payout_status": "failed"},
+            _item("txn_4", now - timedelta(hours=1)),
+            _item("txn_5", now - timedelta(minutes=30), type_="payout_failure", gross=500.0, fee=0.0) | {"source_id": "src_txn_3"},
+        ],
+    ]
+    requests_seen = []
+
+    def fake_stream(path, credentials, payload=None):
+        requests_seen.append(payload)
+        for item in pages[len(requests_seen) - 1]:
+            yield "balance_transaction", item
+
+    monkeypatch.setattr(stripe_ledger, "stripe_api_stream", fake_stream)
+    monkeypatch.setattr(stripe_ledger.settings, "stripe_ledger_batch_size", 2)
+    credentials = {"stripe_account": "acct_1"}
+
+    assert stripe_ledger.sync_stripe_ledger(db_session, company.id, credentials)["fetched"] == 3
+    assert "start_date" in requests_seen[0]
+    state = db_session.query(StripeSyncState).one()
+    assert state.last_balance_transaction_id == "txn_3"
+
+    report = stripe_ledger.ledger_balance_payouts(db_session, company.id)
+    assert report["payouts"][0]["status"] == "in_transit"
+
+    stripe_ledger.sync_stripe_ledger(db_session, company.id, credentials)
+    # The second pull starts at the oldest still-pending transaction, not the full window.
+    assert requests_seen[1]["created_after"] == int((now - timedelta(days=2)).timestamp())
+    assert db_session.query(StripeBalanceTransaction).count() == 5
+    assert db_session.query(StripeBalanceTransaction).filter_by(stripe_id="txn_2").one().status == "available"
+    db_session.refresh(state)
+    assert state.last_balance_transaction_id == "txn_5"
+
+    margin = stripe_ledger.ledger_true_net_margin(db_session, company.id)
+    assert [item["id"] for item in margin] == ["txn_5", "txn_4", "txn_3", "txn_2", "txn_1"]
+    assert margin[1]["margin_pct"] == 96.8
+    report = stripe_ledger.ledger_balance_payouts(db_session, company.id)
+    assert report["balance_count"] == 5
+    # Payouts carry the payout's own status, arrival date and method, not the balance transaction's.
+    assert report["payouts"] == [{
+        "payout_id": "src_txn_3",
+        "amount": 500.0,
+        "currency": "USD",
+        "status": "failed",
+        "arrival_date": (now + timedelta(days=3)).isoformat(),
+        "created_at": (now - timedelta(days=1)).isoformat(),
+        "method": "standard",
+        "payout_type": "bank_account",
+    }]
+
+    # Without the payout's own status, the payout_failure row alone still marks it as failed.
+    db_session.query(StripeBalanceTransaction).filter_by(stripe_id="txn_3").update({"payout_status": "paid"})
+    db_session.commit()
+    assert stripe_ledger.ledger_balance_payouts(db_session, company.id)["payouts"][0]["status"] == "failed"
+
+
+def test_ledger_backfills_on_demand_for_older_report_ranges(monkeypatch, db_session):
+    company = Company(name="History Co")
+    db_session.add(company)
+    db_session.commit()
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    old = now - timedelta(days=200)
+    requests_seen = []
+
+    def fake_stream(path, credentials, payload=None):
+        requests_seen.append(payload)
+        if "end_date" in payload:
+            yield "balance_transaction", _item("txn_old", old)
+        else:
+            yield "balance_transaction", _item("txn_new", now - timedelta(days=1))
+
+    monkeypatch.setattr(stripe_ledger, "stripe_api_stream", fake_stream)
+    stripe_ledger.sync_stripe_ledger(db_session, company.id, {})
+    state = db_session.query(StripeSyncState).one()
+    assert state.backfilled_from == date.today() - timedelta(days=stripe_ledger.settings.stripe_ledger_backfill_days)
+
+    covered_from = state.backfilled_from
+    start = old.date() - timedelta(days=1)
+    counts = stripe_ledger.sync_stripe_ledger(db_session, company.id, {}, backfill_from=start)
+    assert counts["backfilled"] == 1
+    assert requests_seen[-1] == {"limit": None, "start_date": start.isoformat(), "end_date": covered_from.isoformat()}
+    db_session.refresh(state)
+    assert state.backfilled_from == start
+    assert [item["id"] for item in stripe_ledger.ledger_true_net_margin(db_session, company.id, start.isoformat())] == [
+        "txn_new", "txn_old",
+    ]
+
+    stripe_ledger.sync_stripe_ledger(db_session, company.id, {}, backfill_from=start)
+    assert "end_date" not in requests_seen[-1]
+
+
+def test_stripe_api_stream_reads_ndjson_lines(monkeypatch):
+    import json
+    import pytest
+    from app.integrations import stripe_api
+
+    class FakeResponse:
+        def __init__(self, lines):
+            self.lines = lines
+
+        def raise_for_status(self):
+            return None
+
+        def iter_lines(self):
+            return iter(self.lines)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    lines = [
+        json.dumps({"kind": "revenue", "item": {"amount_gross": 1.0}}).encode(),
+        b"",
+        json.dumps({"kind": "summary", "counts": {"revenue": 1}, "count": 1}).encode(),
+    ]
+    monkeypatch.setattr(stripe_api._session, "post", lambda *args, **kwargs: FakeResponse(lines))
+    assert list(stripe_api.stripe_api_stream("/sync/revenue", {})) == [("revenue", {"amount_gross": 1.0})]
+
+    truncated = lines[:1]
+    monkeypatch.setattr(stripe_api._session, "post", lambda *args, **kwargs: FakeResponse(truncated))
+    with pytest.raises(stripe_api.StripeApiError):
+        list(stripe_api.stripe_api_stream("/sync/revenue", {}))
+
+
+def test_stripe_jobs_record_sync_runs(monkeypatch, db_session):
+    company = Company(name="Jobs Co")
+    db_session.add(company)
+    db_session.commit()
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def fake_stream(path, credentials, payload=None):
+        yield "balance_transaction", _item("txn_1", now - timedelta(hours=2))
+
+    monkeypatch.setattr(stripe_ledger, "stripe_api_stream", fake_stream)
+    run = stripe_jobs.queue_stripe_job(db_session, company.id, "true_net_margin", "task-1")
+    assert (run.status, run.provider, run.environment) == ("queued", "stripe", "default")
+
+    result = stripe_jobs.run_stripe_job(db_session, run.id, "true_net_margin", {"start_date": None, "end_date": None})
+    assert result["count"] == 1
+    db_session.refresh(run)
+    assert run.status == "success"
+    assert run.counts["job"] == "true_net_margin"
+    assert run.counts["fetched"] == 1
+    assert {"queued_ms", "duration_ms"} <= set(run.counts)
+
+    def failing_stream(path, credentials, payload=None):
+        raise StripeApiError("stripe-api unavailable")
+        yield
+
+    monkeypatch.setattr(stripe_jobs, "stripe_api_stream", failing_stream)
+    failed = stripe_jobs.queue_stripe_job(db_session, company.id, "revenue", "task-2")
+    with pytest.raises(StripeApiError):
+        stripe_jobs.run_stripe_job(db_session, failed.id, "revenue")
+    db_session.refresh(failed)
+    assert failed.status == "failed"
+    assert failed.error_summary == "stripe-api unavailable"
+    assert db_session.query(Integration).count() == 0
+    assert db_session.query(AuditLog).filter_by(action="stripe.sync.failed").count() == 1
+    assert db_session.query(SyncRun).count() == 2
+
+
+def test_revenue_job_folds_the_stream_into_totals(monkeypatch, db_session):
+    company = Company(name="Revenue Co")
+    db_session.add(company)
+    db_session.commit()
+
+    def fake_stream(path, credentials, payload=None):
+        for index in range(1000):
+            yield "revenue", {"amount_gross": 10.0, "fee": 0.3, "amount_net": 9.7, "currency": "usd" if index % 4 else "eur"}
+
+    monkeypatch.setattr(stripe_jobs, "stripe_api_stream", fake_stream)
+    run = stripe_jobs.queue_stripe_job(db_session, company.id, "revenue", "task-5")
+    result = stripe_jobs.run_stripe_job(db_session, run.id, "revenue")
+    assert result == {"count": 1000, "totals": [
+        {"currency": "EUR", "count": 250, "amount_gross": 2500.0, "fee": 75.0, "amount_net": 2425.0},
+        {"currency": "USD", "count": 750, "amount_gross": 7500.0, "fee": 225.0, "amount_net": 7275.0},
+    ]}
+    assert db_session.query(Integration).filter_by(company_id=company.id).one().status == "connected"
+
+
+def test_job_status_waits_for_the_stored_result(monkeypatch, db_session):
+    from types import SimpleNamespace
+    from app.api import connectors
+
+    company = Company(name="Poll Co")
+    db_session.add(company)
+    db_session.commit()
+    run = stripe_jobs.queue_stripe_job(db_session, company.id, "revenue", "task-9")
+    run.status = "success"
+    run.ended_at = datetime.now(timezone.utc)
+    db_session.commit()
+    stored = {}
+
+    class FakeResult:
+        def __init__(self, task_id):
+            self.result = stored.get(task_id)
+
+        def successful(self):
+            return self.result is not None
+
+    monkeypatch.setattr(connectors.celery, "AsyncResult", FakeResult)
+    user = SimpleNamespace(company_id=company.id)
+
+    assert connectors.connector_job_status(run.id, db_session, user)["status"] == "running"
+    stored["task-9"] = {"count": 3}
+    response = connectors.connector_job_status(run.id, db_session, user)
+    assert (response["status"], response["result"]) == ("success", {"count": 3})
+
+    # Past the grace window a missing result is reported as expired, not as still running.
+    del stored["task-9"]
+    run.ended_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+    db_session.commit()
+    response = connectors.connector_job_status(run.id, db_session, user)
+    assert (response["status"], response["result"]) == ("success", None)
+
+
+def test_stored_metrics_are_typed_deduped_and_aggregated(db_session):
+    company = Company(name="Metrics Co")
+    db_session.add(company)
+    db_session.commit()
+    day_one = datetime(2026, 1, 5, 9, tzinfo=timezone.utc)
+    day_two = datetime(2026, 1, 6, 23, tzinfo=timezone.utc)
+    items = [
+        _item("txn_1", day_one, gross=100.0, fee=3.0),
+        _item("txn_2", day_one + timedelta(hours=2), gross=50.0, fee=2.0),
+        _item("txn_3", day_two, gross=200.0, fee=6.0) | {"currency": "EUR"},
+    ]
+
+    assert stripe_metrics.store_metrics(db_session, company.id, items) == 3
+    assert stripe_metrics.store_metrics(db_session, company.id, items[:2] + [_item("txn_1", day_one, gross=100.0, fee=4.0)]) == 0
+    db_session.commit()
+    assert db_session.query(StripeMetric).count() == 3
+    assert db_session.query(StripeMetric).filter_by(stripe_id="txn_1").one().fee == 4.0
+
+    # The end date is inclusive of the whole day and filters on transaction date, not insert time.
+    rows = stripe_metrics.metrics_query(db_session, company.id, "2026-01-06", "2026-01-06").all()
+    assert [row.stripe_id for row in rows] == ["txn_3"]
+
+    daily = stripe_metrics.margin_by_day(db_session, company.id, "2026-01-01", "2026-01-31")
+    assert daily == [
+        {"date": "2026-01-05", "currency": "USD", "count": 2, "gross_amount": 150.0, "stripe_fee": 6.0,
+         "net_amount": 144.0, "margin_pct": 96.0},
+        {"date": "2026-01-06", "currency": "EUR", "count": 1, "gross_amount": 200.0, "stripe_fee": 6.0,
+         "net_amount": 194.0, "margin_pct": 97.0},
+    ]
@@ -3,8 +3,9 @@ import pytest
 from app.core import config
 from app.core.wise_encryption import wise_encrypt, wise_decrypt
 from app.connectors.wise.state import create_state, verify_state
-from app.connectors.wise.client import WiseApiClient, WiseApiError
+from app.connectors.wise.client import WiseApiClient, WiseApiError, WiseRetryableError
 from app.connectors.wise.connector import WiseConnector
+from app.connectors.wise.credentials import credential_cache, invalidate_wise_credentials
 from app.models.models import (
     Company,
     Integration,
@@ -17,6 +18,17 @@ from app.models.models import (
     BankTransaction,
 )
 from app.api.webhooks import verify_signature
+from app.connectors.wise import coalescing, receipts, webhook_routing
+from app.connectors.wise.webhook_routing import WebhookRoute, resolve_webhook_route, webhook_route_cache
+
+
+@pytest.fixture(autouse=True)
+def _clear_credential_cache():
+    credential_cache.clear()
+    webhook_route_cache.clear()
+    yield
+    credential_cache.clear()
+    webhook_route_cache.clear()
 
 
 def _rsa_keypair():
@@ -163,7 +175,7 @@ def test_sync_transactions_idempotent(monkeypatch, db_session):
     db_session.add(balance_account)
     db_session.commit()
 
-    def fake_request(self, method, path, params=None, json=None):
+    def fake_send(self, method, path, token, params=None, json=None):
         return {
             "transactions": [
                 {"id": "tx-1", "date": datetime.now(timezone.utc).isoformat(), "amount": 10, "currency": "USD", "description": "Test"}
@@ -171,7 +183,7 @@ def test_sync_transactions_idempotent(monkeypatch, db_session):
             "nextCursor": "cursor-1",
         }
 
-    monkeypatch.setattr(WiseApiClient, "request", fake_request)
+    monkeypatch.setattr(WiseApiClient, "send", fake_send)
     connector = WiseConnector(db_session, company.id, "sandbox")
     connector.sync_transactions()
     connector.sync_transactions()
@@ -217,3 +229,487 @@ def test_webhook_signature():
     body = b'{"eventType":"balance-updated"}'
     digest = __import__("hmac").new(secret.encode("utf-8"), body, __import__("hashlib").sha256).hexdigest()
     assert verify_signature(body, digest, secret) is True
+
+
+def test_credential_cache_avoids_repeat_decrypts(monkeypatch, db_session):
+    public_key, private_key = _rsa_keypair()
+    monkeypatch.setattr(config.settings, "wise_public_key", public_key)
+    monkeypatch.setattr(config.settings, "wise_private_key", private_key)
+    company = Company(name="Cache Co")
+    db_session.add(company)
+    db_session.flush()
+    settings_row = WiseSettings(
+        company_id=company.id,
+        wise_environment="sandbox",
+        wise_api_token_encrypted=wise_encrypt("token-1"),
+        key_version="v1",
+        updated_at=datetime.now(timezone.utc),
+    )
+    db_session.add(settings_row)
+    db_session.commit()
+
+    calls = []
+
+    def counting_decrypt(value):
+        calls.append(value)
+        return wise_decrypt(value)
+
+    fake = _FakeRedis()
+    monkeypatch.setattr("app.connectors.wise.credentials.get_redis", lambda: fake)
+    monkeypatch.setattr("app.connectors.wise.client.wise_decrypt", counting_decrypt)
+    client = WiseApiClient(db_session, company.id, "sandbox")
+    assert [client._api_token() for _ in range(5)] == ["token-1"] * 5
+    assert len(calls) == 1
+    stats = credential_cache.stats()
+    assert stats["hits"] == 4
+    assert stats["misses"] == 1
+
+    settings_row.wise_api_token_encrypted = wise_encrypt("token-2")
+    db_session.commit()
+    assert client._api_token() == "token-1"
+    invalidate_wise_credentials(company.id)
+    assert client._api_token() == "token-2"
+    assert len(calls) == 2
+
+    # Another process invalidating only bumps the Redis version; this process's entry is stale at once.
+    settings_row.wise_api_token_encrypted = wise_encrypt("token-3")
+    db_session.commit()
+    fake.incr(f"wise:credentials:version:{company.id}")
+    assert client._api_token() == "token-3"
+    assert len(calls) == 3
+
+
+def test_sync_transactions_follows_cursor_until_exhausted(monkeypatch, db_session):
+    public_key, private_key = _rsa_keypair()
+    monkeypatch.setattr(config.settings, "wise_public_key", public_key)
+    monkeypatch.setattr(config.settings, "wise_private_key", private_key)
+    company = Company(name="Paging Co")
+    db_session.add(company)
+    db_session.flush()
+    integration = Integration(company_id=company.id, type=IntegrationType.wise, status="connected", credentials={})
+    db_session.add(integration)
+    db_session.flush()
+    creds = IntegrationCredentialWise(
+        company_id=company.id,
+        integration_id=integration.id,
+        wise_environment="sandbox",
+        oauth_access_token_encrypted=wise_encrypt("token"),
+        oauth_refresh_token_encrypted=wise_encrypt("refresh"),
+        token_expires_at=None,
+        scopes=["profile"],
+        sync_cursor_transactions={},
+        key_version="v1",
+        created_at=datetime.now(timezone.utc),
+        updated_at=datetime.now(timezone.utc),
+    )
+    db_session.add(creds)
+    db_session.add(WiseBalanceAccount(
+        company_id=company.id,
+        wise_balance_account_id="bal-1",
+        wise_profile_id="profile-1",
+        currency="USD",
+        name="Balance",
+        status="active",
+        details={},
+        fetched_at=datetime.now(timezone.utc),
+    ))
+    db_session.commit()
+
+    pages = {
+        None: ("c1", ["tx-1", "tx-2"]),
+        "c1": ("c2", ["tx-3"]),
+        "c2": ("c3", ["tx-4"]),
+        "c3": (None, ["tx-5"]),
+    }
+    seen_cursors = []
+
+    def fake_send(self, method, path, token, params=None, json=None):
+        cursor = (params or {}).get("cursor")
+        seen_cursors.append(cursor)
+        next_cursor, ids = pages[cursor]
+        return {
+            "transactions": [
+                {"id": tx_id, "date": datetime.now(timezone.utc).isoformat(), "amount": 5, "currency": "USD"}
+                for tx_id in ids
+            ],
+            "nextCursor": next_cursor,
+        }
+
+    monkeypatch.setattr(WiseApiClient, "send", fake_send)
+    connector = WiseConnector(db_session, company.id, "sandbox")
+    assert connector.sync_transactions(max_pages=2) == 3
+    db_session.refresh(creds)
+    assert creds.sync_cursor_transactions["bal-1"] == "c2"
+
+    assert connector.sync_transactions() == 2
+    assert seen_cursors == [None, "c1", "c2", "c3"]
+    assert db_session.query(WiseTransactionRaw).count() == 5
+    db_session.refresh(creds)
+    assert creds.sync_cursor_transactions["bal-1"] == "c3"
+
+
+def test_store_transactions_upserts_changed_rows(monkeypatch, db_session):
+    company = Company(name="Upsert Co")
+    db_session.add(company)
+    db_session.flush()
+    bank_account = BankAccount(
+        company_id=company.id,
+        name="Wise Account",
+        currency="EUR",
+        balance=0.0,
+        provider="wise",
+        provider_account_id="bal-9",
+    )
+    balance_account = WiseBalanceAccount(
+        company_id=company.id,
+        wise_balance_account_id="bal-9",
+        wise_profile_id="profile-1",
+        currency="EUR",
+        details={},
+        fetched_at=datetime.now(timezone.utc),
+    )
+    db_session.add_all([bank_account, balance_account])
+    db_session.commit()
+    connector = WiseConnector(db_session, company.id, "sandbox")
+    page = [
+        {"id": "tx-1", "date": "2026-01-02T10:00:00Z", "amount": 10, "currency": "EUR"},
+        {"id": "tx-2", "date": "2026-01-03T10:00:00Z", "amount": -4, "currency": "EUR"},
+    ]
+    assert connector._store_transactions(balance_account, page) == 2
+    db_session.commit()
+    page[1] = page[1] | {"amount": -5}
+    assert connector._store_transactions(balance_account, page) == 2
+    db_session.commit()
+    assert db_session.query(WiseTransactionRaw).count() == 2
+    updated = db_session.query(BankTransaction).filter(BankTransaction.provider_transaction_id == "tx-2").one()
+    assert updated.amount == -5
+    assert updated.bank_account_id == bank_account.id
+
+
+def test_sync_balances_fetches_accounts_concurrently(monkeypatch, db_session):
+    import threading
+    import time
+    monkeypatch.setattr(config.settings, "wise_api_token", "api-token")
+    monkeypatch.setattr(config.settings, "wise_fetch_concurrency", 4)
+    company = Company(name="Concurrent Co")
+    db_session.add(company)
+    db_session.flush()
+    for idx in range(4):
+        db_session.add(WiseBalanceAccount(
+            company_id=company.id,
+            wise_balance_account_id=f"bal-{idx}",
+            wise_profile_id="profile-1",
+            currency="USD",
+            details={},
+            fetched_at=datetime.now(timezone.utc),
+        ))
+        db_session.add(BankAccount(
+            company_id=company.id,
+            name=f"Wise {idx}",
+            currency="USD",
+            balance=0.0,
+            provider="wise",
+            provider_account_id=f"bal-{idx}",
+        ))
+    db_session.commit()
+    barrier = threading.Barrier(4, timeout=5)
+
+    def fake_send(self, method, path, token, params=None, json=None):
+        assert token == "api-token"
+        barrier.wait()
+        time.sleep(0.01)
+        balance_account_id = path.split("/")[3]
+        return {"balances": [{"currency": "USD", "amount": int(balance_account_id[-1]) + 1}]}
+
+    monkeypatch.setattr(WiseApiClient, "send", fake_send)
+    connector = WiseConnector(db_session, company.id, "sandbox")
+    assert connector.sync_balances() == 4
+    balances = {account.provider_account_id: account.balance for account in db_session.query(BankAccount).all()}
+    assert balances == {"bal-0": 1, "bal-1": 2, "bal-2": 3, "bal-3": 4}
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def sadd(self, key, *values):
+        self.data.setdefault(key, set()).update(values)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def expire(self, key, ttl):
+        return key in self.data
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(values)
+
+    def lpop(self, key, count=None):
+        items = self.data.get(key, [])
+        popped, self.data[key] = items[:count], items[count:]
+        return popped or None
+
+    def lmove(self, src, dst, src_side, dst_side):
+        items = self.data.get(src, [])
+        if not items:
+            return None
+        item = items.pop(0 if src_side == "LEFT" else -1)
+        target = self.data.setdefault(dst, [])
+        target.insert(0 if dst_side == "LEFT" else len(target), item)
+        return item
+
+    def pipeline(self, transaction=True):
+        fake = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+            def execute(self):
+                return [getattr(fake, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+        return Pipeline()
+
+    def rename(self, src, dst):
+        import redis
+        if src not in self.data:
+            raise redis.ResponseError("no such key")
+        self.data[dst] = self.data.pop(src)
+
+
+def test_webhook_burst_coalesces_into_one_sync(monkeypatch):
+    fake = _FakeRedis()
+    clock = {"now": 1000.0}
+    monkeypatch.setattr(coalescing.time, "time", lambda: clock["now"])
+    monkeypatch.setattr(config.settings, "wise_webhook_quiet_seconds", 5.0)
+    monkeypatch.setattr(config.settings, "wise_webhook_max_delay_seconds", 30.0)
+
+    scheduled = [
+        coalescing.mark_dirty(1, "sandbox", coalescing.scopes_for_event(event), fake)
+        for event in ["balances#update", "balances#update", "transfers#state-change"]
+    ]
+    assert scheduled == [True, False, False]
+    assert coalescing.mark_dirty(2, "sandbox", {"transactions"}, fake) is True
+
+    clock["now"] = 1003.0
+    coalescing.mark_dirty(1, "sandbox", coalescing.scopes_for_event("balances#update"), fake)
+    assert coalescing.seconds_until_sync(1, "sandbox", fake) == pytest.approx(5.0)
+
+    # Continuous traffic cannot push the sync past the max-delay cap.
+    clock["now"] = 1028.0
+    coalescing.mark_dirty(1, "sandbox", {"balances"}, fake)
+    assert coalescing.seconds_until_sync(1, "sandbox", fake) == pytest.approx(2.0)
+
+    clock["now"] = 1030.0
+    assert coalescing.seconds_until_sync(1, "sandbox", fake) == 0
+    assert coalescing.claim_scopes(1, "sandbox", fake) == {"balances", "transactions", "transfers"}
+    assert coalescing.claim_scopes(1, "sandbox", fake) == set()
+
+    # Timestamps that expired while scopes remain must not defer again.
+    fake.sadd(coalescing._key(1, "sandbox", "scopes"), "balances")
+    assert coalescing.seconds_until_sync(1, "sandbox", fake) == 0
+    assert coalescing.claim_scopes(1, "sandbox", fake) == {"balances"}
+    assert coalescing.mark_dirty(1, "sandbox", {"transactions"}, fake) is True
+
+
+def test_coalesced_sync_retry_carries_its_scopes(monkeypatch):
+    from app import worker
+
+    fake = _FakeRedis()
+    monkeypatch.setattr(coalescing, "get_redis", lambda: fake)
+    monkeypatch.setattr(config.settings, "wise_webhook_quiet_seconds", 0.0)
+    coalescing.mark_dirty(1, "sandbox", {"balances"}, fake)
+    queued = []
+    monkeypatch.setattr(worker.wise_coalesced_sync, "apply_async", lambda args, countdown: queued.append((args, countdown)))
+    attempts = []
+
+    def flaky_incremental(company_id, environment, scopes, retries=0):
+        attempts.append(set(scopes))
+        if len(attempts) == 1:
+            raise WiseRetryableError("Wise API error 429", 429, retry_after=3600)
+        return "ok"
+
+    monkeypatch.setattr(worker, "_wise_incremental", flaky_incremental)
+    assert worker.wise_coalesced_sync(1, "sandbox") == "retrying"
+    (args, countdown), = queued
+    assert args == (1, "sandbox", 1, ["balances"])
+    assert countdown >= 3600
+
+    # The coalescing keys are long gone by the time the retry runs.
+    fake.data.clear()
+    assert worker.wise_coalesced_sync(*args) == "ok"
+    assert attempts == [{"balances"}, {"balances"}]
+
+
+def test_webhook_route_is_loaded_once(monkeypatch, db_session):
+    public_key, private_key = _rsa_keypair()
+    monkeypatch.setattr(config.settings, "wise_public_key", public_key)
+    monkeypatch.setattr(config.settings, "wise_private_key", private_key)
+    company = Company(name="Route Co")
+    db_session.add(company)
+    db_session.flush()
+    db_session.add(WiseSettings(
+        company_id=company.id,
+        wise_environment="sandbox",
+        webhook_secret_encrypted=wise_encrypt("hook-secret"),
+        updated_at=datetime.now(timezone.utc),
+    ))
+    db_session.commit()
+    monkeypatch.setattr(config.settings, "primary_company_id", company.id)
+    monkeypatch.setattr("app.connectors.wise.webhook_routing.SessionLocal", lambda: db_session)
+    calls = []
+
+    def counting_decrypt(value):
+        calls.append(value)
+        return wise_decrypt(value)
+
+    fake = _FakeRedis()
+    monkeypatch.setattr("app.connectors.wise.webhook_routing.get_redis", lambda: fake)
+    monkeypatch.setattr("app.connectors.wise.webhook_routing.wise_decrypt", counting_decrypt)
+    routes = [resolve_webhook_route("") for _ in range(3)]
+    assert routes[0] == WebhookRoute(company_id=company.id, environment="sandbox", secret="hook-secret")
+    assert routes.count(routes[0]) == 3
+    assert len(calls) == 1
+
+    # A secret rotated in another process only bumps the Redis version; this process reloads at once.
+    db_session.query(WiseSettings).update({"webhook_secret_encrypted": wise_encrypt("rotated")})
+    db_session.commit()
+    fake.incr(webhook_routing.ROUTES_VERSION_KEY)
+    assert resolve_webhook_route("").secret == "rotated"
+    assert len(calls) == 2
+
+
+def test_webhook_receive_path_buffers_receipts(monkeypatch, db_session):
+    import hmac
+    import json
+    from hashlib import sha256
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.api.webhooks import router
+    from app.models.models import AuditLog, WiseWebhookReceipt
+
+    company = Company(name="Hook Co")
+    db_session.add(company)
+    db_session.commit()
+    fake = _FakeRedis()
+    scheduled = []
+    monkeypatch.setattr(receipts, "get_redis", lambda: fake)
+    monkeypatch.setattr("app.api.webhooks.schedule_wise_sync", lambda *args: scheduled.append(args))
+    monkeypatch.setattr("app.connectors.wise.webhook_routing.get_redis", lambda: fake)
+    webhook_route_cache.set(("sub-1", "0"), WebhookRoute(company_id=company.id, environment="sandbox", secret="s3cret"))
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    body = json.dumps({"subscriptionId": "sub-1", "eventType": "balances#update"}).encode()
+    signature = hmac.new(b"s3cret", body, sha256).hexdigest()
+    assert client.post("/webhooks/wise", content=body, headers={"X-Signature": signature}).status_code == 200
+    assert client.post("/webhooks/wise", content=body, headers={"X-Signature": "bad"}).status_code == 401
+    assert scheduled == [(company.id, "sandbox", "balances#update")]
+    assert db_session.query(WiseWebhookReceipt).count() == 0
+
+    assert receipts.persist_receipts(db_session, receipts.drain_receipts(100, fake)) == 2
+    receipts.ack_receipts(fake)
+    assert receipts.drain_receipts(100, fake) == []
+    statuses = sorted(row.status for row in db_session.query(WiseWebhookReceipt).all())
+    assert statuses == ["received", "rejected"]
+    actions = sorted(row.action for row in db_session.query(AuditLog).all())
+    assert actions == ["wise.webhook.received", "wise.webhook.rejected"]
+
+
+def test_receipt_flush_keeps_batch_when_commit_fails(monkeypatch, db_session):
+    from app import worker
+    from app.models.models import WiseWebhookReceipt
+
+    company = Company(name="Flush Co")
+    db_session.add(company)
+    db_session.commit()
+    fake = _FakeRedis()
+    for index in range(3):
+        receipts.buffer_receipt(
+            {"company_id": company.id, "status": "received", "event_type": f"event-{index}", "received_at": None},
+            fake,
+        )
+    monkeypatch.setattr(worker, "get_redis", lambda: fake)
+    monkeypatch.setattr(worker, "SessionLocal", lambda: db_session)
+    monkeypatch.setattr(db_session, "close", lambda: None)
+    monkeypatch.setattr(config.settings, "wise_webhook_flush_batch_size", 2)
+    persist = receipts.persist_receipts
+
+    def failing_persist(db, batch):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(worker, "persist_receipts", failing_persist)
+    with pytest.raises(RuntimeError):
+        worker.flush_wise_webhook_receipts()
+    assert len(fake.data[receipts.PROCESSING_KEY]) == 2
+    assert receipts.FLUSH_LOCK_KEY not in fake.data
+
+    monkeypatch.setattr(worker, "persist_receipts", persist)
+    assert worker.flush_wise_webhook_receipts() == 3
+    assert sorted(row.event_type for row in db_session.query(WiseWebhookReceipt)) == ["event-0", "event-1", "event-2"]
+    assert not fake.data.get(receipts.PROCESSING_KEY)
+    assert not fake.data.get(receipts.RECEIPTS_KEY)
+
+
+def test_send_defers_retries_and_trips_circuit(monkeypatch, db_session):
+    fake = _FakeRedis()
+    monkeypatch.setattr("app.connectors.wise.circuit.get_redis", lambda: fake)
+    monkeypatch.setattr(config.settings, "wise_circuit_failure_threshold", 2)
+    monkeypatch.setattr(config.settings, "wise_rate_limit_per_second", 0)
+    calls = []
+
+    class Response:
+        status_code = 429
+        text = "slow down"
+        headers = {"Retry-After": "7"}
+
+    def fake_request(*args, **kwargs):
+        calls.append(args)
+        return Response()
+
+    monkeypatch.setattr("app.connectors.wise.client.requests.request", fake_request)
+    monkeypatch.setattr("time.sleep", lambda *_: pytest.fail("send must not sleep"))
+    client = WiseApiClient(db_session, 1, "sandbox")
+    with pytest.raises(WiseRetryableError) as first:
+        client.send("GET", "/v1/profiles", "token")
+    assert first.value.status_code == 429
+    assert first.value.retry_after == 7
+    with pytest.raises(WiseRetryableError):
+        client.send("GET", "/v1/profiles", "token")
+    assert len(calls) == 2
+
+    # Threshold reached: further calls fail fast without touching Wise.
+    with pytest.raises(WiseRetryableError) as blocked:
+        client.send("GET", "/v1/profiles", "token")
+    assert blocked.value.status_code is None
+    assert 0 < blocked.value.retry_after <= config.settings.wise_circuit_cooldown_seconds
+    assert len(calls) == 2
+
+    from app.connectors.wise.circuit import retry_countdown
+    monkeypatch.setattr(config.settings, "wise_retry_base_seconds", 5.0)
+    assert 7 <= retry_countdown(7, 0) < 12
+    assert 40 <= retry_countdown(None, 3) < 45
@@ -4,7 +4,7 @@ import { useState } from "react";
 import { Button } from "@/components/ui/button";
 import { Card } from "@/components/ui/card";
 import { getToken } from "@/lib/auth";
-import { resolveApiBase } from "@/lib/api";
+import { resolveApiBase, waitForConnectorJob } from "@/lib/api";
 import SetupTabs from "@/app/administrator/setup-tabs";
 import { useAuthedSWR } from "@/hooks/useApi";
 
@@ -14,6 +14,11 @@ type SyncResponse = {
   count: number;
 };
 
+type JobResponse = {
+  job_id: number;
+  status: string;
+};
+
 type StripeSettings = {
   stripe_account: string | null;
   has_publishable_key: boolean;
@@ -139,7 +144,9 @@ export default function StripeAdminPage() {
         const text = await res.text();
         throw new Error(text || `Sync failed${requestId ? ` (${requestId})` : ""}`);
       }
-      const payload = await res.json() as SyncResponse;
+      const job = await res.json() as JobResponse;
+      setStatus("Stripe revenue sync queued...");
+      const payload = await waitForConnectorJob<SyncResponse>(job.job_id, token || undefined);
       setStatus(`Stripe revenue synced (${payload.count} items).`);
     } catch (err) {
       const message = err instanceof Error ? err.message : "Stripe sync failed.";
@@ -202,7 +209,9 @@ export default function StripeAdminPage() {
         const text = await res.text();
         throw new Error(text || "Failed to fetch Stripe balance history.");
       }
-      const payload = await res.json() as BalancePayoutsResponse;
+      const job = await res.json() as JobResponse;
+      setBalanceStatus("Fetching Stripe balance history...");
+      const payload = await waitForConnectorJob<BalancePayoutsResponse>(job.job_id, token || undefined);
       setBalanceStatus(`Balance history: ${payload.balance_count} items. Payouts: ${payload.payout_count} items.`);
       setBalanceHistory(payload.balance_history || []);
       setPayouts(payload.payouts || []);
@@ -44,7 +44,7 @@ export default function SetupClient() {
   const { data: docs, mutate: mutateDocs } = useAuthedSWR<any[]>("/imports/docs", {
     refreshInterval: (data) => {
       if (!Array.isArray(data)) return 0;
-      return data.some((doc) => doc.status === "queued" || doc.status === "processing") ? 2000 : 0;
+      return data.some((doc) => ["queued", "processing", "parsing", "embedding"].includes(doc.status)) ? 2000 : 0;
     }
   });
   const isFounder = me?.role === "Founder";
@@ -61,7 +61,10 @@ export default function SetupClient() {
       return `${count} ${count === 1 ? "chunk" : "chunks"}`;
     }
     if (doc.status === "error") return "Indexing failed";
-    if (doc.status === "processing") return "Indexing...";
+    if (doc.status === "parsing") return "Parsing...";
+    if (doc.status === "embedding" || doc.status === "processing") {
+      return doc.indexed_chunks ? `Embedding... ${doc.indexed_chunks} chunks` : "Embedding...";
+    }
     return "Queued";
   };
 
@@ -113,3 +113,23 @@ export async function apiDeleteWithBase<T>(base: string, path: string, token?: s
   });
   return handleResponse<T>(res);
 }
+
+export type ConnectorJob<T> = {
+  job_id: number;
+  status: string;
+  counts: Record<string, unknown>;
+  error?: string | null;
+  result?: T | null;
+};
+
+export async function waitForConnectorJob<T>(jobId: number, token?: string, intervalMs = 1500): Promise<T> {
+  for (;;) {
+    const job = await apiGet<ConnectorJob<T>>(`/connectors/jobs/${jobId}`, token);
+    if (job.status === "success") {
+      if (job.result == null) throw new Error("Job finished but its result has expired.");
+      return job.result;
+    }
+    if (job.status === "failed") throw new Error(job.error || "Job failed.");
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
@@ -0,0 +1,89 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI
+
+app = FastAPI()
+
+LATENCY_SECONDS = float(os.getenv("MOCK_WISE_LATENCY_MS", "150")) / 1000
+ACCOUNT_COUNT = int(os.getenv("MOCK_WISE_ACCOUNTS", "20"))
+PAGE_SIZE = int(os.getenv("MOCK_WISE_PAGE_SIZE", "50"))
+PAGES_PER_ACCOUNT = int(os.getenv("MOCK_WISE_PAGES", "3"))
+CURRENCIES = ["USD", "EUR", "GBP", "CAD", "AUD", "JPY", "CHF", "SEK", "NZD", "SGD"]
+PROFILE_ID = "9001"
+
+
+def _account_id(index: int) -> str:
+    return f"{70000 + index}"
+
+
+def _currency(index: int) -> str:
+    return CURRENCIES[index % len(CURRENCIES)]
+
+
+async def _latency():
+    if LATENCY_SECONDS:
+        await asyncio.sleep(LATENCY_SECONDS)
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/v1/profiles")
+async def profiles():
+    await _latency()
+    return [{"id": PROFILE_ID, "type": "business"}]
+
+
+@app.get("/v4/profiles/{profile_id}/balance-accounts")
+async def balance_accounts(profile_id: str):
+    await _latency()
+    return [
+        {"id": _account_id(idx), "currency": _currency(idx), "name": f"{_currency(idx)} balance", "status": "ACTIVE"}
+        for idx in range(ACCOUNT_COUNT)
+    ]
+
+
+@app.get("/v4/balance-accounts/{balance_account_id}/balances")
+async def balances(balance_account_id: str):
+    await _latency()
+    index = int(balance_account_id) - 70000
+    return {
+        "balances": [
+            {
+                "currency": _currency(index),
+                "amount": round(1000 + index * 37.5, 2),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            }
+        ]
+    }
+
+
+@app.get("/v1/statement.json")
+async def statement(balanceAccountId: str, cursor: str | None = None):
+    await _latency()
+    page = int(cursor or 0)
+    index = int(balanceAccountId) - 70000
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    transactions = []
+    for offset in range(PAGE_SIZE):
+        seq = page * PAGE_SIZE + offset
+        transactions.append({
+            "id": f"{balanceAccountId}-{seq}",
+            "date": (start + timedelta(hours=seq)).isoformat(),
+            "amount": round((seq % 17 - 8) * 12.5, 2),
+            "currency": _currency(index),
+            "description": f"Mock transaction {seq}",
+            "type": "CREDIT" if seq % 17 >= 8 else "DEBIT",
+            "reference": f"REF-{seq}",
+        })
+    next_cursor = str(page + 1) if page + 1 < PAGES_PER_ACCOUNT else None
+    return {"transactions": transactions, "nextCursor": next_cursor}
+
+
+@app.post("/v2/subscriptions")
+async def subscriptions():
+    await _latency()
+    return {"id": "mock-subscription", "secret": "mock-secret"}
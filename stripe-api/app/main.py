@@ -1,10 +1,21 @@
 import asyncio
+import itertools
+import json
 import os
-from typing import List
+from typing import Iterable, List, Tuple
 
 from fastapi import FastAPI, HTTPException
-
-from app.schemas import BalancePayoutsResponse, RevenueItem, RevenueSyncResponse, StripeSyncRequest, TrueNetMarginResponse
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.schemas import (
+    BalancePayoutsResponse,
+    BalanceTransactionsResponse,
+    RevenueItem,
+    RevenueSyncResponse,
+    StripeSyncRequest,
+    TrueNetMarginResponse,
+)
 from app.stripe_cl import StripeClient
 
 app = FastAPI(title="Stripe API", version="0.1.0")
@@ -17,23 +28,50 @@ def _stripe_client(payload: StripeSyncRequest) -> StripeClient:
     return StripeClient(api_key, payload.stripe_account)
 
 
+def _ndjson(events: Iterable[Tuple[str, BaseModel]]) -> StreamingResponse:
+    # One JSON object per line: {"kind": ..., "item": ...} as pages arrive, then a summary line.
+    def body():
+        counts: dict[str, int] = {}
+        try:
+            for kind, item in events:
+                counts[kind] = counts.get(kind, 0) + 1
+                yield json.dumps({"kind": kind, "item": item.model_dump(mode="json")}) + "\n"
+        except Exception as exc:
+            yield json.dumps({"kind": "error", "detail": str(exc)}) + "\n"
+            return
+        yield json.dumps({"kind": "summary", "counts": counts, "count": sum(counts.values())}) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def _tagged(kind: str, items: Iterable[BaseModel]) -> Iterable[Tuple[str, BaseModel]]:
+    return ((kind, item) for item in items)
+
+
 @app.get("/health")
 def health() -> dict:
     return {"status": "ok"}
 
 
 @app.post("/sync/revenue", response_model=RevenueSyncResponse)
-def sync_revenue(payload: StripeSyncRequest | None = None) -> RevenueSyncResponse:
+def sync_revenue(payload: StripeSyncRequest | None = None, stream: bool = False) -> RevenueSyncResponse:
     payload = payload or StripeSyncRequest()
     client = _stripe_client(payload)
+    if stream:
+        return _ndjson(_tagged("revenue", client.iter_revenue(payload, days=30)))
     items: List[RevenueItem] = client.fetch_revenue(payload, days=30)
     return RevenueSyncResponse(items=items, count=len(items))
 
 
 @app.post("/sync/balance-payouts", response_model=BalancePayoutsResponse)
-async def sync_balance_payouts(payload: StripeSyncRequest | None = None) -> BalancePayoutsResponse:
+async def sync_balance_payouts(payload: StripeSyncRequest | None = None, stream: bool = False) -> BalancePayoutsResponse:
     payload = payload or StripeSyncRequest()
     client = _stripe_client(payload)
+    if stream:
+        return _ndjson(itertools.chain(
+            _tagged("balance", client.iter_balance_history(payload, 7)),
+            _tagged("payout", client.iter_payouts(payload, 7)),
+        ))
 
     balance_task = asyncio.to_thread(client.fetch_balance_history, payload, 7)
     payout_task = asyncio.to_thread(client.fetch_payouts, payload, 7)
@@ -48,9 +86,22 @@ async def sync_balance_payouts(payload: StripeSyncRequest | None = None) -> Bala
 
 
 @app.post("/metrics/true-net-margin", response_model=TrueNetMarginResponse)
-async def true_net_margin(payload: StripeSyncRequest | None = None) -> TrueNetMarginResponse:
+async def true_net_margin(payload: StripeSyncRequest | None = None, stream: bool = False) -> TrueNetMarginResponse:
     payload = payload or StripeSyncRequest()
     client = _stripe_client(payload)
+    if stream:
+        return _ndjson(_tagged("margin", client.iter_true_net_margin(payload, 7)))
 
     items = await asyncio.to_thread(client.fetch_true_net_margin, payload, 7)
     return TrueNetMarginResponse(items=items, count=len(items))
+
+
+@app.post("/sync/balance-transactions", response_model=BalanceTransactionsResponse)
+async def sync_balance_transactions(payload: StripeSyncRequest | None = None, stream: bool = False) -> BalanceTransactionsResponse:
+    payload = payload or StripeSyncRequest()
+    client = _stripe_client(payload)
+    if stream:
+        return _ndjson(_tagged("balance_transaction", client.iter_balance_transactions(payload, 90)))
+
+    items = await asyncio.to_thread(client.fetch_balance_transactions, payload, 90)
+    return BalanceTransactionsResponse(items=items, count=len(items))
@@ -11,6 +11,7 @@ class StripeSyncRequest(BaseModel):
     start_date: Optional[date] = None
     end_date: Optional[date] = None
     limit: Optional[int] = None
+    created_after: Optional[int] = Field(default=None, description="Unix timestamp; only objects created at or after it are listed.")
 
 
 class RevenueItem(BaseModel):
@@ -78,3 +79,18 @@ class TrueNetMarginItem(BaseModel):
 class TrueNetMarginResponse(BaseModel):
     items: List[TrueNetMarginItem]
     count: int
+
+
+class BalanceTransactionItem(TrueNetMarginItem):
+    status: str
+    reporting_category: Optional[str] = None
+    description: Optional[str] = None
+    payout_status: Optional[str] = Field(default=None, description="Status of the payout behind payout and payout_failure rows.")
+    payout_arrival_date: Optional[datetime] = None
+    payout_method: Optional[str] = None
+    payout_type: Optional[str] = None
+
+
+class BalanceTransactionsResponse(BaseModel):
+    items: List[BalanceTransactionItem]
+    count: int
@@ -1,11 +1,21 @@
 from __future__ import annotations
 
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime, timedelta, timezone
-from typing import Iterable, List, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
 
 import stripe
 
-from app.schemas import BalanceHistoryItem, PayoutItem, RevenueItem, StripeSyncRequest, TrueNetMarginItem
+from app.schemas import (
+    BalanceHistoryItem,
+    BalanceTransactionItem,
+    PayoutItem,
+    RevenueItem,
+    StripeSyncRequest,
+    TrueNetMarginItem,
+)
 
 ZERO_DECIMAL_CURRENCIES = {
     "bif",
@@ -27,6 +37,21 @@ ZERO_DECIMAL_CURRENCIES = {
 }
 
 
+PAYOUT_TYPES = {"payout", "payout_failure", "payout_cancel"}
+
+LOOKUP_CONCURRENCY = int(os.getenv("STRIPE_LOOKUP_CONCURRENCY", "8"))
+LIST_CONCURRENCY = int(os.getenv("STRIPE_LIST_CONCURRENCY", "8"))
+SLICE_SECONDS = int(float(os.getenv("STRIPE_LIST_SLICE_DAYS", "7")) * 86400)
+
+
+def _object_id(value: Any) -> str | None:
+    if not value:
+        return None
+    if isinstance(value, str):
+        return value
+    return getattr(value, "id", None)
+
+
 def _to_major(amount: int | None, currency: str) -> float:
     if amount is None:
         return 0.0
@@ -41,23 +66,132 @@ def _describe_fx(source_currency: str | None, currency: str, exchange_rate: floa
     return f"FX {source_currency.upper()}->{currency.upper()} @ {exchange_rate}"
 
 
+def _time_slices(since: int, until: int, slice_seconds: int) -> List[Tuple[int, int]]:
+    slices = []
+    start = since
+    while start <= until:
+        end = min(start + slice_seconds - 1, until)
+        slices.append((start, end))
+        start = end + 1
+    return slices
+
+
+def _revenue_from_balance_transaction(bt: Any) -> RevenueItem:
+    fx_note = _describe_fx(getattr(bt, "source_currency", None), bt.currency, getattr(bt, "exchange_rate", None))
+    description = bt.description or bt.type
+    if fx_note:
+        description = f"{description} ({fx_note})" if description else fx_note
+
+    return RevenueItem(
+        date=datetime.fromtimestamp(bt.created, tz=timezone.utc),
+        amount_gross=_to_major(bt.amount, bt.currency),
+        fee=_to_major(bt.fee, bt.currency),
+        amount_net=_to_major(bt.net, bt.currency),
+        currency=bt.currency.upper(),
+        status=bt.status or "unknown",
+        description=description,
+    )
+
+
+def _revenue_from_charge(charge: Any) -> RevenueItem:
+    bt = charge.balance_transaction
+    currency = charge.currency
+    fee = _to_major(getattr(bt, "fee", None), currency) if bt else 0.0
+    net = _to_major(getattr(bt, "net", None), currency) if bt else _to_major(charge.amount, currency)
+    fx_note = None
+    if bt:
+        fx_note = _describe_fx(getattr(bt, "source_currency", None), bt.currency, getattr(bt, "exchange_rate", None))
+
+    description = charge.description or f"Charge {charge.id}"
+    tax_amount = getattr(charge, "amount_tax", None)
+    if tax_amount:
+        description = f"{description} (tax {_to_major(tax_amount, currency):.2f} {currency.upper()})"
+    if fx_note:
+        description = f"{description} ({fx_note})"
+
+    return RevenueItem(
+        date=datetime.fromtimestamp(charge.created, tz=timezone.utc),
+        amount_gross=_to_major(charge.amount, currency),
+        fee=fee,
+        amount_net=net,
+        currency=currency.upper(),
+        status=charge.status or "unknown",
+        description=description,
+    )
+
+
+def _revenue_from_refund(refund: Any) -> RevenueItem:
+    bt = refund.balance_transaction
+    currency = refund.currency
+    if bt:
+        amount_gross = _to_major(bt.amount, bt.currency)
+        fee = _to_major(bt.fee, bt.currency)
+        net = _to_major(bt.net, bt.currency)
+        fx_note = _describe_fx(getattr(bt, "source_currency", None), bt.currency, getattr(bt, "exchange_rate", None))
+    else:
+        amount_gross = -abs(_to_major(refund.amount, currency))
+        fee = 0.0
+        net = amount_gross
+        fx_note = None
+
+    description = refund.reason or f"Refund {refund.id}"
+    if fx_note:
+        description = f"{description} ({fx_note})"
+
+    return RevenueItem(
+        date=datetime.fromtimestamp(refund.created, tz=timezone.utc),
+        amount_gross=amount_gross,
+        fee=fee,
+        amount_net=net,
+        currency=currency.upper(),
+        status=refund.status or "unknown",
+        description=description,
+    )
+
+
+REVENUE_BUILDERS: Dict[str, Callable[[Any], RevenueItem]] = {
+    "balance_transactions": _revenue_from_balance_transaction,
+    "charges": _revenue_from_charge,
+    "refunds": _revenue_from_refund,
+}
+
+
 class StripeClient:
     def __init__(self, api_key: str, stripe_account: str | None = None) -> None:
         stripe.api_key = api_key
         self._stripe_account = stripe_account
+        self._customers: Dict[str, Any] = {}
 
-    def _list_all(self, list_method, **params) -> Iterable:
+    def _list_pages(self, list_method, **params) -> Iterator[List[Any]]:
         starting_after = None
         while True:
             if self._stripe_account:
                 params["stripe_account"] = self._stripe_account
             page = list_method(starting_after=starting_after, **params)
-            for item in page.data:
-                yield item
+            yield list(page.data)
             if not page.has_more:
                 break
             starting_after = page.data[-1].id
 
+    def _list_all(self, list_method, **params) -> Iterable:
+        for page in self._list_pages(list_method, **params):
+            yield from page
+
+    def _retrieve_many(self, retrieve: Callable[[str], Any], ids: Iterable[str]) -> Dict[str, Any]:
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(LOOKUP_CONCURRENCY, len(ids))) as pool:
+            return dict(zip(ids, pool.map(retrieve, ids)))
+
+    def _customers_by_id(self, customer_ids: Iterable[str]) -> Dict[str, Any]:
+        missing = [customer_id for customer_id in customer_ids if customer_id not in self._customers]
+        self._customers.update(self._retrieve_many(
+            lambda customer_id: stripe.Customer.retrieve(customer_id, stripe_account=self._stripe_account),
+            missing,
+        ))
+        return self._customers
+
     def _since_timestamp(self, days: int) -> int:
         since = datetime.now(timezone.utc) - timedelta(days=days)
         return int(since.timestamp())
@@ -76,98 +210,54 @@ class StripeClient:
             start_dt, end_dt = end_dt, start_dt
         return int(start_dt.timestamp()), int(end_dt.timestamp())
 
-    def fetch_revenue(self, request: StripeSyncRequest, days: int = 30) -> List[RevenueItem]:
+    def _iter_sliced(
+        self, listings: Dict[str, Tuple[Callable, Dict[str, Any]]], since: int, until: int
+    ) -> Iterator[Tuple[str, int, List[Any]]]:
+        # Each listing is split into disjoint created-time slices that page in parallel.
+        # Yields (listing, slice index, objects) as slices complete; index 0 is the oldest.
+        slices = _time_slices(since, until, SLICE_SECONDS)
+        jobs = [(name, index, gte, lte) for name in listings for index, (gte, lte) in enumerate(slices)]
+
+        def run(job):
+            name, _, gte, lte = job
+            list_method, params = listings[name]
+            return list(self._list_all(list_method, created={"gte": gte, "lte": lte}, **params))
+
+        with ThreadPoolExecutor(max_workers=min(LIST_CONCURRENCY, len(jobs))) as pool:
+            futures = {pool.submit(run, job): job for job in jobs}
+            for future in as_completed(futures):
+                name, index, _, _ = futures[future]
+                yield name, index, future.result()
+
+    def _revenue_listings(self) -> Dict[str, Tuple[Callable, Dict[str, Any]]]:
+        return {
+            "balance_transactions": (stripe.BalanceTransaction.list, {"limit": 100}),
+            "charges": (stripe.Charge.list, {"expand": ["data.balance_transaction"], "limit": 100}),
+            "refunds": (stripe.Refund.list, {"expand": ["data.balance_transaction"], "limit": 100}),
+        }
+
+    def iter_revenue(self, request: StripeSyncRequest, days: int = 30) -> Iterator[RevenueItem]:
         since, until = self._date_range(request.start_date, request.end_date, days)
-        items: List[RevenueItem] = []
+        for name, _, objects in self._iter_sliced(self._revenue_listings(), since, until):
+            for obj in objects:
+                yield REVENUE_BUILDERS[name](obj)
 
-        for bt in self._list_all(stripe.BalanceTransaction.list, created={"gte": since, "lte": until}, limit=100):
-            fx_note = _describe_fx(getattr(bt, "source_currency", None), bt.currency, getattr(bt, "exchange_rate", None))
-            description = bt.description or bt.type
-            if fx_note:
-                description = f"{description} ({fx_note})" if description else fx_note
-
-            items.append(RevenueItem(
-                date=datetime.fromtimestamp(bt.created, tz=timezone.utc),
-                amount_gross=_to_major(bt.amount, bt.currency),
-                fee=_to_major(bt.fee, bt.currency),
-                amount_net=_to_major(bt.net, bt.currency),
-                currency=bt.currency.upper(),
-                status=bt.status or "unknown",
-                description=description,
-            ))
-
-        for charge in self._list_all(
-            stripe.Charge.list,
-            created={"gte": since, "lte": until},
-            expand=["data.balance_transaction"],
-            limit=100,
-        ):
-            bt = charge.balance_transaction
-            currency = charge.currency
-            fee = _to_major(getattr(bt, "fee", None), currency) if bt else 0.0
-            net = _to_major(getattr(bt, "net", None), currency) if bt else _to_major(charge.amount, currency)
-            fx_note = None
-            if bt:
-                fx_note = _describe_fx(getattr(bt, "source_currency", None), bt.currency, getattr(bt, "exchange_rate", None))
-
-            description = charge.description or f"Charge {charge.id}"
-            tax_amount = getattr(charge, "amount_tax", None)
-            if tax_amount:
-                description = f"{description} (tax {_to_major(tax_amount, currency):.2f} {currency.upper()})"
-            if fx_note:
-                description = f"{description} ({fx_note})"
-
-            items.append(RevenueItem(
-                date=datetime.fromtimestamp(charge.created, tz=timezone.utc),
-                amount_gross=_to_major(charge.amount, currency),
-                fee=fee,
-                amount_net=net,
-                currency=currency.upper(),
-                status=charge.status or "unknown",
-                description=description,
-            ))
-
-        for refund in self._list_all(
-            stripe.Refund.list,
-            created={"gte": since, "lte": until},
-            expand=["data.balance_transaction"],
-            limit=100,
-        ):
-            bt = refund.balance_transaction
-            currency = refund.currency
-            if bt:
-                amount_gross = _to_major(bt.amount, bt.currency)
-                fee = _to_major(bt.fee, bt.currency)
-                net = _to_major(bt.net, bt.currency)
-                fx_note = _describe_fx(getattr(bt, "source_currency", None), bt.currency, getattr(bt, "exchange_rate", None))
-            else:
-                amount_gross = -abs(_to_major(refund.amount, currency))
-                fee = 0.0
-                net = amount_gross
-                fx_note = None
-
-            description = refund.reason or f"Refund {refund.id}"
-            if fx_note:
-                description = f"{description} ({fx_note})"
-
-            items.append(RevenueItem(
-                date=datetime.fromtimestamp(refund.created, tz=timezone.utc),
-                amount_gross=amount_gross,
-                fee=fee,
-                amount_net=net,
-                currency=currency.upper(),
-                status=refund.status or "unknown",
-                description=description,
-            ))
-
-        return items
-
-    def fetch_balance_history(self, request: StripeSyncRequest, days: int = 7) -> List[BalanceHistoryItem]:
+    def fetch_revenue(self, request: StripeSyncRequest, days: int = 30) -> List[RevenueItem]:
+        since, until = self._date_range(request.start_date, request.end_date, days)
+        slices: Dict[str, List[Tuple[int, List[Any]]]] = {}
+        for name, index, objects in self._iter_sliced(self._revenue_listings(), since, until):
+            slices.setdefault(name, []).append((index, objects))
+        # Newest slice first keeps Stripe's descending order within each listing.
+        ordered = [
+            [REVENUE_BUILDERS[name](obj) for _, objects in sorted(parts, key=lambda part: -part[0]) for obj in objects]
+            for name, parts in slices.items()
+        ]
+        return list(heapq.merge(*ordered, key=lambda item: item.date, reverse=True))
+
+    def iter_balance_history(self, request: StripeSyncRequest, days: int = 7) -> Iterator[BalanceHistoryItem]:
         since, until = self._date_range(request.start_date, request.end_date, days)
-        items: List[BalanceHistoryItem] = []
-
         for bt in self._list_all(stripe.BalanceTransaction.list, created={"gte": since, "lte": until}, limit=100):
-            items.append(BalanceHistoryItem(
+            yield BalanceHistoryItem(
                 transaction_id=bt.id,
                 date=datetime.fromtimestamp(bt.created, tz=timezone.utc),
                 amount_gross=_to_major(bt.amount, bt.currency),
@@ -178,18 +268,17 @@ class StripeClient:
                 type=bt.type or "unknown",
                 source_id=str(getattr(bt, "source", None)) if getattr(bt, "source", None) else None,
                 description=bt.description,
-            ))
+            )
 
-        return items
+    def fetch_balance_history(self, request: StripeSyncRequest, days: int = 7) -> List[BalanceHistoryItem]:
+        return list(self.iter_balance_history(request, days))
 
-    def fetch_payouts(self, request: StripeSyncRequest, days: int = 7) -> List[PayoutItem]:
+    def iter_payouts(self, request: StripeSyncRequest, days: int = 7) -> Iterator[PayoutItem]:
         since, until = self._date_range(request.start_date, request.end_date, days)
-        items: List[PayoutItem] = []
-
         for payout in self._list_all(stripe.Payout.list, created={"gte": since, "lte": until}, limit=100):
             arrival = payout.arrival_date
             arrival_dt = datetime.fromtimestamp(arrival, tz=timezone.utc) if arrival else None
-            items.append(PayoutItem(
+            yield PayoutItem(
                 payout_id=payout.id,
                 amount=_to_major(payout.amount, payout.currency),
                 currency=payout.currency.upper(),
@@ -198,36 +287,94 @@ class StripeClient:
                 created_at=datetime.fromtimestamp(payout.created, tz=timezone.utc),
                 method=getattr(payout, "method", None),
                 payout_type=getattr(payout, "type", None),
-            ))
+            )
 
-        return items
+    def fetch_payouts(self, request: StripeSyncRequest, days: int = 7) -> List[PayoutItem]:
+        return list(self.iter_payouts(request, days))
 
-    def fetch_true_net_margin(self, request: StripeSyncRequest, days: int = 7) -> List[TrueNetMarginItem]:
-        since, until = self._date_range(request.start_date, request.end_date, days)
-        limit = request.limit or 100
-        items: List[TrueNetMarginItem] = []
+    def _balance_transaction_pages(self, since: int, until: int, limit: int) -> Iterator[List[Any]]:
+        params: Dict[str, Any] = {"created": {"gte": since, "lte": until}, "limit": limit}
+        if self._stripe_account:
+            params["stripe_account"] = self._stripe_account
+        expand = ["data.source", "data.source.customer"]
+        starting_after = None
+        while True:
+            try:
+                page = stripe.BalanceTransaction.list(starting_after=starting_after, expand=expand, **params)
+            except stripe.error.InvalidRequestError:
+                if len(expand) == 1:
+                    raise
+                # Some source types reject the nested customer expansion, on whichever page they turn
+                # up. Charges are still expanded and their customers are looked up in _margin_items.
+                expand = ["data.source"]
+                continue
+            yield list(page.data)
+            if not page.has_more:
+                break
+            starting_after = page.data[-1].id
 
-        for bt in self._list_all(stripe.BalanceTransaction.list, created={"gte": since, "lte": until}, limit=limit):
+    def _payouts_for(self, balance_transactions: List[Any]) -> Dict[str, Any]:
+        # Payout and payout_failure rows carry the payout as their source; its own status, arrival
+        # date and method are what the payouts report shows.
+        payouts: Dict[str, Any] = {}
+        unexpanded: List[str] = []
+        for bt in balance_transactions:
+            source = getattr(bt, "source", None)
+            if bt.type not in PAYOUT_TYPES or not source:
+                continue
+            if isinstance(source, str):
+                unexpanded.append(source)
+            else:
+                payouts[source.id] = source
+        payouts.update(self._retrieve_many(
+            lambda payout_id: stripe.Payout.retrieve(payout_id, stripe_account=self._stripe_account),
+            unexpanded,
+        ))
+        return payouts
+
+    def _margin_items(self, balance_transactions: List[Any]) -> List[Tuple[Any, TrueNetMarginItem]]:
+        charges: Dict[str, Any] = {}
+        unexpanded: List[str] = []
+        for bt in balance_transactions:
+            source = getattr(bt, "source", None)
+            if bt.type != "charge" or not source:
+                continue
+            if isinstance(source, str):
+                unexpanded.append(source)
+            else:
+                charges[source.id] = source
+        charges.update(self._retrieve_many(
+            lambda charge_id: stripe.Charge.retrieve(charge_id, expand=["customer"], stripe_account=self._stripe_account),
+            unexpanded,
+        ))
+        customers = self._customers_by_id(
+            charge.customer for charge in charges.values() if isinstance(getattr(charge, "customer", None), str)
+        )
+
+        items: List[Tuple[Any, TrueNetMarginItem]] = []
+        for bt in balance_transactions:
             gross = _to_major(bt.amount, bt.currency)
             fee = _to_major(bt.fee, bt.currency)
             net = _to_major(bt.net, bt.currency)
             margin_pct = round((net / gross) * 100, 2) if gross > 0 else 0.0
             available_on = datetime.fromtimestamp(bt.available_on, tz=timezone.utc) if getattr(bt, "available_on", None) else None
 
-            source_id = str(getattr(bt, "source", None)) if getattr(bt, "source", None) else None
+            source_id = _object_id(getattr(bt, "source", None))
             payment_intent_amount = None
             tax_amount = None
             customer_metadata = None
 
-            if source_id and bt.type == "charge":
-                charge = stripe.Charge.retrieve(source_id, stripe_account=self._stripe_account)
+            charge = charges.get(source_id) if source_id and bt.type == "charge" else None
+            if charge is not None:
                 payment_intent_amount = _to_major(getattr(charge, "amount", None), charge.currency)
                 tax_amount = _to_major(getattr(charge, "amount_tax", None), charge.currency) if getattr(charge, "amount_tax", None) else None
-                if getattr(charge, "customer", None):
-                    customer = stripe.Customer.retrieve(charge.customer, stripe_account=self._stripe_account)
+                customer = getattr(charge, "customer", None)
+                if isinstance(customer, str):
+                    customer = customers.get(customer)
+                if customer is not None:
                     customer_metadata = getattr(customer, "metadata", None)
 
-            items.append(TrueNetMarginItem(
+            items.append((bt, TrueNetMarginItem(
                 id=bt.id,
                 type=bt.type or "unknown",
                 date=datetime.fromtimestamp(bt.created, tz=timezone.utc),
@@ -241,6 +388,38 @@ class StripeClient:
                 tax_amount=tax_amount,
                 customer_metadata=customer_metadata,
                 source_id=source_id,
-            ))
-
+            )))
         return items
+
+    def iter_true_net_margin(self, request: StripeSyncRequest, days: int = 7) -> Iterator[TrueNetMarginItem]:
+        since, until = self._date_range(request.start_date, request.end_date, days)
+        for page in self._balance_transaction_pages(since, until, request.limit or 100):
+            for _, item in self._margin_items(page):
+                yield item
+
+    def fetch_true_net_margin(self, request: StripeSyncRequest, days: int = 7) -> List[TrueNetMarginItem]:
+        return list(self.iter_true_net_margin(request, days))
+
+    def iter_balance_transactions(self, request: StripeSyncRequest, days: int = 90) -> Iterator[BalanceTransactionItem]:
+        if request.created_after is not None:
+            since, until = request.created_after, int(datetime.now(timezone.utc).timestamp())
+        else:
+            since, until = self._date_range(request.start_date, request.end_date, days)
+        for page in self._balance_transaction_pages(since, until, request.limit or 100):
+            payouts = self._payouts_for(page)
+            for bt, item in self._margin_items(page):
+                payout = payouts.get(item.source_id) if item.source_id else None
+                arrival = getattr(payout, "arrival_date", None) if payout is not None else None
+                yield BalanceTransactionItem(
+                    **item.model_dump(),
+                    status=bt.status or "unknown",
+                    reporting_category=getattr(bt, "reporting_category", None),
+                    description=bt.description,
+                    payout_status=getattr(payout, "status", None) if payout is not None else None,
+                    payout_arrival_date=datetime.fromtimestamp(arrival, tz=timezone.utc) if arrival else None,
+                    payout_method=getattr(payout, "method", None) if payout is not None else None,
+                    payout_type=getattr(payout, "type", None) if payout is not None else None,
+                )
+
+    def fetch_balance_transactions(self, request: StripeSyncRequest, days: int = 90) -> List[BalanceTransactionItem]:
+        return list(self.iter_balance_transactions(request, days))